@@ -5,7 +5,7 @@ import { ServeStaticModule } from '@nestjs/serve-static';
 import * as path from 'path';
 import { AppController } from './app.controller';
 import { AppService } from './app.service';
-import { JobsGateway } from './gateways/jobs.gateway';
+import { GatewaysModule } from './gateways/gateways.module';
 import { HealthController } from '../health/health.controller';
 import { AuthModule } from '../auth/auth.module';
 import { SongsModule } from '../songs/songs.module';
@@ -21,7 +21,7 @@ import { ProfileModule } from '../profile/profile.module';
  * - ConfigModule (global) - Environment variable management
  * - MongooseModule - MongoDB connection
  * - AuthModule - User authentication
- * - JobsGateway - WebSocket for real-time updates
+ * - GatewaysModule - JobsGateway WebSocket for real-time updates
  *
  * **Environment Variables Required**:
  * - MONGODB_URI - MongoDB connection string
@@ -52,12 +52,13 @@ import { ProfileModule } from '../profile/profile.module';
       }),
       inject: [ConfigService],
     }),
+    GatewaysModule,
     AuthModule,
     SongsModule,
     LibraryModule,
     ProfileModule,
   ],
   controllers: [AppController, HealthController],
-  providers: [AppService, JobsGateway],
+  providers: [AppService],
 })
 export class AppModule {}
@@ -0,0 +1,14 @@
+import { Module } from '@nestjs/common';
+import { JobsGateway } from './jobs.gateway';
+
+/**
+ * Gateways Module
+ *
+ * Provides the single JobsGateway instance, so feature modules (e.g. the
+ * stem export in SongsModule) can push job updates to socket clients.
+ */
+@Module({
+  providers: [JobsGateway],
+  exports: [JobsGateway],
+})
+export class GatewaysModule {}
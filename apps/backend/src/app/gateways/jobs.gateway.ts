@@ -34,6 +34,19 @@ interface JobProgressPayload {
   };
 }
 
+/**
+ * Status record returned by the MusicGen worker's job queue
+ * (`GET /jobs/<id>` on generate_musicgen_audio.py --serve).
+ */
+export interface WorkerJobStatus {
+  id: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  position: number;
+  eta_seconds: number;
+  progress: number;
+  error?: string | null;
+}
+
 interface JobCompletedPayload {
   job: Record<string, unknown>;
 }
@@ -165,6 +178,29 @@ export class JobsGateway implements OnGatewayConnection, OnGatewayDisconnect {
     );
   }
 
+  /**
+   * Relay a MusicGen worker queue status as job:status + job:progress, so
+   * clients see queue position and ETA while the job waits for a slot.
+   */
+  emitWorkerJobStatus(jobId: string, worker: WorkerJobStatus): void {
+    this.emitJobStatus(jobId, worker.status);
+    const eta = Math.round(worker.eta_seconds);
+    const message =
+      worker.status === 'queued'
+        ? `Queued (position ${worker.position}, ~${eta}s remaining)`
+        : worker.status === 'running'
+          ? `Generating (~${eta}s remaining)`
+          : worker.status === 'failed'
+            ? `Failed: ${worker.error ?? 'unknown error'}`
+            : 'Completed';
+    this.emitJobProgress(jobId, {
+      current: Math.round(worker.progress * 100),
+      total: 100,
+      percentage: Math.round(worker.progress * 100),
+      message,
+    });
+  }
+
   emitJobCompleted(job: Record<string, unknown>): void {
     const jobId = job['id'] as string;
     const userId = job['userId'] as string;
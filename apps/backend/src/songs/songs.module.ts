@@ -1,5 +1,6 @@
 import { Module } from '@nestjs/common';
 import { ConfigModule } from '@nestjs/config';
+import { GatewaysModule } from '../app/gateways/gateways.module';
 import { OllamaService } from '../llm/ollama.service';
 import { SongsController } from './songs.controller';
 import { MmslParserService } from './mmsl-parser.service';
@@ -10,7 +11,7 @@ import { LyricAnalysisService } from './lyric-analysis.service';
 import { PaletteSuggestionService } from './palette-suggestion.service';
 
 @Module({
-  imports: [ConfigModule],
+  imports: [ConfigModule, GatewaysModule],
   controllers: [SongsController],
   providers: [
     OllamaService,
@@ -4,12 +4,19 @@ import * as fs from 'fs';
 import { Observable, from } from 'rxjs';
 import { map, catchError, switchMap, mergeMap, toArray } from 'rxjs/operators';
 import { InstrumentCatalogService } from './instrument-catalog.service';
+import { JobsGateway, WorkerJobStatus } from '../app/gateways/jobs.gateway';
 
 export interface StemExportOptions {
   format: 'wav' | 'mp3';
   instruments: string[];
   outputDir: string;
   sampleRate?: number;
+  /**
+   * Client job id: while the MusicGen worker queues and renders the stems,
+   * its status (queue position, ETA, progress) is pushed to socket room
+   * `job:<jobId>`
+   */
+  jobId?: string;
 }
 
 export interface StemExportResult {
@@ -23,9 +30,39 @@ export interface StemExportResult {
   errors: string[];
 }
 
+// MusicGen worker client limits (override with MUSICGEN_SERVER_TIMEOUT_MS /
+// MUSICGEN_SERVER_MAX_RETRIES); Retry-After fallback for a 503 without one.
+const DEFAULT_WORKER_TIMEOUT_MS = 10 * 60 * 1000;
+const DEFAULT_WORKER_MAX_RETRIES = 10;
+const DEFAULT_RETRY_AFTER_SECONDS = 5;
+// How often a waiting request's worker job status is polled and relayed
+// (override with MUSICGEN_STATUS_POLL_MS), and how long one poll may take.
+const DEFAULT_STATUS_POLL_MS = 1000;
+const STATUS_REQUEST_TIMEOUT_MS = 5000;
+
+interface WorkerReply {
+  status: number;
+  generated: Map<string, Buffer>;
+  retryAfterSeconds?: number;
+}
+
+/**
+ * The MusicGen worker could not be reached at all (connection refused,
+ * DNS failure, reset before a reply).
+ */
+class MusicGenWorkerUnavailableError extends Error {
+  constructor(message: string) {
+    super(message);
+    this.name = 'MusicGenWorkerUnavailableError';
+  }
+}
+
 @Injectable()
 export class StemExportService {
-  constructor(private readonly instrumentCatalog: InstrumentCatalogService) {}
+  constructor(
+    private readonly instrumentCatalog: InstrumentCatalogService,
+    private readonly jobsGateway: JobsGateway
+  ) {}
   /**
    * Export per-instrument stems in the specified format
    * This is a basic implementation that creates placeholder audio files
@@ -74,7 +111,12 @@ export class StemExportService {
 
     // Start with creating the output directory
     return mkdirObservable(options.outputDir).pipe(
-      switchMap(() => {
+      // Render every stem in one batched request to the MusicGen worker first;
+      // instruments it could not produce fall back to per-stem generation.
+      switchMap(() =>
+        from(this.requestMusicGenBatch(options.instruments, options.jobId))
+      ),
+      switchMap((pregenerated) => {
         // Process each instrument reactively
         const instrumentObservables = options.instruments.map((instrument) => {
           const fileName = `${instrument.replace(/[^a-zA-Z0-9]/g, '_')}.${
@@ -84,7 +126,10 @@ export class StemExportService {
 
           // Create observable that generates audio and writes file
           const audioObservable = from(
-            this.generatePlaceholderAudio(instrument)
+            this.generatePlaceholderAudio(
+              instrument,
+              pregenerated.get(instrument)
+            )
           );
 
           return audioObservable.pipe(
@@ -149,9 +194,15 @@ export class StemExportService {
    * Generate audio for an instrument using MusicGen
    * This replaces the placeholder audio generation with real MusicGen synthesis
    */
-  private async generatePlaceholderAudio(instrument: string): Promise<Buffer> {
+  private async generatePlaceholderAudio(
+    instrument: string,
+    pregenerated?: Buffer
+  ): Promise<Buffer> {
     // For now, try MusicGen, fall back to placeholder if it fails
     try {
+      if (pregenerated) {
+        return pregenerated;
+      }
       return await this.generateMusicGenAudio(instrument);
     } catch (error) {
       console.warn(
@@ -163,20 +214,81 @@ export class StemExportService {
   }
 
   /**
-   * Generate audio using MusicGen via Docker
+   * Generate audio using MusicGen.
+   * Prefers the long-lived MusicGen worker (`generate_musicgen_audio.py --serve`),
+   * which keeps the model loaded; falls back to a one-shot `docker exec` run
+   * only when the worker cannot be reached. A worker that is busy (503) or
+   * failed (500) is not bypassed: another MusicGen process would load its own
+   * model copy next to the worker's.
    */
-  private generateMusicGenAudio(instrument: string): Promise<Buffer> {
-    // Call the MusicGen Docker container to generate real audio
-    console.log(
-      `Generating audio for ${instrument} using MusicGen Docker container...`
-    );
+  private async generateMusicGenAudio(instrument: string): Promise<Buffer> {
+    const outputPath = this.workerOutputPath(instrument);
+    const debugLogPath = this.createDebugLogPath(instrument);
 
-    const { spawn } = require('child_process');
-    const outputPath = `/tmp/${instrument.replace(/[^a-zA-Z0-9]/g, '_')}.wav`;
+    let generated: Map<string, Buffer>;
+    try {
+      generated = await this.requestMusicGenServer([instrument], debugLogPath);
+    } catch (error) {
+      if (error instanceof MusicGenWorkerUnavailableError) {
+        return this.generateMusicGenAudioViaExec(
+          instrument,
+          outputPath,
+          debugLogPath
+        );
+      }
+      throw error;
+    }
+    const audio = generated.get(instrument);
+    if (!audio) {
+      throw new Error(`MusicGen worker did not generate ${instrument}`);
+    }
+    return audio;
+  }
+
+  /**
+   * Render all requested stems with a single batched worker request.
+   * Resolves with the audio of every stem the worker generated successfully;
+   * stems missing from the map are retried one by one. With a `jobId`, the
+   * worker's queue status is relayed to that job's socket room meanwhile.
+   */
+  private async requestMusicGenBatch(
+    instruments: string[],
+    jobId?: string
+  ): Promise<Map<string, Buffer>> {
+    if (instruments.length === 0) {
+      return new Map<string, Buffer>();
+    }
+    try {
+      return await this.requestMusicGenServer(
+        instruments,
+        this.createDebugLogPath('batch'),
+        jobId
+      );
+    } catch (error) {
+      console.warn(
+        `Batched MusicGen request failed (${
+          error instanceof Error ? error.message : error
+        }); generating stems individually`
+      );
+      return new Map<string, Buffer>();
+    }
+  }
+
+  /**
+   * Path of a generated stem inside the worker container
+   */
+  private workerOutputPath(instrument: string): string {
+    return `/tmp/${instrument.replace(/[^a-zA-Z0-9]/g, '_')}.wav`;
+  }
+
+  /**
+   * Create a per-request debug log path under logs/
+   */
+  private createDebugLogPath(label: string): string {
     const debugLogPath = path.join(
       process.cwd(),
       'logs',
-      `musicgen_${instrument}_${Date.now()}.log`
+      `musicgen_${label}_${Date.now()}.log`
     );
 
     // Ensure logs directory exists
@@ -184,6 +296,369 @@ export class StemExportService {
     if (!fs.existsSync(logsDir)) {
       fs.mkdirSync(logsDir, { recursive: true });
     }
+    return debugLogPath;
+  }
+
+  /**
+   * Ask the warm MusicGen worker to render stems (one batched request).
+   * The worker returns the encoded WAV bytes in its reply, so nothing has to
+   * be read back from the container. Resolves with instrument -> audio.
+   *
+   * A 503 means the worker's queue is full: the request is retried after the
+   * reply's `Retry-After`, up to MUSICGEN_SERVER_MAX_RETRIES times. A 500
+   * whose results still carry audio resolves with just those stems. Rejects
+   * with MusicGenWorkerUnavailableError when the worker cannot be reached
+   * (callers may fall back to `docker exec`), and with a plain Error when it
+   * stays busy, fails or does not answer within MUSICGEN_SERVER_TIMEOUT_MS.
+   *
+   * With a `jobId`, the request carries a worker job id whose status is
+   * polled and relayed to socket room `job:<jobId>` until the reply arrives.
+   */
+  private async requestMusicGenServer(
+    instruments: string[],
+    debugLogPath: string,
+    jobId?: string
+  ): Promise<Map<string, Buffer>> {
+    const maxRetries = Number(
+      process.env['MUSICGEN_SERVER_MAX_RETRIES'] ?? DEFAULT_WORKER_MAX_RETRIES
+    );
+    // Unique per request (the worker rejects an id it already knows) and
+    // limited to the characters the worker accepts in /jobs/<id>
+    const safeJobId = jobId?.replace(/[^A-Za-z0-9_.-]/g, '_').slice(0, 48);
+    const workerJobId = safeJobId
+      ? `${safeJobId}-${Date.now().toString(36)}`
+      : undefined;
+    const stopRelay = workerJobId
+      ? this.relayWorkerJobStatus(jobId as string, workerJobId)
+      : () => undefined;
+    try {
+      return await this.requestMusicGenWithRetries(
+        instruments,
+        debugLogPath,
+        maxRetries,
+        workerJobId
+      );
+    } finally {
+      stopRelay();
+    }
+  }
+
+  /**
+   * POST the batch, waiting out 503 replies (see requestMusicGenServer)
+   */
+  private async requestMusicGenWithRetries(
+    instruments: string[],
+    debugLogPath: string,
+    maxRetries: number,
+    workerJobId?: string
+  ): Promise<Map<string, Buffer>> {
+    for (let attempt = 0; ; attempt++) {
+      const reply = await this.postMusicGenServer(
+        instruments,
+        debugLogPath,
+        workerJobId
+      );
+      if (reply.status === 503 && attempt < maxRetries) {
+        const waitSeconds =
+          reply.retryAfterSeconds ?? DEFAULT_RETRY_AFTER_SECONDS;
+        fs.appendFileSync(
+          debugLogPath,
+          `[${new Date().toISOString()}] WORKER BUSY: retrying in ${waitSeconds}s (attempt ${
+            attempt + 1
+          }/${maxRetries})\n`
+        );
+        await new Promise((resolve) => setTimeout(resolve, waitSeconds * 1000));
+        continue;
+      }
+      if (reply.status === 500 && reply.generated.size > 0) {
+        // Some jobs of the batch failed; keep the stems that did render and
+        // leave the failed ones out of the map so only they are retried
+        return reply.generated;
+      }
+      if (reply.status !== 200) {
+        throw new Error(
+          reply.status === 503
+            ? `MusicGen worker queue still full after ${maxRetries} retries`
+            : `MusicGen worker returned HTTP ${reply.status}`
+        );
+      }
+      return reply.generated;
+    }
+  }
+
+  /**
+   * Poll the worker's `GET /jobs/<workerJobId>` while a request waits and
+   * push each status to socket room `job:<jobId>`. Returns a function that
+   * stops polling and relays the final status.
+   */
+  private relayWorkerJobStatus(
+    jobId: string,
+    workerJobId: string
+  ): () => void {
+    const intervalMs = Number(
+      process.env['MUSICGEN_STATUS_POLL_MS'] ?? DEFAULT_STATUS_POLL_MS
+    );
+    let stopped = false;
+    let polling = false;
+    const timer = setInterval(() => {
+      if (polling) {
+        return;
+      }
+      polling = true;
+      this.getWorkerJobStatus(workerJobId)
+        .then((status) => {
+          // A poll that outlives the request must not overwrite the final status
+          if (status && !stopped) {
+            this.jobsGateway.emitWorkerJobStatus(jobId, status);
+          }
+        })
+        .finally(() => {
+          polling = false;
+        });
+    }, intervalMs);
+
+    return () => {
+      stopped = true;
+      clearInterval(timer);
+      this.getWorkerJobStatus(workerJobId).then((status) => {
+        if (status) {
+          this.jobsGateway.emitWorkerJobStatus(jobId, status);
+        }
+      });
+    };
+  }
+
+  /**
+   * One GET /jobs/<id> to the MusicGen worker; resolves with null when the
+   * job is unknown (not queued yet, or rejected) or the worker does not answer.
+   */
+  private getWorkerJobStatus(
+    workerJobId: string
+  ): Promise<WorkerJobStatus | null> {
+    const http = require('http');
+    return new Promise<WorkerJobStatus | null>((resolve) => {
+      let url: URL;
+      try {
+        url = new URL(
+          `/jobs/${encodeURIComponent(workerJobId)}`,
+          this.workerUrl()
+        );
+      } catch {
+        resolve(null);
+        return;
+      }
+      const req = http.get(url, (res: any) => {
+        const chunks: Buffer[] = [];
+        res.on('data', (chunk: Buffer) => {
+          chunks.push(chunk);
+        });
+        res.on('end', () => {
+          if (res.statusCode !== 200) {
+            resolve(null);
+            return;
+          }
+          try {
+            resolve(JSON.parse(Buffer.concat(chunks).toString()));
+          } catch {
+            resolve(null);
+          }
+        });
+      });
+      req.setTimeout(STATUS_REQUEST_TIMEOUT_MS, () => {
+        req.destroy();
+      });
+      req.on('error', () => {
+        resolve(null);
+      });
+    });
+  }
+
+  /**
+   * Base URL of the MusicGen worker
+   */
+  private workerUrl(): string {
+    return process.env['MUSICGEN_SERVER_URL'] || 'http://localhost:8765';
+  }
+
+  /**
+   * One POST /generate to the MusicGen worker.
+   */
+  private postMusicGenServer(
+    instruments: string[],
+    debugLogPath: string,
+    workerJobId?: string
+  ): Promise<WorkerReply> {
+    const serverUrl = this.workerUrl();
+    const timeoutMs = Number(
+      process.env['MUSICGEN_SERVER_TIMEOUT_MS'] ?? DEFAULT_WORKER_TIMEOUT_MS
+    );
+    const http = require('http');
+    const body = JSON.stringify({
+      jobs: instruments.map((instrument) => ({
+        instrument,
+        output: this.workerOutputPath(instrument),
+        duration: 5,
+      })),
+      return_audio: true,
+      job_id: workerJobId,
+    });
+
+    fs.appendFileSync(
+      debugLogPath,
+      `[${new Date().toISOString()}] REQUESTING: POST ${serverUrl}/generate ${body}\n`
+    );
+
+    return new Promise<WorkerReply>((resolve, reject) => {
+      let timedOut = false;
+      const req = http.request(
+        new URL('/generate', serverUrl),
+        {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Content-Length': Buffer.byteLength(body),
+          },
+        },
+        (res: any) => {
+          const chunks: Buffer[] = [];
+          res.on('data', (chunk: Buffer) => {
+            chunks.push(chunk);
+          });
+          res.on('end', () => {
+            const generated = new Map<string, Buffer>();
+            try {
+              const parsed = JSON.parse(Buffer.concat(chunks).toString());
+              for (const result of parsed.results || []) {
+                if (result.success && result.audio_base64) {
+                  generated.set(
+                    result.instrument,
+                    Buffer.from(result.audio_base64, 'base64')
+                  );
+                }
+              }
+            } catch {
+              // Malformed reply: treat every stem as not generated
+            }
+            fs.appendFileSync(
+              debugLogPath,
+              `[${new Date().toISOString()}] SERVER RESPONSE: status=${
+                res.statusCode
+              }, generated=${[...generated.keys()].join(',')}\n`
+            );
+            const retryAfter = Number(res.headers['retry-after']);
+            resolve({
+              status: res.statusCode,
+              generated,
+              retryAfterSeconds:
+                Number.isFinite(retryAfter) && retryAfter >= 0
+                  ? retryAfter
+                  : undefined,
+            });
+          });
+        }
+      );
+
+      req.setTimeout(timeoutMs, () => {
+        timedOut = true;
+        req.destroy(
+          new Error(`MusicGen worker did not answer within ${timeoutMs}ms`)
+        );
+      });
+
+      req.on('error', (error: Error) => {
+        fs.appendFileSync(
+          debugLogPath,
+          `[${new Date().toISOString()}] SERVER ${
+            timedOut ? 'TIMEOUT' : 'UNAVAILABLE'
+          }: ${error.message}\n`
+        );
+        if (timedOut) {
+          // The worker accepted the request and may still be generating it;
+          // starting another MusicGen process beside it is what we avoid.
+          reject(error);
+          return;
+        }
+        console.warn(
+          `MusicGen worker unavailable at ${serverUrl} (${error.message}); falling back to docker exec`
+        );
+        reject(new MusicGenWorkerUnavailableError(error.message));
+      });
+
+      req.write(body);
+      req.end();
+    });
+  }
+
+  /**
+   * Read a file generated inside the worker container
+   */
+  private readWorkerFile(
+    instrument: string,
+    outputPath: string,
+    debugLogPath: string
+  ): Promise<Buffer> {
+    const { spawn } = require('child_process');
+
+    return new Promise<Buffer>((resolve) => {
+      const catCmd = spawn(
+        'docker',
+        ['exec', 'harmonia-worker', 'cat', outputPath],
+        { stdio: 'pipe' }
+      );
+
+      const chunks: Buffer[] = [];
+      catCmd.stdout.on('data', (data: Buffer) => {
+        chunks.push(data);
+      });
+
+      catCmd.on('close', (catCode: number | null) => {
+        const audioBuffer = Buffer.concat(chunks);
+        const catLogMessage = `[${new Date().toISOString()}] CAT EXIT: code=${catCode}, buffer_size=${
+          audioBuffer.length
+        }\n`;
+        fs.appendFileSync(debugLogPath, catLogMessage);
+
+        if (catCode === 0 && audioBuffer.length > 0) {
+          console.log(
+            `Successfully read ${audioBuffer.length} bytes of audio data for ${instrument}`
+          );
+          resolve(audioBuffer);
+        } else {
+          const errorMsg = `Failed to read generated audio file (cat exit code: ${catCode}, buffer size: ${audioBuffer.length})`;
+          console.warn(errorMsg);
+          fs.appendFileSync(
+            debugLogPath,
+            `[${new Date().toISOString()}] ERROR: ${errorMsg}\n`
+          );
+          resolve(this.generateBasicInstrumentAudio(instrument));
+        }
+      });
+
+      catCmd.stderr.on('data', (data: Buffer) => {
+        const errorData = data.toString();
+        console.error(`Cat stderr: ${errorData}`);
+        fs.appendFileSync(
+          debugLogPath,
+          `[${new Date().toISOString()}] CAT STDERR: ${errorData}`
+        );
+      });
+    });
+  }
+
+  /**
+   * Generate audio using a one-shot MusicGen process via Docker
+   */
+  private generateMusicGenAudioViaExec(
+    instrument: string,
+    outputPath: string,
+    debugLogPath: string
+  ): Promise<Buffer> {
+    // Call the MusicGen Docker container to generate real audio
+    console.log(
+      `Generating audio for ${instrument} using MusicGen Docker container...`
+    );
+
+    const { spawn } = require('child_process');
 
     return new Promise<Buffer>((resolve, _reject) => {
       // Run the Python script in the Docker container
@@ -238,49 +713,7 @@ export class StemExportService {
 
         if (code === 0) {
           console.log(`MusicGen generation successful for ${instrument}`);
-          // Read the generated file from the container
-          const { spawn: spawn2 } = require('child_process');
-          const catCmd = spawn2(
-            'docker',
-            ['exec', 'harmonia-worker', 'cat', outputPath],
-            { stdio: 'pipe' }
-          );
-
-          let audioBuffer = Buffer.alloc(0);
-          catCmd.stdout.on('data', (data: Buffer) => {
-            audioBuffer = Buffer.concat([audioBuffer, data]);
-          });
-
-          catCmd.on('close', (catCode: number | null) => {
-            const catLogMessage = `[${new Date().toISOString()}] CAT EXIT: code=${catCode}, buffer_size=${
-              audioBuffer.length
-            }\n`;
-            fs.appendFileSync(debugLogPath, catLogMessage);
-
-            if (catCode === 0 && audioBuffer.length > 0) {
-              console.log(
-                `Successfully read ${audioBuffer.length} bytes of audio data for ${instrument}`
-              );
-              resolve(audioBuffer);
-            } else {
-              const errorMsg = `Failed to read generated audio file (cat exit code: ${catCode}, buffer size: ${audioBuffer.length})`;
-              console.warn(errorMsg);
-              fs.appendFileSync(
-                debugLogPath,
-                `[${new Date().toISOString()}] ERROR: ${errorMsg}\n`
-              );
-              resolve(this.generateBasicInstrumentAudio(instrument));
-            }
-          });
-
-          catCmd.stderr.on('data', (data: Buffer) => {
-            const errorData = data.toString();
-            console.error(`Cat stderr: ${errorData}`);
-            fs.appendFileSync(
-              debugLogPath,
-              `[${new Date().toISOString()}] CAT STDERR: ${errorData}`
-            );
-          });
+          resolve(this.readWorkerFile(instrument, outputPath, debugLogPath));
         } else {
           const errorMsg = `MusicGen generation failed with code ${code}`;
           console.warn(
@@ -11,6 +11,18 @@ if [ ! -d "${HARMONIA_MODELS_ROOT:-/workspace/models}" ]; then
 else
   echo "Models root: ${HARMONIA_MODELS_ROOT}";
   ls -la "${HARMONIA_MODELS_ROOT}" || true
+
+  # Confirm model integrity from sampled fingerprints (a few reads per file).
+  # HARMONIA_VERIFY_MODELS=0 skips it; =strict refuses to start on a mismatch.
+  models_root="${HARMONIA_MODELS_ROOT:-/workspace/models}"
+  if [ "${HARMONIA_VERIFY_MODELS:-1}" != "0" ] && [ -f "${models_root}/.fingerprints.json" ]; then
+    if ! python3 /workspace/scripts/model_fingerprint.py verify "${models_root}"; then
+      echo "Warning: model files differ from ${models_root}/.fingerprints.json" >&2
+      if [ "${HARMONIA_VERIFY_MODELS:-1}" = "strict" ]; then
+        exit 1
+      fi
+    fi
+  fi
 fi
 
 if [ "${INSTALL_ML_DEPS:-0}" = "1" ]; then
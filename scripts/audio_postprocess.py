@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Post-processing for generated audio.
+
+Operates in place on float32 numpy arrays shaped (batch, channels, samples), so
+a whole multi-stem batch goes through every stage without allocating a
+full-size copy per stage. Stages run in this order, each configurable:
+
+    DC removal -> peak or LUFS loudness normalization -> fade in/out
+    -> (optional TPDF dither) -> output dtype
+
+The defaults reproduce the original behaviour of `generate_musicgen_audio.py`:
+peak-normalize to full scale and convert to int16.
+"""
+import numpy as np
+
+DEFAULT_POSTPROCESS = {
+    'dc_remove': False,
+    'normalize': 'peak',      # 'peak', 'lufs' or 'none'
+    'peak_db': 0.0,           # target peak in dBFS for 'peak'
+    'lufs': -14.0,            # target integrated loudness for 'lufs'
+    'fade_in_ms': 0.0,
+    'fade_out_ms': 0.0,
+    'dither': False,          # TPDF dither before integer conversion
+    'dtype': 'int16',         # 'int16' or 'float32'
+}
+
+# Samples processed per step when converting to integers, bounding temporaries
+# (dither noise, rounding) to this many samples per channel.
+BLOCK_SAMPLES = 65536
+
+_INT_SCALE = {'int16': (np.int16, 32767.0)}
+
+
+def as_batch(audio) -> np.ndarray:
+    """View `audio` as float32 (batch, channels, samples) without copying when possible."""
+    if hasattr(audio, 'detach'):
+        audio = audio.detach().cpu().numpy()
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim == 1:
+        return audio[None, None, :]
+    if audio.ndim == 2:
+        return audio[None, :, :]
+    if audio.ndim == 3:
+        return audio
+    raise ValueError(f"Expected 1-3 dimensional audio, got shape {audio.shape}")
+
+
+def remove_dc(batch: np.ndarray) -> np.ndarray:
+    batch -= batch.mean(axis=-1, keepdims=True, dtype=np.float64).astype(np.float32)
+    return batch
+
+
+def _peaks(batch: np.ndarray) -> np.ndarray:
+    # max/-min avoid the full-size temporary that np.abs() would allocate
+    return np.maximum(batch.max(axis=(1, 2)), -batch.min(axis=(1, 2)))
+
+
+def _apply_gains(batch: np.ndarray, gains: np.ndarray) -> np.ndarray:
+    batch *= gains.astype(np.float32)[:, None, None]
+    return batch
+
+
+def normalize_peak(batch: np.ndarray, peak_db: float = 0.0) -> np.ndarray:
+    peaks = _peaks(batch)
+    target = 10.0 ** (peak_db / 20.0)
+    gains = np.where(peaks > 0, target / np.where(peaks > 0, peaks, 1.0), 1.0)
+    return _apply_gains(batch, gains)
+
+
+def _k_weight(x: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Apply the ITU-R BS.1770 K-weighting pre-filter and RLB high-pass (returns a new array)."""
+    from scipy.signal import lfilter
+
+    # Shelving filter (BS.1770-4 coefficients generalized to any sample rate)
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / sample_rate)
+    vh = 10.0 ** (gain_db / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    b_shelf = [(vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    a_shelf = [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+    # High-pass filter
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / sample_rate)
+    a0 = 1.0 + k / q + k * k
+    b_hp = [1.0, -2.0, 1.0]
+    a_hp = [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+    return lfilter(b_hp, a_hp, lfilter(b_shelf, a_shelf, x, axis=-1), axis=-1)
+
+
+def integrated_loudness(item: np.ndarray, sample_rate: int) -> float:
+    """Gated integrated loudness (LUFS) of one (channels, samples) item per ITU-R BS.1770.
+
+    Falls back to unweighted gated loudness when scipy is unavailable.
+    """
+    try:
+        weighted = _k_weight(item, sample_rate)
+    except ImportError:
+        weighted = item
+    block = int(0.4 * sample_rate)
+    hop = int(0.1 * sample_rate)
+    if weighted.shape[-1] < block:
+        block = hop = weighted.shape[-1]
+    if block == 0:
+        return float('-inf')
+    squares = np.square(weighted, dtype=np.float64)
+    cumulative = np.concatenate([np.zeros((squares.shape[0], 1)), np.cumsum(squares, axis=-1)], axis=-1)
+    starts = np.arange(0, weighted.shape[-1] - block + 1, hop)
+    # Mean square per block and channel, summed over channels (all weights 1.0)
+    energy = ((cumulative[:, starts + block] - cumulative[:, starts]) / block).sum(axis=0)
+    with np.errstate(divide='ignore'):
+        loudness = -0.691 + 10.0 * np.log10(energy)
+    gated = energy[loudness > -70.0]
+    if gated.size == 0:
+        return float('-inf')
+    relative = -0.691 + 10.0 * np.log10(gated.mean()) - 10.0
+    gated = energy[(loudness > -70.0) & (loudness > relative)]
+    if gated.size == 0:
+        return float('-inf')
+    return float(-0.691 + 10.0 * np.log10(gated.mean()))
+
+
+def normalize_lufs(batch: np.ndarray, sample_rate: int, target_lufs: float = -14.0) -> np.ndarray:
+    """Scale each item to `target_lufs`, then limit so no sample exceeds full scale."""
+    gains = np.ones(batch.shape[0])
+    for i in range(batch.shape[0]):
+        current = integrated_loudness(batch[i], sample_rate)
+        if np.isfinite(current):
+            gains[i] = 10.0 ** ((target_lufs - current) / 20.0)
+    peaks = _peaks(batch) * gains
+    gains = np.where(peaks > 1.0, gains / np.where(peaks > 1.0, peaks, 1.0), gains)
+    return _apply_gains(batch, gains)
+
+
+def apply_fades(batch: np.ndarray, sample_rate: int, fade_in_ms: float = 0.0, fade_out_ms: float = 0.0) -> np.ndarray:
+    n = batch.shape[-1]
+    fade_in = min(n, int(sample_rate * fade_in_ms / 1000.0))
+    fade_out = min(n, int(sample_rate * fade_out_ms / 1000.0))
+    if fade_in > 0:
+        batch[..., :fade_in] *= np.linspace(0.0, 1.0, fade_in, endpoint=False, dtype=np.float32)
+    if fade_out > 0:
+        batch[..., n - fade_out:] *= np.linspace(1.0, 0.0, fade_out, dtype=np.float32)
+    return batch
+
+
+def to_output_dtype(batch: np.ndarray, dtype: str = 'int16', dither: bool = False, rng=None) -> np.ndarray:
+    """Convert to the output dtype block by block. Integer conversion reuses `batch` as scratch."""
+    if dtype == 'float32':
+        np.clip(batch, -1.0, 1.0, out=batch)
+        return batch
+    if dtype not in _INT_SCALE:
+        raise ValueError(f"Unsupported output dtype: {dtype}")
+    int_type, scale = _INT_SCALE[dtype]
+    rng = rng or np.random.default_rng()
+    out = np.empty(batch.shape, dtype=int_type)
+    lsb = 1.0 / scale
+    for start in range(0, batch.shape[-1], BLOCK_SAMPLES):
+        block = batch[..., start:start + BLOCK_SAMPLES]
+        if dither:
+            # Triangular (TPDF) dither of +-1 LSB
+            block += (rng.random(block.shape, dtype=np.float32) - rng.random(block.shape, dtype=np.float32)) * lsb
+        block *= scale
+        np.rint(block, out=block)
+        np.clip(block, -scale - 1.0, scale, out=block)
+        out[..., start:start + BLOCK_SAMPLES] = block
+    return out
+
+
+def postprocess(audio, sample_rate: int, config: dict = None) -> np.ndarray:
+    """Run the configured stages over `audio`; returns a (batch, channels, samples) array.
+
+    `audio` may be a torch tensor or numpy array shaped (samples,), (channels, samples) or
+    (batch, channels, samples). float32 input is modified in place.
+    """
+    cfg = {**DEFAULT_POSTPROCESS, **(config or {})}
+    batch = as_batch(audio)
+    if cfg['dc_remove']:
+        remove_dc(batch)
+    if cfg['normalize'] == 'peak':
+        normalize_peak(batch, cfg['peak_db'])
+    elif cfg['normalize'] == 'lufs':
+        normalize_lufs(batch, sample_rate, cfg['lufs'])
+    elif cfg['normalize'] != 'none':
+        raise ValueError(f"Unknown normalization: {cfg['normalize']}")
+    if cfg['fade_in_ms'] or cfg['fade_out_ms']:
+        apply_fades(batch, sample_rate, cfg['fade_in_ms'], cfg['fade_out_ms'])
+    return to_output_dtype(batch, cfg['dtype'], cfg['dither'])
@@ -4,9 +4,13 @@ File size audit script - identifies files exceeding size limits
 Run before committing to enforce 500-line maximum per file
 """
 import os
+import sys
 from pathlib import Path
 from typing import List, Tuple
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fs_index
+
 # Configuration
 DEFAULT_MAX_LINES = 500
 DEFAULT_WARN_LINES = 400
@@ -64,15 +68,16 @@ def audit_files() -> Tuple[List[Tuple[Path, int]], List[Tuple[Path, int]]]:
     """Audit all files and return violations and warnings"""
     violations = []  # > MAX_LINES
     warnings = []    # > WARN_LINES but <= MAX_LINES
+    index = fs_index.FsIndex()
     
     for dir_name in INCLUDE_DIRS:
         dir_path = ROOT / dir_name
         if not dir_path.exists():
             continue
         
-        for filepath in dir_path.rglob('*'):
-            if not filepath.is_file():
-                continue
+        index.update(dir_path)
+        for path, _ in index.files(dir_path):
+            filepath = Path(path)
             
             if not should_check(filepath):
                 continue
@@ -92,6 +97,7 @@ def audit_files() -> Tuple[List[Tuple[Path, int]], List[Tuple[Path, int]]]:
                         violations.append((filepath.relative_to(ROOT), line_count, max_lines))
                     elif line_count > warn_lines:
                         warnings.append((filepath.relative_to(ROOT), line_count, warn_lines))
+    index.close()
     
     return sorted(violations, key=lambda x: x[1], reverse=True), \
            sorted(warnings, key=lambda x: x[1], reverse=True)
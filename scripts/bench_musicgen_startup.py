@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for generate_musicgen_audio.py.
+
+Times paths that should never pay for torch/audiocraft: `--help`, an argument
+error and `--dry-run`. Each case runs in a fresh interpreter so import cost is
+measured every time. Usage:
+    python3 scripts/bench_musicgen_startup.py [--runs N] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate_musicgen_audio.py')
+
+CASES = {
+    'help': ['--help'],
+    'arg_error': [],
+    'dry_run': ['--instruments', 'piano,drums', '--dry-run', '--no-cache'],
+}
+
+
+def time_case(argv: list, runs: int) -> dict:
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as out_dir:
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, SCRIPT, *argv, *(['--output-dir', out_dir] if '--dry-run' in argv else [])],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+    return {
+        'exit_code': proc.returncode,
+        'min_s': round(min(timings), 4),
+        'median_s': round(statistics.median(timings), 4),
+        'max_s': round(max(timings), 4),
+    }
+
+
+def heavy_modules_imported() -> list:
+    """Return which heavy modules importing the script pulls in (should be empty)."""
+    code = (f"import sys; sys.path.insert(0, {os.path.dirname(SCRIPT)!r}); import generate_musicgen_audio; "
+            "print(','.join(m for m in ('torch', 'audiocraft') if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout.strip()
+    return [m for m in out.split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_musicgen_audio.py startup time")
+    parser.add_argument('--runs', type=int, default=5, help='Runs per case')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = {name: time_case(argv, args.runs) for name, argv in CASES.items()}
+    report = {'runs': args.runs, 'python': sys.version.split()[0], 'heavy_imports': heavy_modules_imported(),
+              'cases': results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, r in results.items():
+            print(f"{name:10s} exit={r['exit_code']} min={r['min_s']:.3f}s median={r['median_s']:.3f}s max={r['max_s']:.3f}s")
+        print(f"Heavy modules imported at startup: {', '.join(report['heavy_imports']) or 'none'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
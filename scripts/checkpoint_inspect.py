@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Lazy PyTorch checkpoint inspection for Harmonia.
+
+`torch.load` reads every tensor just to look at a checkpoint's top-level
+keys. A checkpoint's pickle stream only holds the object structure and
+references to tensor storages, and the storage bytes are kept apart:
+separate zip members in the zip format, and appended after the pickle in
+the legacy format. `load_skeleton` unpickles that structure with tensors
+replaced by `TensorStub`s, so no tensor data is read and torch is not
+needed.
+
+`rewrite` wraps a raw state dict under 'state_dict' and/or sets 'category'
+by splicing pickle opcodes around the original structure and streaming the
+storage bytes to the output unchanged, so at most one chunk of tensor data
+is in memory at a time.
+
+Usage:
+    python3 scripts/checkpoint_inspect.py keys <ckpt>
+    python3 scripts/checkpoint_inspect.py tensors <ckpt> [--json]
+    python3 scripts/checkpoint_inspect.py rewrite <in_ckpt> <out_ckpt> [--wrap] [--category acoustic]
+"""
+import argparse
+import io
+import json
+import os
+import pickle
+import pickletools
+import shutil
+import struct
+import sys
+import zipfile
+
+# torch.save's legacy (non-zip) format starts with these pickled values
+LEGACY_MAGIC = 0x1950a86a20f9469cfc6c
+
+# Storage classes pickled by torch.save, by the dtype they hold
+STORAGE_DTYPES = {
+    'DoubleStorage': 'float64', 'FloatStorage': 'float32', 'HalfStorage': 'float16',
+    'BFloat16Storage': 'bfloat16', 'LongStorage': 'int64', 'IntStorage': 'int32',
+    'ShortStorage': 'int16', 'CharStorage': 'int8', 'ByteStorage': 'uint8', 'BoolStorage': 'bool',
+    'ComplexFloatStorage': 'complex64', 'ComplexDoubleStorage': 'complex128',
+    'QInt8Storage': 'qint8', 'QUInt8Storage': 'quint8', 'QInt32Storage': 'qint32',
+}
+
+# Bytes per element of each storage dtype
+DTYPE_SIZES = {
+    'float64': 8, 'float32': 4, 'float16': 2, 'bfloat16': 2, 'int64': 8, 'int32': 4, 'int16': 2,
+    'int8': 1, 'uint8': 1, 'bool': 1, 'complex64': 8, 'complex128': 16, 'qint8': 1, 'quint8': 1, 'qint32': 4,
+}
+
+# torch.save aligns each storage record to this many bytes so checkpoints can be mmapped
+ZIP_ALIGNMENT = 64
+COPY_CHUNK = 8 * 1024 * 1024
+
+# Globals that are rebuilt for real; everything else becomes an `Opaque` stand-in
+SAFE_GLOBALS = {
+    ('collections', 'OrderedDict'), ('builtins', 'set'), ('builtins', 'frozenset'),
+    ('builtins', 'slice'), ('builtins', 'complex'), ('builtins', 'bytearray'),
+}
+
+
+class StorageRef:
+    """A tensor storage referenced by the pickle: its dtype, key and element count."""
+
+    def __init__(self, dtype: str, key: str, location: str = None, numel: int = None):
+        self.dtype = dtype
+        self.key = key
+        self.location = location
+        self.numel = numel
+
+
+class TensorStub:
+    """Stands in for a tensor: dtype and shape without the data."""
+
+    def __init__(self, storage: StorageRef, offset: int, shape: tuple, stride: tuple):
+        self.storage = storage
+        self.offset = offset
+        self.shape = tuple(shape)
+        self.stride = tuple(stride)
+
+    @property
+    def dtype(self) -> str:
+        return self.storage.dtype if isinstance(self.storage, StorageRef) else 'unknown'
+
+    def numel(self) -> int:
+        count = 1
+        for dim in self.shape:
+            count *= dim
+        return count
+
+    def __repr__(self):
+        return f'TensorStub({self.dtype}, {list(self.shape)})'
+
+
+class Opaque:
+    """Stands in for an object of a class that is not rebuilt (e.g. argparse.Namespace)."""
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+
+    def __setstate__(self, state):
+        self.state = state
+
+    def __repr__(self):
+        return f'<{type(self).__module__}.{type(self).__qualname__}>'
+
+
+def _storage_class(name: str):
+    return type(name, (), {'__module__': 'torch', 'dtype': STORAGE_DTYPES.get(name, 'unknown')})
+
+
+def _rebuild_tensor(storage, storage_offset, size, stride, *args, **kwargs):
+    return TensorStub(storage, storage_offset, size, stride)
+
+
+def _rebuild_parameter(data, *args, **kwargs):
+    return data
+
+
+class SkeletonUnpickler(pickle.Unpickler):
+    """Unpickles a checkpoint's structure, turning tensors into `TensorStub`s."""
+
+    def find_class(self, module, name):
+        if (module, name) in SAFE_GLOBALS:
+            return super().find_class(module, name)
+        if module == 'torch' and name.endswith('Storage'):
+            return _storage_class(name)
+        if module == 'torch._utils' and name in ('_rebuild_tensor', '_rebuild_tensor_v2'):
+            return _rebuild_tensor
+        if module == 'torch._utils' and name in ('_rebuild_parameter', '_rebuild_parameter_with_state'):
+            return _rebuild_parameter
+        return type(name, (Opaque,), {'__module__': module})
+
+    def persistent_load(self, pid):
+        if isinstance(pid, tuple) and pid and pid[0] == 'storage':
+            # Zip format: ('storage', storage_type, key, location, numel);
+            # legacy format: ('storage', storage_type, key, location, numel, view_metadata)
+            storage_type, key, location, numel = pid[1:5]
+            return StorageRef(getattr(storage_type, 'dtype', 'unknown'), str(key), location, numel)
+        return None
+
+
+def load_skeleton(path):
+    """Return the checkpoint object with every tensor replaced by a `TensorStub`.
+
+    Only the pickled structure is read: for zip checkpoints the data.pkl
+    member, for legacy ones the pickles before the storage payload.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            member = next(n for n in zf.namelist() if n == 'data.pkl' or n.endswith('/data.pkl'))
+            return SkeletonUnpickler(io.BytesIO(zf.read(member))).load()
+    with open(path, 'rb') as f:
+        if pickle.load(f) != LEGACY_MAGIC:
+            raise ValueError(f'{path} is not a PyTorch checkpoint')
+        pickle.load(f)  # protocol version
+        pickle.load(f)  # sys info
+        return SkeletonUnpickler(f).load()
+
+
+def top_level_keys(path) -> list:
+    """Top-level keys of a checkpoint dict ([] when it is not a dict)."""
+    skeleton = load_skeleton(path)
+    return list(skeleton) if isinstance(skeleton, dict) else []
+
+
+def iter_tensors(obj, prefix: str = ''):
+    """Yield (dotted key, TensorStub) for every tensor in a skeleton, depth first."""
+    if isinstance(obj, TensorStub):
+        yield prefix, obj
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from iter_tensors(value, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(obj, (list, tuple)):
+        for i, value in enumerate(obj):
+            yield from iter_tensors(value, f'{prefix}.{i}' if prefix else str(i))
+
+
+def tensor_table(path) -> list:
+    """[{key, dtype, shape, bytes}] for every tensor in a checkpoint, without loading any."""
+    return [{'key': key, 'dtype': stub.dtype, 'shape': list(stub.shape),
+             'bytes': stub.numel() * DTYPE_SIZES.get(stub.dtype, 0)}
+            for key, stub in iter_tensors(load_skeleton(path))]
+
+
+def _value_ops(value) -> bytes:
+    """Pickle opcodes that push `value` (plain data only), without PROTO or STOP."""
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, protocol=2)
+    pickler.fast = True  # no memo PUTs that could collide with the original's
+    pickler.dump(value)
+    return buf.getvalue()[2:-1]
+
+
+def _splice(data: bytes, wrap: bool, category: str = None, meta: dict = None) -> bytes:
+    """Return the object pickle `data` rewritten to wrap and/or tag its top-level dict.
+
+    The original opcodes are kept verbatim (so are its references to tensor
+    storages); new ones only push a dict and call SETITEM around them.
+    """
+    ops = list(pickletools.genops(data))
+    if ops[0][0].name != 'PROTO' or ops[-1][0].name != 'STOP':
+        raise ValueError('unexpected checkpoint pickle layout')
+    head, body = data[:ops[1][2]], data[ops[1][2]:ops[-1][2]]
+    setitem = pickle.SETITEM
+    items = b''
+    if category is not None:
+        items += _value_ops('category') + _value_ops(category) + setitem
+    if wrap:
+        items += _value_ops('state_dict') + body + setitem
+        body = pickle.EMPTY_DICT
+        if meta:
+            # Keep meta after state_dict, the order migrate_checkpoint.py has always written
+            items += _value_ops('meta') + _value_ops(meta) + setitem
+    return head + body + items + pickle.STOP
+
+
+def _copy_member(src: zipfile.ZipFile, info: zipfile.ZipInfo, out: zipfile.ZipFile, data: bytes = None):
+    """Copy one archive record, stored uncompressed and aligned like torch.save does."""
+    target = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    target.compress_type = zipfile.ZIP_STORED
+    target.file_size = len(data) if data is not None else info.file_size
+    zip64 = target.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    name_len = len(target.filename.encode('utf-8'))
+    # Local header: 30 fixed bytes, the name, the extra field (+20 for zip64 sizes)
+    data_start = out.start_dir + 30 + name_len + 4 + (20 if zip64 else 0)
+    pad = -data_start % ZIP_ALIGNMENT
+    target.extra = struct.pack('<HH', 0x4246, pad) + b'Z' * pad  # 'FB' padding field, as torch.save writes
+    with out.open(target, 'w', force_zip64=zip64) as dst:
+        if data is not None:
+            dst.write(data)
+        else:
+            with src.open(info) as stream:
+                shutil.copyfileobj(stream, dst, COPY_CHUNK)
+
+
+def rewrite(src_path, dst_path, wrap: bool = False, category: str = None, meta: dict = None):
+    """Write `src_path` to `dst_path` with its top-level dict wrapped under 'state_dict'
+    (`wrap`) and/or 'category' set, streaming tensor data through in chunks."""
+    tmp = f'{dst_path}.{os.getpid()}.tmp'
+    try:
+        if zipfile.is_zipfile(src_path):
+            with zipfile.ZipFile(src_path) as src, zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED) as out:
+                for info in src.infolist():
+                    if info.filename == 'data.pkl' or info.filename.endswith('/data.pkl'):
+                        _copy_member(src, info, out, _splice(src.read(info), wrap, category, meta))
+                    else:
+                        _copy_member(src, info, out)
+        else:
+            with open(src_path, 'rb') as src, open(tmp, 'wb') as out:
+                for _ in range(3):  # magic, protocol version, sys info
+                    pickle.load(src)
+                start = src.tell()
+                end = [pos for _, _, pos in pickletools.genops(src)][-1] + 1  # just past STOP
+                src.seek(0)
+                out.write(src.read(start))
+                out.write(_splice(src.read(end - start), wrap, category, meta))
+                # Storage keys and raw storage bytes follow unchanged
+                shutil.copyfileobj(src, out, COPY_CHUNK)
+        os.replace(tmp, dst_path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or rewrite PyTorch checkpoints without loading tensors')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_keys = sub.add_parser('keys', help='Top-level keys')
+    p_keys.add_argument('ckpt')
+    p_tensors = sub.add_parser('tensors', help='Every tensor with dtype, shape and size')
+    p_tensors.add_argument('ckpt')
+    p_tensors.add_argument('--json', action='store_true')
+    p_rewrite = sub.add_parser('rewrite', help='Wrap under state_dict and/or set category, streaming tensors')
+    p_rewrite.add_argument('ckpt')
+    p_rewrite.add_argument('out')
+    p_rewrite.add_argument('--wrap', action='store_true', help="Wrap the top-level dict under 'state_dict'")
+    p_rewrite.add_argument('--category', help="Set the checkpoint's 'category'")
+    args = parser.parse_args()
+
+    if args.cmd == 'keys':
+        print('\n'.join(map(str, top_level_keys(args.ckpt))))
+    elif args.cmd == 'tensors':
+        table = tensor_table(args.ckpt)
+        if args.json:
+            print(json.dumps(table, indent=2))
+        else:
+            for row in table:
+                print(f"{row['key']:<60} {row['dtype']:<9} {str(row['shape']):<20} {row['bytes']}")
+            print(f"{len(table)} tensors, {sum(row['bytes'] for row in table)} bytes")
+    else:
+        if not args.wrap and args.category is None:
+            parser.error('rewrite needs --wrap and/or --category')
+        if not isinstance(load_skeleton(args.ckpt), dict):
+            print('Checkpoint top level is not a dict; nothing to rewrite')
+            return 1
+        rewrite(args.ckpt, args.out, wrap=args.wrap, category=args.category)
+        print('Wrote', args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
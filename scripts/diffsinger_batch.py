@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Parallel DiffSinger batch rendering for Harmonia (runs inside the worker container).
+Usage: python3 scripts/diffsinger_batch.py <song.ds|meta.json> [...] --out-dir DIR [--workers N]
+
+Splits every project into its phrases and renders the phrases of all songs
+across a pool of worker processes, each holding one DiffSinger model
+(acoustic model + vocoder). Each song is assembled in phrase order, exactly as
+a single-pass render joins phrases, and written to <out-dir>/<title>.wav as
+soon as its last phrase is done (<title>-2.wav, ... for later songs sharing a
+title). Phrases already in the phrase cache
+(phrase_cache.py) are not rendered again. Lyric metadata renders its
+`ds_project` (default: the sample project), like run_diffsinger.py.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import diffsinger_infer_helper as helper
+from diffsinger_session import project_params
+from phrase_cache import default_cache, fetch_or_render, phrase_key
+
+# Per-worker DiffSinger state, set up once by `_init_worker`
+_INFER = None
+_HPARAMS = None
+_CACHE = None
+_MODEL_HASHES = None
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_song(path: str) -> dict:
+    """{title, params} for a .ds project or a lyric metadata JSON file."""
+    path = os.path.abspath(path)
+    if path.endswith('.ds'):
+        return {'title': os.path.splitext(os.path.basename(path))[0], 'params': helper.load_project(path)}
+    with open(path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('ds_project'):
+        meta['ds_project'] = os.path.join(os.path.dirname(path), meta['ds_project'])
+    title = meta.get('title') or os.path.splitext(os.path.basename(path))[0]
+    return {'title': title, 'params': project_params({'meta': meta})}
+
+
+def _init_worker(threads: int):
+    global _INFER, _HPARAMS, _CACHE, _MODEL_HASHES
+    import torch
+
+    # One model per process; several processes each using every core would thrash
+    torch.set_num_threads(threads)
+    _HPARAMS = helper.setup_runtime()
+    _INFER = helper.build_infer()
+    _CACHE = default_cache()
+    if _CACHE is not None:
+        _MODEL_HASHES = _CACHE.model_hashes(*helper.model_files(_HPARAMS))
+
+
+def _render(param: dict):
+    sample_rate = _HPARAMS['audio_sample_rate']
+    key = phrase_key(param, *_MODEL_HASHES) if _CACHE is not None else None
+    waveform, _ = fetch_or_render(_CACHE, key, param, lambda p: helper.render_phrase(_INFER, p, _HPARAMS),
+                                  sample_rate)
+    return waveform, sample_rate
+
+
+def output_names(songs: list) -> list:
+    """WAV file name per song: <title>.wav, with -2, -3, ... added for repeated titles."""
+    names, taken = [], set()
+    for song in songs:
+        name, n = song['title'], 1
+        while name.lower() in taken:
+            n += 1
+            name = f"{song['title']}-{n}"
+        taken.add(name.lower())
+        names.append(name + '.wav')
+    return names
+
+
+def render_songs(songs: list, out_dir: str, workers: int = None, threads_per_worker: int = 1) -> list:
+    """Render `songs` ({title, params}) with phrase-level parallelism.
+
+    Returns one entry per song, in input order: {'title', 'wav': path} or {'title', 'error': message}.
+    """
+    out_dir = os.path.abspath(out_dir)
+    workers = workers or max(1, available_cpus() // threads_per_worker)
+    names = output_names(songs)
+    pending = {i: len(song['params']) for i, song in enumerate(songs)}
+    waveforms = {i: [None] * len(song['params']) for i, song in enumerate(songs)}
+    results = [{'title': song['title']} for song in songs]
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        # Submitted song by song, so earlier songs complete first
+        futures = {pool.submit(_render, param): (i, j)
+                   for i, song in enumerate(songs) for j, param in enumerate(song['params'])}
+        for future in as_completed(futures):
+            i, j = futures[future]
+            title = songs[i]['title']
+            if 'error' in results[i]:
+                continue
+            try:
+                waveforms[i][j], sample_rate = future.result()
+            except BrokenProcessPool:
+                raise helper.HelperError('DiffSinger worker failed to start (see the worker output above)', 5)
+            except Exception as e:
+                results[i]['error'] = str(e)
+                print(f'{title}: phrase {j + 1} failed: {e}')
+                continue
+            pending[i] -= 1
+            if pending[i] == 0:
+                audio = helper.assemble_phrases(songs[i]['params'], waveforms[i], sample_rate)
+                wav = helper.write_wav(os.path.join(out_dir, names[i]), audio, sample_rate)
+                waveforms[i] = None
+                results[i]['wav'] = wav
+                print(f'{title}: {len(songs[i]["params"])} phrases -> {wav} ({time.time() - started:.1f}s)')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render many DiffSinger songs with per-phrase parallelism')
+    parser.add_argument('inputs', nargs='+', help='.ds projects or lyric metadata JSON files')
+    parser.add_argument('--out-dir', required=True, help='Directory for <title>.wav outputs')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes, each with its own model (default: cores / threads per worker)')
+    parser.add_argument('--threads-per-worker', type=int, default=1, help='torch threads per worker')
+    args = parser.parse_args()
+
+    try:
+        songs = [load_song(path) for path in args.inputs]
+        results = render_songs(songs, args.out_dir, args.workers, args.threads_per_worker)
+    except (helper.HelperError, OSError, ValueError) as e:
+        print(e)
+        return getattr(e, 'code', 2)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    return 0 if all('wav' in r for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,17 +20,38 @@ def find_first_ckpt(search_paths: List[str]) -> Optional[str]:
     return None
 
 
+def link_file(src: str, dst: str) -> str:
+    """Make dst refer to src without copying: a hardlink, or a symlink across filesystems.
+
+    An existing dst that is already the same file is left alone; any other dst is replaced.
+    Only falls back to a copy where neither link type is supported.
+    """
+    src = os.path.abspath(src)
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return dst
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    try:
+        os.link(src, tmp)
+    except OSError:
+        try:
+            os.symlink(src, tmp)
+        except OSError:
+            shutil.copy(src, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+
 def copy_ckpt_to_dir(src_ckpt: str, dest_dir: str) -> str:
-    """Copy a checkpoint file to dest_dir and return the dest path."""
+    """Place a checkpoint file in dest_dir (linked, see `link_file`) and return the dest path."""
     os.makedirs(dest_dir, exist_ok=True)
     dst = os.path.join(dest_dir, os.path.basename(src_ckpt))
     if os.path.abspath(src_ckpt) != os.path.abspath(dst):
-        shutil.copy(src_ckpt, dst)
+        link_file(src_ckpt, dst)
     return dst
 
 
 def copy_companion_configs(src_dir: str, dest_dir: str) -> List[str]:
-    """Copy known companion config files from src_dir into dest_dir. Returns list of copied files."""
+    """Link known companion config files from src_dir into dest_dir. Returns list of placed files."""
     shipped = []
     if not os.path.isdir(src_dir):
         return shipped
@@ -40,11 +61,41 @@ def copy_companion_configs(src_dir: str, dest_dir: str) -> List[str]:
         if os.path.exists(src):
             dst = os.path.join(dest_dir, os.path.basename(src))
             if not os.path.exists(dst):
-                shutil.copy(src, dst)
+                link_file(src, dst)
             shipped.append(dst)
     return shipped
 
 
+def find_configs(root: str) -> List[str]:
+    """Return every known companion config file under root, in one directory walk."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        found.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name in KNOWN_CONFIG_NAMES)
+    return found
+
+
+def file_record(src: str, dest: Optional[str] = None) -> dict:
+    """Absolute path, size and mtime of src (plus where it is linked to), for a resolution manifest."""
+    st = os.stat(src)
+    return {'src': os.path.abspath(src), 'dest': dest or os.path.abspath(src),
+            'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def record_is_current(record: dict) -> bool:
+    """True when the recorded source file is unchanged; restores a missing dest link."""
+    try:
+        st = os.stat(record['src'])
+    except OSError:
+        return False
+    if (st.st_size, st.st_mtime_ns) != (record['size'], record['mtime_ns']):
+        return False
+    if not os.path.exists(record['dest']):
+        os.makedirs(os.path.dirname(record['dest']), exist_ok=True)
+        link_file(record['src'], record['dest'])
+    return True
+
+
 def convert_yaml_to_json_if_present(dest_dir: str) -> Optional[str]:
     """If a YAML config exists in dest_dir and no config.json exists, attempt to convert it to JSON and
     write config.json. Returns path to created json or None."""
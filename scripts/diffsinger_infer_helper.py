@@ -1,4 +1,16 @@
 #!/usr/bin/env python3
+"""
+Programmatic DiffSinger inference for Harmonia (runs inside the worker container).
+Usage: python3 scripts/diffsinger_infer_helper.py <out_dir> <title> [project.ds]
+
+Renders a .ds project (default: the sample project shipped with the cloned
+repo) to <out_dir>/<title>.wav, phrase by phrase through the phrase cache
+(phrase_cache.py) so only phrases that changed since an earlier render are
+synthesized. The setup steps (hparams, vocoder checkpoint
+resolution, compatibility patches) and the model construction are separate
+functions so `diffsinger_session.py` can run them once and keep the models
+loaded across renders.
+"""
 import os
 import sys
 import json
@@ -9,284 +21,398 @@ from typing import TYPE_CHECKING, Any, Callable, cast
 # reuse helper utilities
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 try:
-    from scripts.diffsinger_helper import find_first_ckpt, copy_ckpt_to_dir, copy_companion_configs, convert_yaml_to_json_if_present
-except Exception:
-    # If imports fail (running outside expected environment), fall back to local logic already present below
-    find_first_ckpt = None
-    copy_ckpt_to_dir = None
-    copy_companion_configs = None
-    convert_yaml_to_json_if_present = None
-
-# args: out_dir, title
-if len(sys.argv) < 3:
-    print('Usage: diffsinger_infer_helper.py <out_dir> <title>')
-    sys.exit(2)
+    from scripts.diffsinger_helper import (KNOWN_CONFIG_NAMES, convert_yaml_to_json_if_present, copy_ckpt_to_dir,
+                                           copy_companion_configs, file_record, find_configs, find_first_ckpt,
+                                           link_file, record_is_current)
+except ImportError:
+    # Run as a plain script: this directory is on sys.path
+    from diffsinger_helper import (KNOWN_CONFIG_NAMES, convert_yaml_to_json_if_present, copy_ckpt_to_dir,  # type: ignore
+                                   copy_companion_configs, file_record, find_configs, find_first_ckpt, link_file,
+                                   record_is_current)
 
-out_dir = sys.argv[1]
-title = sys.argv[2]
+DIFFSINGER_ROOT = '/opt/DiffSinger'
+EXP_NAME = '0102_xiaoma_pe'
+CONFIG_PATH = os.path.join(DIFFSINGER_ROOT, 'checkpoints', EXP_NAME, 'config.yaml')
+SAMPLE_PROJECT = os.path.join(DIFFSINGER_ROOT, 'samples', '03_撒娇八连.ds')
 
-# ensure repo import path
-sys.path.insert(0, '/opt/DiffSinger')
-
-# run from repo root so includes resolve
-os.chdir('/opt/DiffSinger')
+VOCODER_DIR = os.path.join(DIFFSINGER_ROOT, 'checkpoints', 'hifigan')
+WORKSPACE_VOCODER_DIR = '/workspace/models/hifigan'
+VOCODER_SEARCH_ROOTS = (WORKSPACE_VOCODER_DIR, '/workspace/models')
+VOCODER_URL = 'https://github.com/MoonInTheRiver/DiffSinger/releases/download/pretrain-model/0109_hifigan_bigpopcs_hop128.zip'
+# Written by the first run that resolves the vocoder; later runs only validate it
+RESOLVED_MANIFEST = os.environ.get('DIFFSINGER_RESOLVED_MANIFEST',
+                                   os.path.join(WORKSPACE_VOCODER_DIR, '.harmonia_resolved.json'))
 
 if TYPE_CHECKING:
     # For type checkers (Pylance) import the names so diagnostics are satisfied.
     # These modules are available at runtime when running inside the worker container.
     from utils.hparams import set_hparams, hparams  # type: ignore
-try:
-    # Runtime import; may fail on host (outside container) which is handled below.
-    from utils.hparams import set_hparams, hparams  # type: ignore
-except Exception as e:
-    print('Failed import/set_hparams:', e)
-    sys.exit(3)
 
-# load checkpoint config
-cfg_path = '/opt/DiffSinger/checkpoints/0102_xiaoma_pe/config.yaml'
-try:
-    set_hparams(config=cfg_path, exp_name='0102_xiaoma_pe', hparams_str='')
-except Exception as e:
-    print('set_hparams failed:', e)
-    # continue; hparams may be partially set
-
-# map legacy vocoder name
-if 'vocoder' in hparams and hparams['vocoder'] == 'pwg':
-    hparams['vocoder'] = 'NsfHifiGAN'
-
-# resolve vocoder ckpt path
-vck = hparams.get('vocoder_ckpt', None)
-if vck:
-    candidate = os.path.join('/opt/DiffSinger/checkpoints', vck) if not os.path.isabs(vck) else vck
-    print('Resolving vocoder candidate path:', candidate)
+
+class HelperError(Exception):
+    """A setup or inference step failed; `code` is the helper's exit code for it."""
+
+    def __init__(self, message: str, code: int):
+        super().__init__(message)
+        self.code = code
+
+    def __reduce__(self):
+        # Keep `code` when raised in a worker process and pickled back
+        return type(self), (str(self), self.code)
+
+
+def load_hparams():
+    """Import DiffSinger's hparams from the cloned repo and load the acoustic checkpoint config."""
+    # ensure repo import path
+    sys.path.insert(0, DIFFSINGER_ROOT)
     try:
-        exists = os.path.exists(candidate)
+        # run from repo root so includes resolve
+        os.chdir(DIFFSINGER_ROOT)
+        # Runtime import; may fail on host (outside container) which is handled by the caller.
+        from utils.hparams import set_hparams, hparams  # type: ignore
     except Exception as e:
-        exists = False
-        print('os.path.exists threw:', e)
-    print('Candidate exists:', exists)
-    if exists:
-        try:
-            st = os.stat(candidate)
-            print('Candidate size:', st.st_size)
-        except Exception as e:
-            print('Failed to stat candidate:', e)
-        # ensure absolute path is used by hparams (avoid relative ambiguity)
-        if not os.path.isabs(vck):
-            hparams['vocoder_ckpt'] = candidate
-            print('Overwrote hparams["vocoder_ckpt"] with absolute path:', hparams['vocoder_ckpt'])
-            # verify companion config exists in the checkpoints/hifigan dir; if missing, try workspace fallbacks/download
-            dest_dir = os.path.join('/opt/DiffSinger/checkpoints', 'hifigan')
-            cfg_found = False
-            for cfg_name in ('config.json', 'config.yaml', 'config.yml', 'model_config.json', 'generator_config.json'):
-                if os.path.exists(os.path.join(dest_dir, cfg_name)):
-                    cfg_found = True
-                    break
-            if not cfg_found:
-                print('Vocoder companion config not found in', dest_dir, '; attempting to find/download configs into /workspace/models/hifigan')
-                try:
-                    # First, check if the workspace already contains companion configs (e.g. checked-in or staged by user)
-                    for cfg_glob in ('config.json', 'config.yaml', 'config.yml', 'model_config.json', 'generator_config.json'):
-                        for src_cfg in sorted(pathlib.Path('/workspace/models/hifigan').rglob(cfg_glob)):
-                            try:
-                                dst_cfg = os.path.join(dest_dir, os.path.basename(str(src_cfg)))
-                                import shutil
-                                if not os.path.exists(dst_cfg):
-                                    shutil.copy(str(src_cfg), dst_cfg)
-                                    print('Copied workspace vocoder config', src_cfg, '->', dst_cfg)
-                                    cfg_found = True
-                            except Exception:
-                                pass
-                    if not cfg_found:
-                        # Fallback: try to download a packaged vocoder into the workspace and extract
-                        os.makedirs('/workspace/models/hifigan', exist_ok=True)
-                        VOC_URL = 'https://github.com/MoonInTheRiver/DiffSinger/releases/download/pretrain-model/0109_hifigan_bigpopcs_hop128.zip'
-                        zip_path = '/workspace/models/hifigan/0109_hifigan_bigpopcs_hop128.zip'
-                        cmd = f"curl -L -o {zip_path} {VOC_URL} && unzip -o {zip_path} -d /workspace/models/hifigan"
-                        print('Downloading vocoder into workspace models via shell:', cmd)
-                        subprocess.run(cmd, shell=True, check=True)
-                        # copy any config files from extracted area into dest_dir
-                        for cfg_glob in ('config.json', 'config.yaml', 'config.yml', 'model_config.json', 'generator_config.json'):
-                            for src_cfg in sorted(pathlib.Path('/workspace/models/hifigan').rglob(cfg_glob)):
-                                try:
-                                    dst_cfg = os.path.join(dest_dir, os.path.basename(str(src_cfg)))
-                                    import shutil
-                                    if not os.path.exists(dst_cfg):
-                                        shutil.copy(str(src_cfg), dst_cfg)
-                                        print('Copied extracted vocoder config', src_cfg, '->', dst_cfg)
-                                        cfg_found = True
-                                except Exception:
-                                    pass
-                    if cfg_found:
-                        print('Successfully obtained vocoder companion config')
-                except Exception as e:
-                    print('Failed to download/extract vocoder configs:', e)
-                # If only YAML config exists, create a JSON copy for loaders expecting config.json
-                try:
-                    dest_cfg_yaml = os.path.join(dest_dir, 'config.yaml')
-                    dest_cfg_json = os.path.join(dest_dir, 'config.json')
-                    if (not os.path.exists(dest_cfg_json)) and os.path.exists(dest_cfg_yaml):
-                        try:
-                            import yaml
-                            with open(dest_cfg_yaml, 'r', encoding='utf-8') as yf:
-                                ydata = yaml.safe_load(yf)
-                            with open(dest_cfg_json, 'w', encoding='utf-8') as jf:
-                                json.dump(ydata, jf)
-                            print('Converted', dest_cfg_yaml, '->', dest_cfg_json)
-                            cfg_found = True
-                        except Exception as e:
-                            print('Failed to convert YAML->JSON for vocoder config:', e)
-                except Exception:
-                    pass
-    if not os.path.exists(candidate):
-        print('Vocoder ckpt not found at', candidate, '— searching fallbacks...')
-        found = None
-        # prefer helper if available
-        if find_first_ckpt is not None:
-            found = find_first_ckpt(['/workspace/models/hifigan', '/workspace/models'])
-        else:
-            for root in ('/workspace/models/hifigan', '/workspace/models'):
-                if os.path.isdir(root):
-                    for p in sorted(pathlib.Path(root).rglob('*.ckpt')):
-                        found = str(p)
-                        break
-                if found:
-                    break
-        if found:
-            print('Using fallback vocoder checkpoint at', found)
-            # Copy fallback into the cloned repo checkpoints location expected by hparams
-            try:
-                dest_dir = '/opt/DiffSinger/checkpoints/hifigan'
-                os.makedirs(dest_dir, exist_ok=True)
-                if copy_ckpt_to_dir is not None:
-                    dest_path = copy_ckpt_to_dir(found, dest_dir)
-                else:
-                    dest_path = os.path.join(dest_dir, os.path.basename(found))
-                    if not os.path.exists(dest_path):
-                        import shutil
-                        shutil.copy(found, dest_path)
-                        print('Copied fallback vocoder ckpt to', dest_path)
-                # copy companion configs
-                try:
-                    if copy_companion_configs is not None:
-                        copied = copy_companion_configs(os.path.dirname(found), dest_dir)
-                        if copied:
-                            print('Copied companion configs:', copied)
-                    else:
-                        try:
-                            src_dir = os.path.dirname(found)
-                            for cfg_glob in ('config.json', 'config.yaml', 'config.yml', 'model_config.json'):
-                                src_cfg = os.path.join(src_dir, cfg_glob)
-                                if os.path.exists(src_cfg):
-                                    dst_cfg = os.path.join(dest_dir, os.path.basename(src_cfg))
-                                    if not os.path.exists(dst_cfg):
-                                        import shutil
-                                        shutil.copy(src_cfg, dst_cfg)
-                                        print('Copied vocoder config', src_cfg, '->', dst_cfg)
-                        except Exception:
-                            pass
-                except Exception as _:
-                    pass
-                # Point hparams to the absolute path inside the repo checkpoints
-                hparams['vocoder_ckpt'] = dest_path
-                print('Set hparams["vocoder_ckpt"] to absolute path:', hparams['vocoder_ckpt'])
-            except Exception as e:
-                print('Failed to copy fallback vocoder ckpt into repo checkpoints:', e)
-        else:
-            print('No fallback vocoder checkpoint found in /workspace/models; attempting runtime download into /workspace/models/hifigan...')
+        raise HelperError(f'Failed import/set_hparams: {e}', 3)
+
+    try:
+        set_hparams(config=CONFIG_PATH, exp_name=EXP_NAME, hparams_str='')
+    except Exception as e:
+        print('set_hparams failed:', e)
+        # continue; hparams may be partially set
+
+    # map legacy vocoder name
+    if 'vocoder' in hparams and hparams['vocoder'] == 'pwg':
+        hparams['vocoder'] = 'NsfHifiGAN'
+    return hparams
+
+
+def load_resolved(vck: str, manifest_path: str = RESOLVED_MANIFEST):
+    """Vocoder ckpt path from a still-valid resolution manifest for setting `vck`, else None.
+
+    Validation only stats the handful of files the manifest lists.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('vocoder_ckpt_setting') != vck or not manifest.get('vocoder_ckpt'):
+        return None
+    if not all(record_is_current(record) for record in manifest.get('files', [])):
+        return None
+    return manifest['vocoder_ckpt']
+
+
+def write_resolved(vck: str, ckpt: str, files: list, manifest_path: str = RESOLVED_MANIFEST):
+    manifest = {'vocoder_ckpt_setting': vck, 'vocoder_ckpt': ckpt, 'files': files}
+    try:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, manifest_path)
+    except OSError as e:
+        print('Failed to write vocoder resolution manifest:', e)
+
+
+def download_vocoder():
+    """Fetch and extract the packaged HiFi-GAN vocoder into the workspace models."""
+    os.makedirs(WORKSPACE_VOCODER_DIR, exist_ok=True)
+    zip_path = os.path.join(WORKSPACE_VOCODER_DIR, os.path.basename(VOCODER_URL))
+    print('Downloading vocoder into workspace models:', VOCODER_URL)
+    subprocess.run(['curl', '-L', '-o', zip_path, VOCODER_URL], check=True)
+    subprocess.run(['unzip', '-o', zip_path, '-d', WORKSPACE_VOCODER_DIR], check=True)
+
+
+def ensure_configs(ckpt_dir: str, files: list):
+    """Make sure a companion config sits next to the vocoder ckpt, linking one from the workspace."""
+    present = [os.path.join(ckpt_dir, name) for name in KNOWN_CONFIG_NAMES
+               if os.path.exists(os.path.join(ckpt_dir, name))]
+    if not present:
+        print('Vocoder companion config not found in', ckpt_dir, '; looking in', WORKSPACE_VOCODER_DIR)
+        configs = find_configs(WORKSPACE_VOCODER_DIR)
+        if not configs:
             try:
-                os.makedirs('/workspace/models/hifigan', exist_ok=True)
-                VOC_URL = 'https://github.com/MoonInTheRiver/DiffSinger/releases/download/pretrain-model/0109_hifigan_bigpopcs_hop128.zip'
-                zip_path = '/workspace/models/hifigan/0109_hifigan_bigpopcs_hop128.zip'
-                cmd = f"curl -L -o {zip_path} {VOC_URL} && unzip -o {zip_path} -d /workspace/models/hifigan"
-                print('Downloading vocoder into workspace models via shell:', cmd)
-                subprocess.run(cmd, shell=True, check=True)
-                for p in sorted(pathlib.Path('/workspace/models/hifigan').rglob('*.ckpt')):
-                    try:
-                        # copy to repo checkpoints location as well for compatibility
-                        dest_dir = '/opt/DiffSinger/checkpoints/hifigan'
-                        os.makedirs(dest_dir, exist_ok=True)
-                        import shutil
-                        dest_path = os.path.join(dest_dir, os.path.basename(str(p)))
-                        if not os.path.exists(dest_path):
-                            shutil.copy(str(p), dest_path)
-                            print('Copied downloaded vocoder ckpt to', dest_path)
-                            # copy any companion config files that were extracted alongside the ckpt
-                            try:
-                                if copy_companion_configs is not None:
-                                    copied = copy_companion_configs(os.path.dirname(str(p)), dest_dir)
-                                    if copied:
-                                        print('Copied downloaded companion configs:', copied)
-                                else:
-                                    src_dir = os.path.dirname(str(p))
-                                    for cfg_glob in ('config.json', 'config.yaml', 'config.yml', 'model_config.json'):
-                                        src_cfg = os.path.join(src_dir, cfg_glob)
-                                        if os.path.exists(src_cfg):
-                                            dst_cfg = os.path.join(dest_dir, os.path.basename(src_cfg))
-                                            if not os.path.exists(dst_cfg):
-                                                shutil.copy(src_cfg, dst_cfg)
-                                                print('Copied downloaded vocoder config', src_cfg, '->', dst_cfg)
-                            except Exception:
-                                pass
-                            # Use absolute path to avoid ambiguity in loaders
-                            hparams['vocoder_ckpt'] = dest_path
-                            print('Downloaded and using vocoder ckpt (absolute):', hparams['vocoder_ckpt'])
-                    except Exception as _:
-                        hparams['vocoder_ckpt'] = str(p)
-                        print('Downloaded and using vocoder ckpt (abs):', hparams['vocoder_ckpt'])
-                    break
+                download_vocoder()
+                configs = find_configs(WORKSPACE_VOCODER_DIR)
             except Exception as e:
-                print('Runtime vocoder download into workspace/models failed:', e)
+                print('Failed to download/extract vocoder configs:', e)
+        for src in configs:
+            dst = os.path.join(ckpt_dir, os.path.basename(src))
+            if not os.path.exists(dst):
+                link_file(src, dst)
+                print('Linked vocoder config', src, '->', dst)
+                files.append(file_record(src, dst))
+        # If only YAML config exists, create a JSON copy for loaders expecting config.json
+        created = convert_yaml_to_json_if_present(ckpt_dir)
+        if created:
+            present.append(created)
+    files.extend(file_record(path) for path in present)
 
-# prepare params from sample project
-proj = '/opt/DiffSinger/samples/03_撒娇八连.ds'
-params = []
-try:
-    with open(proj, 'r', encoding='utf-8') as f:
-        params = json.load(f)
-    if not isinstance(params, list):
-        params = [params]
-except Exception as e:
-    print('Failed to load sample ds project:', e)
-    sys.exit(4)
-
-# safety monkeypatches
-try:
-    # basics.base_module is only present in the cloned DiffSinger repo at runtime.
-    import basics.base_module as bm  # type: ignore
-    def _patched_check_category(self, category):
-        if category is None:
-            print('Warning: checkpoint category missing; proceeding with old-format checkpoint.')
+
+def resolve_vocoder_files(vck: str):
+    """Full resolution: find (or fetch) the vocoder ckpt and its configs and link them into
+    the repo checkpoints. Returns (ckpt path or None, manifest file records)."""
+    files = []
+    candidate = os.path.join(DIFFSINGER_ROOT, 'checkpoints', vck) if not os.path.isabs(vck) else vck
+    print('Resolving vocoder candidate path:', candidate)
+    if os.path.exists(candidate):
+        ckpt = candidate
+        files.append(file_record(candidate))
+    else:
+        print('Vocoder ckpt not found at', candidate, '— searching fallbacks...')
+        found = find_first_ckpt(list(VOCODER_SEARCH_ROOTS))
+        if not found:
+            print('No fallback vocoder checkpoint found in /workspace/models; attempting runtime download into',
+                  WORKSPACE_VOCODER_DIR)
+            download_vocoder()
+            found = find_first_ckpt([WORKSPACE_VOCODER_DIR])
+        if not found:
+            return None, files
+        ckpt = copy_ckpt_to_dir(found, VOCODER_DIR)
+        print('Linked fallback vocoder ckpt', found, '->', ckpt)
+        files.append(file_record(found, ckpt))
+        for dst in copy_companion_configs(os.path.dirname(found), VOCODER_DIR):
+            files.append(file_record(os.path.join(os.path.dirname(found), os.path.basename(dst)), dst))
+    ensure_configs(os.path.dirname(ckpt), files)
+    return ckpt, files
+
+
+def resolve_vocoder(hparams, manifest_path: str = RESOLVED_MANIFEST):
+    """Point hparams['vocoder_ckpt'] at a usable vocoder checkpoint (absolute path).
+
+    The first run searches, links (never copies) and if need be downloads the
+    vocoder, then records the result in `manifest_path`. Later runs validate
+    that manifest with a few stats and skip the search entirely.
+    """
+    vck = hparams.get('vocoder_ckpt', None)
+    if not vck:
+        return
+    ckpt = load_resolved(vck, manifest_path)
+    if ckpt:
+        print('Vocoder checkpoint from resolution manifest:', ckpt)
+    else:
+        try:
+            ckpt, files = resolve_vocoder_files(vck)
+        except Exception as e:
+            print('Vocoder checkpoint resolution failed:', e)
             return
-        if category != self.category:
-            raise RuntimeError('Category mismatches!')
-    bm.CategorizedModule.check_category = _patched_check_category
-except Exception as e:
-    print('Failed to monkeypatch CategorizedModule:', e)
+        if ckpt is None:
+            print('No vocoder checkpoint available; leaving hparams["vocoder_ckpt"] as', vck)
+            return
+        write_resolved(vck, ckpt, files, manifest_path)
+        print('Resolved vocoder checkpoint', ckpt, '(manifest:', manifest_path + ')')
+    hparams['vocoder_ckpt'] = ckpt
 
-try:
-    import importlib
-    utils_mod = importlib.import_module('utils')  # type: ignore
-    orig_load = getattr(utils_mod, 'load_ckpt', None)
-    if orig_load is not None:
-        # Cast to a callable to satisfy static checkers
-        orig_load_fn = cast(Callable[..., Any], orig_load)
-        def _loose_load_ckpt(cur_model, ckpt_base_dir, ckpt_steps=None, prefix_in_ckpt='model', strict=True, device='cpu'):
-            return orig_load_fn(cur_model, ckpt_base_dir, ckpt_steps=ckpt_steps, prefix_in_ckpt=prefix_in_ckpt, strict=False, device=device)
-        # Assign via setattr to avoid ModuleType attribute diagnostics
-        setattr(utils_mod, 'load_ckpt', _loose_load_ckpt)
-except Exception as e:
-    print('Failed to monkeypatch load_ckpt:', e)
-
-# run inference
-try:
-    # Importing inference.ds_acoustic is only possible inside the cloned DiffSinger repo at runtime.
-    from inference.ds_acoustic import DiffSingerAcousticInfer  # type: ignore
-    infer_ins = DiffSingerAcousticInfer(load_vocoder=True, ckpt_steps=None)
-    infer_ins.run_inference(params, out_dir=pathlib.Path(out_dir), title=title, num_runs=1)
-except Exception as e:
-    print('DiffSinger programmatic inference failed:', e)
-    sys.exit(5)
-
-print('DiffSinger inference completed successfully')
-sys.exit(0)
+
+def apply_compat_patches():
+    """Let old-format checkpoints load: tolerate a missing category and non-strict state dicts."""
+    try:
+        # basics.base_module is only present in the cloned DiffSinger repo at runtime.
+        import basics.base_module as bm  # type: ignore
+        def _patched_check_category(self, category):
+            if category is None:
+                print('Warning: checkpoint category missing; proceeding with old-format checkpoint.')
+                return
+            if category != self.category:
+                raise RuntimeError('Category mismatches!')
+        bm.CategorizedModule.check_category = _patched_check_category
+    except Exception as e:
+        print('Failed to monkeypatch CategorizedModule:', e)
+
+    try:
+        import importlib
+        utils_mod = importlib.import_module('utils')  # type: ignore
+        orig_load = getattr(utils_mod, 'load_ckpt', None)
+        if orig_load is not None and not getattr(orig_load, '_harmonia_loose', False):
+            # Cast to a callable to satisfy static checkers
+            orig_load_fn = cast(Callable[..., Any], orig_load)
+            def _loose_load_ckpt(cur_model, ckpt_base_dir, ckpt_steps=None, prefix_in_ckpt='model', strict=True, device='cpu'):
+                return orig_load_fn(cur_model, ckpt_base_dir, ckpt_steps=ckpt_steps, prefix_in_ckpt=prefix_in_ckpt, strict=False, device=device)
+            _loose_load_ckpt._harmonia_loose = True
+            # Assign via setattr to avoid ModuleType attribute diagnostics
+            setattr(utils_mod, 'load_ckpt', _loose_load_ckpt)
+    except Exception as e:
+        print('Failed to monkeypatch load_ckpt:', e)
+
+
+def load_project(path: str = SAMPLE_PROJECT) -> list:
+    """Return the phrase list of a .ds project (a single phrase object is wrapped in a list)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            params = json.load(f)
+    except Exception as e:
+        raise HelperError(f'Failed to load ds project {path}: {e}', 4)
+    return params if isinstance(params, list) else [params]
+
+
+def setup_runtime():
+    """Run the one-time setup (hparams, vocoder, patches) and return DiffSinger's hparams."""
+    hparams = load_hparams()
+    resolve_vocoder(hparams)
+    apply_compat_patches()
+    return hparams
+
+
+def build_infer():
+    """Construct the acoustic model with its vocoder. Call `setup_runtime()` first."""
+    try:
+        # Importing inference.ds_acoustic is only possible inside the cloned DiffSinger repo at runtime.
+        from inference.ds_acoustic import DiffSingerAcousticInfer  # type: ignore
+        return DiffSingerAcousticInfer(load_vocoder=True, ckpt_steps=None)
+    except Exception as e:
+        raise HelperError(f'DiffSinger programmatic inference failed: {e}', 5)
+
+
+def model_files(hparams) -> tuple:
+    """(acoustic files, vocoder files) whose contents determine what a render sounds like."""
+    work_dir = hparams.get('work_dir') or os.path.join(DIFFSINGER_ROOT, 'checkpoints', EXP_NAME)
+    if not os.path.isabs(work_dir):
+        work_dir = os.path.join(DIFFSINGER_ROOT, work_dir)
+    # Migrated copies are derived from these sources and need no hash of their own
+    acoustic = [CONFIG_PATH] + sorted(str(p) for p in pathlib.Path(work_dir).glob('*.ckpt')
+                                      if not p.name.endswith('.migrated.ckpt'))
+    vocoder = []
+    vck = hparams.get('vocoder_ckpt')
+    if vck:
+        vck = vck if os.path.isabs(vck) else os.path.join(DIFFSINGER_ROOT, 'checkpoints', vck)
+        vck_dir = vck if os.path.isdir(vck) else os.path.dirname(vck)
+        vocoder = ([] if os.path.isdir(vck) else [vck]) + [os.path.join(vck_dir, name) for name in KNOWN_CONFIG_NAMES]
+    return ([p for p in acoustic if os.path.isfile(p)], [p for p in vocoder if os.path.isfile(p)])
+
+
+def render_phrase(infer_ins, param: dict, hparams):
+    """Render one phrase of a .ds project to a mono float waveform (numpy array).
+
+    Uses the same steps as DiffSingerAcousticInfer.run_inference does per phrase.
+    """
+    try:
+        batch = infer_ins.preprocess_input(param, idx=0)
+        mel = infer_ins.forward_model(batch)
+        return infer_ins.run_vocoder(mel, f0=batch['f0'])[0].cpu().numpy()
+    except Exception as e:
+        raise HelperError(f'DiffSinger phrase render failed: {e}', 5)
+
+
+def cross_fade(a, b, idx: int):
+    """Overlap `b` onto the tail of `a` from sample `idx`, fading linearly across the overlap."""
+    import numpy as np
+
+    result = np.zeros(idx + b.shape[0])
+    fade_len = a.shape[0] - idx
+    result[:idx] = a[:idx]
+    k = np.linspace(0, 1.0, num=fade_len, endpoint=True)
+    result[idx:a.shape[0]] = (1 - k) * a[idx:] + k * b[:fade_len]
+    result[a.shape[0]:] = b[fade_len:]
+    return result
+
+
+def assemble_phrases(params: list, waveforms: list, sample_rate: int):
+    """Place rendered phrases at their project offsets: silence fills gaps, overlaps are cross-faded.
+
+    Matches how run_inference joins phrases, so a song assembled from separately
+    rendered phrases sounds the same as one rendered in a single pass.
+    """
+    import numpy as np
+
+    result = np.zeros(0)
+    current_length = 0
+    for param, waveform in zip(params, waveforms):
+        silent_length = round(param.get('offset', 0) * sample_rate) - current_length
+        if silent_length >= 0:
+            result = np.concatenate([result, np.zeros(silent_length), waveform])
+        else:
+            result = cross_fade(result, waveform, current_length + silent_length)
+        current_length = current_length + silent_length + waveform.shape[0]
+    return result
+
+
+def read_wav(path: str) -> tuple:
+    """(mono float waveform, sample rate) of a 16-bit PCM WAV written by `write_wav`."""
+    import wave
+
+    import numpy as np
+
+    with wave.open(path, 'rb') as w:
+        sample_rate = w.getframerate()
+        pcm = np.frombuffer(w.readframes(w.getnframes()), '<i2')
+    return pcm.astype(np.float64) / 32767, sample_rate
+
+
+def write_wav(path: str, waveform, sample_rate: int) -> str:
+    """Write a mono float waveform as 16-bit PCM via a temp file and an atomic rename."""
+    import wave
+
+    import numpy as np
+
+    pcm = (np.clip(waveform, -1.0, 1.0) * 32767).astype('<i2')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with wave.open(tmp, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def render_to_file(params: list, hparams, out_path: str, get_infer, cache=None, cancelled=None) -> int:
+    """Render a song phrase by phrase to `out_path`; returns how many phrases hit the model.
+
+    With a `phrase_cache.PhraseCache`, unchanged phrases are reused and only
+    edited ones are rendered. `get_infer()` returns the model and is only
+    called once a phrase actually needs rendering. `cancelled()`, when given,
+    is checked before each rendered phrase and before writing `out_path`.
+    """
+    from phrase_cache import phrase_key, render_song
+
+    def check():
+        if cancelled is not None and cancelled():
+            raise HelperError(f'Render of {out_path} cancelled', 6)
+
+    def render(param):
+        check()
+        return render_phrase(get_infer(), param, hparams)
+
+    sample_rate = hparams['audio_sample_rate']
+    keys = [None] * len(params)
+    if cache is not None:
+        acoustic_hash, vocoder_hash = cache.model_hashes(*model_files(hparams))
+        keys = [phrase_key(param, acoustic_hash, vocoder_hash) for param in params]
+    audio, rendered = render_song(params, keys, cache, render, sample_rate)
+    check()
+    write_wav(out_path, audio, sample_rate)
+    return rendered
+
+
+def main(argv) -> int:
+    # args: out_dir, title[, project]
+    if len(argv) < 3:
+        print('Usage: diffsinger_infer_helper.py <out_dir> <title> [project.ds]')
+        return 2
+    out_dir = os.path.abspath(argv[1])
+    title = argv[2]
+    project = argv[3] if len(argv) > 3 else SAMPLE_PROJECT
+    models = {}
+
+    def get_infer():
+        if 'infer' not in models:
+            models['infer'] = build_infer()
+        return models['infer']
+
+    try:
+        hparams = setup_runtime()
+        params = load_project(project)
+        from phrase_cache import default_cache
+
+        wav = os.path.join(out_dir, title + '.wav')
+        rendered = render_to_file(params, hparams, wav, get_infer, default_cache())
+    except HelperError as e:
+        print(e)
+        return e.code
+    print(f'DiffSinger inference completed successfully: {wav} ({rendered}/{len(params)} phrases rendered)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Persistent DiffSinger session for Harmonia.
+
+Runs the DiffSinger setup (hparams, vocoder resolution, compatibility
+patches) once and keeps the acoustic model and its HiFi-GAN vocoder in
+memory, serving renders over a local Unix socket, so a song no longer pays
+the model and vocoder load. Renders go through the phrase cache, so a song
+whose lyrics changed in one line only re-renders that line's phrase.
+`run_diffsinger.py` uses the session when its socket is up and falls back to
+the one-shot helper otherwise.
+
+Usage (inside the worker container):
+    python3 scripts/diffsinger_session.py serve [--socket PATH]
+    python3 scripts/diffsinger_session.py ping
+    python3 scripts/diffsinger_session.py render <meta.json|project.ds> <out.wav>
+
+Protocol: one JSON object per line in each direction.
+    {"cmd": "ping"}
+    {"cmd": "render", "out_path": "/abs/out.wav",
+     "project": "/abs/song.ds" | "params": [...] | "meta": {...}}
+Replies carry "ok"; renders return the written WAV path as "wav" and how
+many of the song's "phrases" were "rendered" (the rest came from the cache),
+failures an "error" message and the helper's exit "code". Closing the
+connection cancels its render: the session stops before the next phrase and
+does not write "out_path" (so a client that timed out can hand the song to
+the one-shot helper).
+"""
+import argparse
+import json
+import os
+import select
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import diffsinger_infer_helper as helper
+from phrase_cache import default_cache
+
+DEFAULT_SOCKET = os.environ.get('DIFFSINGER_SESSION_SOCKET', '/tmp/harmonia-diffsinger.sock')
+
+
+def project_params(request: dict) -> list:
+    """Phrase list for a render request: inline `params`, a `project` path, or lyric `meta`.
+
+    Lyric metadata without a `ds_project` renders the sample project, as the
+    one-shot helper does.
+    """
+    if request.get('params') is not None:
+        params = request['params']
+        return params if isinstance(params, list) else [params]
+    meta = request.get('meta') or {}
+    return helper.load_project(request.get('project') or meta.get('ds_project') or helper.SAMPLE_PROJECT)
+
+
+class DiffSingerSession:
+    """A loaded DiffSinger model. Renders are serialized: the model is not thread safe."""
+
+    def __init__(self):
+        started = time.time()
+        self.hparams = helper.setup_runtime()
+        self.infer = helper.build_infer()
+        self.cache = default_cache()
+        self.load_seconds = round(time.time() - started, 2)
+        self.renders = 0
+        self._lock = threading.Lock()
+
+    def render(self, request: dict, cancelled=None) -> dict:
+        """Render a request to its `out_path`; returns {wav, phrases, rendered}.
+
+        Stops with a HelperError once `cancelled()` returns True.
+        """
+        out_path = os.path.abspath(request['out_path'])
+        params = project_params(request)
+        with self._lock:
+            rendered = helper.render_to_file(params, self.hparams, out_path, lambda: self.infer, self.cache,
+                                             cancelled)
+            self.renders += 1
+        return {'wav': out_path, 'phrases': len(params), 'rendered': rendered}
+
+    def status(self) -> dict:
+        return {'ok': True, 'pid': os.getpid(), 'renders': self.renders, 'load_seconds': self.load_seconds}
+
+
+class SessionHandler(socketserver.StreamRequestHandler):
+    session = None
+
+    def client_gone(self) -> bool:
+        """True once the client has closed its end of the connection."""
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        try:
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if request.get('cmd') == 'ping':
+                    reply = self.session.status()
+                elif request.get('cmd') == 'render':
+                    started = time.time()
+                    reply = {'ok': True, **self.session.render(request, self.client_gone),
+                             'seconds': round(time.time() - started, 2)}
+                else:
+                    reply = {'ok': False, 'error': f"Unknown command {request.get('cmd')!r}", 'code': 2}
+            except helper.HelperError as e:
+                reply = {'ok': False, 'error': str(e), 'code': e.code}
+            except Exception as e:
+                reply = {'ok': False, 'error': f'{type(e).__name__}: {e}', 'code': 2}
+            try:
+                self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            except OSError:
+                # The client already hung up (a cancelled render)
+                return
+
+
+def serve(socket_path: str = DEFAULT_SOCKET) -> int:
+    try:
+        SessionHandler.session = DiffSingerSession()
+    except helper.HelperError as e:
+        print(e)
+        return e.code
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, SessionHandler)
+    server.daemon_threads = True
+    print(f'DiffSinger session ready on {socket_path} (models loaded in {SessionHandler.session.load_seconds}s)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+    return 0
+
+
+def request(payload: dict, socket_path: str = DEFAULT_SOCKET, timeout: float = None) -> dict:
+    """Send one request to a running session and return its reply.
+
+    Raises OSError when no session is listening on `socket_path`.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as replies:
+            line = replies.readline()
+    if not line:
+        raise ConnectionError(f'DiffSinger session on {socket_path} closed the connection')
+    return json.loads(line)
+
+
+def session_available(socket_path: str = DEFAULT_SOCKET) -> bool:
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        return request({'cmd': 'ping'}, socket_path, timeout=5).get('ok', False)
+    except (OSError, ValueError):
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent DiffSinger render session')
+    parser.add_argument('command', choices=('serve', 'ping', 'render'))
+    parser.add_argument('input', nargs='?', help='render: lyric metadata JSON or .ds project')
+    parser.add_argument('output', nargs='?', help='render: output WAV path')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix socket path (env DIFFSINGER_SESSION_SOCKET)')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        return serve(args.socket)
+    try:
+        if args.command == 'ping':
+            reply = request({'cmd': 'ping'}, args.socket, timeout=5)
+        else:
+            if not args.input or not args.output:
+                parser.error('render needs <input> and <output>')
+            payload = {'cmd': 'render', 'out_path': os.path.abspath(args.output)}
+            if args.input.endswith('.ds'):
+                payload['project'] = os.path.abspath(args.input)
+            else:
+                with open(args.input, 'r', encoding='utf-8') as f:
+                    payload['meta'] = json.load(f)
+            reply = request(payload, args.socket)
+    except OSError as e:
+        print(f'No DiffSinger session on {args.socket}: {e}')
+        return 3
+    print(json.dumps(reply, indent=2))
+    return 0 if reply.get('ok') else reply.get('code', 2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
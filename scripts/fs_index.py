@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Shared filesystem index for Harmonia's model and dataset trees.
+
+One `os.scandir` pass records every file's size, mtime and inode in a small
+SQLite database (default `.cache/fs_index.sqlite` at the repo root, env
+HARMONIA_FS_INDEX). Later updates are incremental: a directory whose mtime
+is unchanged has had no entries added, removed or renamed, so it costs one
+stat and its recorded files are reused; only changed directories are listed
+again. A file rewritten in place keeps its directory's mtime, so run with
+`--rescan` after editing files in place (downloads and copies that land by
+rename are picked up).
+
+The smoke check, the inventory summaries and the file size audit all query
+the index instead of crawling the same trees.
+Usage:
+    python3 scripts/fs_index.py update models datasets [--rescan]
+    python3 scripts/fs_index.py stats models
+    python3 scripts/fs_index.py inventory models datasets [--top N]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DB = os.environ.get('HARMONIA_FS_INDEX', str(REPO_ROOT / '.cache' / 'fs_index.sqlite'))
+# Directories that are never indexed
+SKIP_DIRS = {'.git', 'node_modules', '__pycache__'}
+# A directory modified this recently may change again within the same mtime
+# tick; it is not recorded as clean, so the next update lists it again
+RACY_NS = 2 * 1000 ** 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+'''
+
+
+def _under(path: str) -> tuple:
+    """Bounds of the keys strictly below `path` (for `key > lo AND key < hi` range scans)."""
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+
+class FsIndex:
+    """Files under indexed roots, kept current by `update()`."""
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self.conn = sqlite3.connect(db_path, timeout=30)
+            self.conn.executescript(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            print(f'Filesystem index {db_path} unavailable ({e}); indexing in memory')
+            self.conn = sqlite3.connect(':memory:')
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _forget(self, path: str):
+        lo, hi = _under(path)
+        self.conn.execute('DELETE FROM dirs WHERE path = ? OR (path > ? AND path < ?)', (path, lo, hi))
+        self.conn.execute('DELETE FROM files WHERE dir = ? OR (dir > ? AND dir < ?)', (path, lo, hi))
+
+    def update(self, root, rescan: bool = False) -> dict:
+        """Bring the index for `root` up to date; returns {dirs, scanned, seconds}."""
+        started = time.time()
+        root = os.path.abspath(root)
+        stack = [(root, os.path.dirname(root))]
+        dirs = scanned = 0
+        with self.conn:
+            while stack:
+                path, parent = stack.pop()
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    self._forget(path)
+                    continue
+                dirs += 1
+                row = self.conn.execute('SELECT mtime_ns FROM dirs WHERE path = ?', (path,)).fetchone()
+                if row and row[0] == mtime_ns and not rescan:
+                    stack.extend((sub, path) for (sub,) in
+                                 self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,)))
+                    continue
+                scanned += 1
+                files, subdirs = [], []
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    if entry.name not in SKIP_DIRS:
+                                        subdirs.append(entry.path)
+                                elif entry.is_file():
+                                    st = entry.stat()
+                                    files.append((entry.path, path, st.st_size, st.st_mtime_ns, st.st_ino))
+                            except OSError:
+                                continue
+                except OSError:
+                    pass
+                known = {sub for (sub,) in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,))}
+                for gone in known - set(subdirs):
+                    self._forget(gone)
+                self.conn.execute('DELETE FROM files WHERE dir = ?', (path,))
+                self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', files)
+                # mtime from before the listing: a change made during the scan is seen next time
+                clean = mtime_ns if time.time_ns() - mtime_ns > RACY_NS else -1
+                self.conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (path, parent, clean))
+                stack.extend((sub, path) for sub in subdirs)
+        return {'dirs': dirs, 'scanned': scanned, 'seconds': round(time.time() - started, 3)}
+
+    def files(self, root):
+        """(path, size) for every indexed file below `root`, streamed from the database."""
+        root = os.path.abspath(root)
+        lo, hi = _under(root)
+        yield from self.conn.execute('SELECT path, size FROM files WHERE dir = ? OR (dir > ? AND dir < ?)',
+                                     (root, lo, hi))
+
+    def subdirs(self, root) -> list:
+        """Names of the directories directly inside `root`."""
+        rows = self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (os.path.abspath(root),))
+        return sorted(os.path.basename(path) for (path,) in rows)
+
+    def folder_summary(self, folder, top: int = 5) -> dict:
+        """Inventory fields of one folder: size_bytes, files_count and its `top` largest files."""
+        folder = os.path.abspath(folder)
+        lo, hi = _under(folder)
+        where = 'dir = ? OR (dir > ? AND dir < ?)'
+        size, count = self.conn.execute(f'SELECT COALESCE(SUM(size), 0), COUNT(*) FROM files WHERE {where}',
+                                        (folder, lo, hi)).fetchone()
+        largest = self.conn.execute(f'SELECT path, size FROM files WHERE {where} ORDER BY size DESC LIMIT ?',
+                                    (folder, lo, hi, top))
+        return {
+            'size_bytes': size,
+            'files_count': count,
+            'top_files': [{'path': os.path.relpath(path, folder), 'size_bytes': sz} for path, sz in largest],
+        }
+
+
+def indexed(root, db_path: str = DEFAULT_DB, rescan: bool = False) -> FsIndex:
+    """An index brought up to date for `root`."""
+    index = FsIndex(db_path)
+    index.update(root, rescan)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index model and dataset trees')
+    parser.add_argument('command', choices=('update', 'stats', 'inventory'))
+    parser.add_argument('roots', nargs='+', help='Directories to index or query')
+    parser.add_argument('--db', default=DEFAULT_DB, help='Index database (env HARMONIA_FS_INDEX)')
+    parser.add_argument('--rescan', action='store_true', help='List every directory again, ignoring mtimes')
+    parser.add_argument('--top', type=int, default=5, help='inventory: largest files listed per folder')
+    args = parser.parse_args()
+
+    index = FsIndex(args.db)
+    result = {}
+    for root in args.roots:
+        update = index.update(root, args.rescan)
+        if args.command == 'update':
+            result[root] = update
+        elif args.command == 'stats':
+            result[root] = dict(index.folder_summary(root, 0), **update)
+            del result[root]['top_files']
+        else:
+            result[root] = [dict(folder_name=name, local_path=os.path.join(os.path.abspath(root), name),
+                                 **index.folder_summary(os.path.join(root, name), args.top))
+                            for name in index.subdirs(root)]
+    if args.command == 'inventory':
+        result = {'generated_at': datetime.utcnow().isoformat() + 'Z', 'folders': result}
+    index.close()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,11 +4,26 @@ MusicGen Audio Generation Script for Harmonia
 
 This script generates audio for a specific instrument using MusicGen.
 It takes instrument name, output file path, and duration as parameters.
+
+It can also run as a long-lived worker (`--serve`) that loads the model once
+and accepts generation requests over local HTTP. When `--server` (or
+MUSICGEN_SERVER_URL) is set, the CLI acts as a thin client of that worker and
+only falls back to in-process generation if the worker is unreachable.
 """
 import argparse
+import base64
+import io
+import itertools
+import json
 import os
+import re
 import sys
-from pathlib import Path
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from datetime import datetime
 
 # Set temporary directory to avoid Windows path issues
@@ -16,246 +31,353 @@ os.environ['TMPDIR'] = '/tmp'
 os.environ['TEMP'] = '/tmp'
 os.environ['TMP'] = '/tmp'
 
-# Monkey patch ALL temp file functions BEFORE importing audiocraft
-import tempfile
-original_named_temp = tempfile.NamedTemporaryFile
-original_temp = tempfile.TemporaryFile
-original_mkstemp = tempfile.mkstemp
-original_mkdtemp = tempfile.mkdtemp
-
-def patched_named_temp(*args, **kwargs):
-    if 'dir' not in kwargs:
-        kwargs['dir'] = '/tmp'
-    return original_named_temp(*args, **kwargs)
-
-def patched_temp(*args, **kwargs):
-    if 'dir' not in kwargs:
-        kwargs['dir'] = '/tmp'
-    return original_temp(*args, **kwargs)
-
-def patched_mkstemp(*args, **kwargs):
-    if 'dir' not in kwargs:
-        kwargs['dir'] = '/tmp'
-    return original_mkstemp(*args, **kwargs)
-
-def patched_mkdtemp(*args, **kwargs):
-    if 'prefix' not in args and 'prefix' not in kwargs:
-        kwargs['prefix'] = '/tmp/'
-    return original_mkdtemp(*args, **kwargs)
-
-# Monkey patch subprocess to fix ffmpeg calls
-import subprocess
-original_call = subprocess.call
-original_run = subprocess.run
-original_popen = subprocess.Popen
-
-def patched_call(cmd, *args, **kwargs):
-    print(f"Intercepted call: {cmd}")
-    # Fix Windows paths in ffmpeg commands
-    if isinstance(cmd, list) and len(cmd) > 0 and 'ffmpeg' in cmd[0]:
-        print(f"Original ffmpeg cmd: {cmd}")
-        cmd = [arg.replace('C:/Users/Sanford/AppData/Local/Temp/', '/tmp/') if isinstance(arg, str) else arg for arg in cmd]
-        print(f"Patched ffmpeg cmd: {cmd}")
-    return original_call(cmd, *args, **kwargs)
-
-def patched_run(cmd, *args, **kwargs):
-    if isinstance(cmd, list) and len(cmd) > 0 and 'ffmpeg' in cmd[0]:
-        cmd = [arg.replace('C:/Users/Sanford/AppData/Local/Temp/', '/tmp/') if isinstance(arg, str) else arg for arg in cmd]
-    return original_run(cmd, *args, **kwargs)
-
-def patched_popen(cmd, *args, **kwargs):
-    if isinstance(cmd, list) and len(cmd) > 0 and 'ffmpeg' in cmd[0]:
-        cmd = [arg.replace('C:/Users/Sanford/AppData/Local/Temp/', '/tmp/') if isinstance(arg, str) else arg for arg in cmd]
-    return original_popen(cmd, *args, **kwargs)
-
-subprocess.call = patched_call
-subprocess.run = patched_run
-subprocess.Popen = patched_popen
-
-# Now import audiocraft after the patch
-from audiocraft.models import MusicGen
-from audiocraft.data.audio import audio_write
-import torch
-
-def generate_instrument_audio(instrument: str, output_path: str, duration: int = 5) -> bool:
-    print(f"DEBUG: generate_instrument_audio called with instrument='{instrument}', output_path='{output_path}', duration={duration}")
+# Heavy ML modules (torch, audiocraft) are imported on first use, not at import
+# time, so --help, argument errors, cache hits and --dry-run start instantly.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stem_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, StemCache, cache_key
+from audio_postprocess import DEFAULT_POSTPROCESS, postprocess
+from job_queue import JobQueue, QueueFull
+from model_registry import canonical_name
+from musicgen_inference import (ACCEL_MODES, DEFAULT_ACCEL, DEFAULT_MODEL, GENERATION_PARAMS, MODEL_POOL,
+                                ffmpeg_temp_path_shim, generate_audio, generate_windows, get_model)
+
+DEFAULT_SERVER_HOST = '127.0.0.1'
+DEFAULT_SERVER_PORT = 8765
+# Concurrent generations in one worker (each slot holds its own model) and how
+# many requests may wait for a slot before new ones are rejected with 503.
+DEFAULT_WORKER_SLOTS = int(os.environ.get('MUSICGEN_WORKER_SLOTS', 1))
+DEFAULT_MAX_QUEUED = int(os.environ.get('MUSICGEN_WORKER_MAX_QUEUED', 16))
+# Thin client: how often a request rejected with 503 (queue full) is retried
+DEFAULT_SERVER_MAX_RETRIES = int(os.environ.get('MUSICGEN_SERVER_MAX_RETRIES', 10))
+# Caller-chosen job ids ("job_id" in a request body) must be usable in /jobs/<id>
+JOB_ID_PATTERN = re.compile(r'[A-Za-z0-9_.-]{1,64}')
+
+INSTRUMENT_PROMPTS = {
+    'piano': 'solo piano melody, classical, clean recording',
+    'guitar_acoustic': 'acoustic guitar strumming, folk music, warm tones',
+    'guitar_electric': 'electric guitar solo, rock music, distorted',
+    'bass': 'upright bass walking line, jazz, warm and woody',
+    'drums': 'drum kit groove, rock beat, energetic',
+    'violin': 'violin solo, classical, expressive',
+    'cello': 'cello solo, orchestral, rich and deep',
+    'flute': 'flute melody, classical, pure and clear',
+    'trumpet': 'trumpet solo, jazz, bright and brassy',
+    'saxophone': 'saxophone solo, jazz, smooth and mellow',
+    'clarinet': 'clarinet solo, classical, warm and reedy',
+    'trombone': 'trombone solo, orchestral, powerful',
+    'horn': 'french horn solo, orchestral, noble',
+    'tuba': 'tuba solo, orchestral, deep and resonant',
+    'cymbals': 'cymbal crashes, orchestral, shimmering',
+    'timpani': 'timpani rolls, orchestral, thunderous',
+    'bass_drum': 'bass drum hits, orchestral, powerful',
+    'organ': 'pipe organ, classical, grand and resonant',
+    'accordion': 'accordion melody, folk, lively',
+    'celesta': 'celesta glissando, classical, tinkling',
+    'marimba': 'marimba solo, contemporary, wooden tones',
+    'male_voice': 'male vocal solo, classical, operatic',
+    'female_voice': 'female vocal solo, classical, lyrical',
+    'choir': 'choir singing, classical, harmonious',
+    'synth_lead': 'synthesizer lead, electronic, bright',
+    'synth_pad': 'synthesizer pad, ambient, lush',
+    'bass_synth': 'synthesizer bass, electronic, deep',
+    'drum_machine': 'electronic drum machine, techno, mechanical',
+}
+
+def build_prompt(instrument: str) -> str:
+    """Map an instrument name (or free-form vocal description) to a MusicGen prompt."""
+    # Check if this is a vocal prompt (contains lyrics or singing)
+    if 'vocal' in instrument.lower() or 'singing' in instrument.lower() or 'voice' in instrument.lower():
+        # For vocals, use the instrument string directly as the prompt
+        return instrument
+    # Get the prompt for this instrument, or use a generic one
+    return INSTRUMENT_PROMPTS.get(instrument, f'{instrument} solo, musical instrument')
+
+
+def default_output_path(instrument: str) -> str:
+    timestamp = datetime.now().strftime('%Y-%m-%dT%H-%M-%S')
+    return f'/workspace/generated/instruments/{timestamp}_{instrument}.wav'
+
+
+def job_cache_params(job: dict, model_name: str, postprocess_config: dict = None) -> dict:
+    """Everything that determines a job's audio: model id, prompt, duration, sampling
+    parameters, seed and post-processing."""
+    return {
+        'model': job.get('model') or canonical_name(model_name),
+        'accel': job.get('accel'),
+        'prompt': job['prompt'],
+        'duration': job['duration'],
+        'seed': job['seed'],
+        **{name: job[name] for name in GENERATION_PARAMS},
+        'postprocess': {**DEFAULT_POSTPROCESS, **(postprocess_config or {})},
+    }
+
+
+def sidecar_path(output_path: str) -> str:
+    return os.path.splitext(output_path)[0] + '.json'
+
+
+def write_sidecar(job: dict, params: dict, key: str, source: str):
+    """Record the parameters that produced `job['output']` in a JSON file next to the WAV."""
+    sidecar = {
+        'instrument': job['instrument'],
+        'output': job['output'],
+        **params,
+        'cache_key': key,
+        'source': source,
+        'written_at': datetime.utcnow().isoformat() + 'Z',
+    }
     try:
-        print(f"Loading MusicGen model for {instrument}...")
-
-        # Load a pre-trained MusicGen model (small for speed)
-        model = MusicGen.get_pretrained('facebook/musicgen-small')
-
-        # Set generation parameters
-        model.set_generation_params(
-            duration=duration,  # seconds
-            temperature=1.0,
-            top_k=250,
-            top_p=0.0,
-            cfg_coef=3.0,
-            use_sampling=True,
-        )
-
-        # Create a descriptive prompt based on the instrument
-        # Check if this is a vocal prompt (contains lyrics or singing)
-        if 'vocal' in instrument.lower() or 'singing' in instrument.lower() or 'voice' in instrument.lower():
-            # For vocals, use the instrument string directly as the prompt
-            prompt = instrument
-        else:
-            # For instruments, look up in the dictionary
-            instrument_prompts = {
-                'piano': 'solo piano melody, classical, clean recording',
-                'guitar_acoustic': 'acoustic guitar strumming, folk music, warm tones',
-                'guitar_electric': 'electric guitar solo, rock music, distorted',
-                'bass': 'upright bass walking line, jazz, warm and woody',
-                'drums': 'drum kit groove, rock beat, energetic',
-                'violin': 'violin solo, classical, expressive',
-                'cello': 'cello solo, orchestral, rich and deep',
-                'flute': 'flute melody, classical, pure and clear',
-                'trumpet': 'trumpet solo, jazz, bright and brassy',
-                'saxophone': 'saxophone solo, jazz, smooth and mellow',
-                'clarinet': 'clarinet solo, classical, warm and reedy',
-                'trombone': 'trombone solo, orchestral, powerful',
-                'horn': 'french horn solo, orchestral, noble',
-                'tuba': 'tuba solo, orchestral, deep and resonant',
-                'cymbals': 'cymbal crashes, orchestral, shimmering',
-                'timpani': 'timpani rolls, orchestral, thunderous',
-                'bass_drum': 'bass drum hits, orchestral, powerful',
-                'organ': 'pipe organ, classical, grand and resonant',
-                'accordion': 'accordion melody, folk, lively',
-                'celesta': 'celesta glissando, classical, tinkling',
-                'marimba': 'marimba solo, contemporary, wooden tones',
-                'male_voice': 'male vocal solo, classical, operatic',
-                'female_voice': 'female vocal solo, classical, lyrical',
-                'choir': 'choir singing, classical, harmonious',
-                'synth_lead': 'synthesizer lead, electronic, bright',
-                'synth_pad': 'synthesizer pad, ambient, lush',
-                'bass_synth': 'synthesizer bass, electronic, deep',
-                'drum_machine': 'electronic drum machine, techno, mechanical'
-            }
-
-            # Get the prompt for this instrument, or use a generic one
-            prompt = instrument_prompts.get(instrument, f'{instrument} solo, musical instrument')
-
-        print(f"Generating {duration}s of audio for {instrument} with prompt: '{prompt}'")
-
-        # Generate the audio
-        wav = model.generate([prompt], progress=True)
-
-        print(f"Generated wav type: {type(wav)}, length: {len(wav)}")
-        print(f"wav[0] type: {type(wav[0])}, shape: {wav[0].shape}, dtype: {wav[0].dtype}")
-
-        # Save the audio directly using soundfile
-        import soundfile as sf
-        import numpy as np
-
-        # Get the audio tensor and convert to numpy
-        audio_tensor = wav[0]
-        if hasattr(audio_tensor, 'cpu'):
-            audio_tensor = audio_tensor.cpu()
-
-        print(f"audio_tensor shape after cpu: {audio_tensor.shape}")
-
-        # Convert to numpy array and ensure correct shape
-        audio_data = audio_tensor.numpy()
-        print(f"audio_data shape: {audio_data.shape}, dtype: {audio_data.dtype}")
+        with open(sidecar_path(job['output']), 'w', encoding='utf-8') as f:
+            json.dump(sidecar, f, indent=2)
+    except OSError as e:
+        print(f"Warning: failed to write sidecar for {job['output']}: {e}")
 
-        if len(audio_data.shape) == 1:
-            audio_data = audio_data.reshape(1, -1)  # Add channel dimension if mono
-        elif len(audio_data.shape) > 2:
-            audio_data = audio_data.squeeze()  # Remove extra dimensions
 
-        # Ensure it's 2D (channels, samples)
-        if len(audio_data.shape) == 1:
-            audio_data = audio_data.reshape(1, -1)
+def save_audio(pcm, output_path: str, sample_rate: int):
+    """Encode one post-processed (channels, samples) item as WAV.
 
-        print(f"audio_data final shape: {audio_data.shape}")
+    `pcm` comes from `audio_postprocess.postprocess` (int16 or float32). Writes the
+    WAV atomically to `output_path` (if given) and returns the encoded bytes, or
+    None on failure.
+    """
+    try:
+        import soundfile as sf
 
-        # Normalize
-        max_val = np.max(np.abs(audio_data))
-        if max_val > 0:
-            audio_data = audio_data / max_val
+        subtype = 'FLOAT' if pcm.dtype.kind == 'f' else 'PCM_16'
+        # soundfile expects (samples, channels); the transpose is a view
+        audio_data = pcm.T
 
-        # Convert to int16 for WAV format
-        audio_data = (audio_data * 32767).astype(np.int16)
+        # Encode once in memory; the same bytes are written to disk and, for worker
+        # requests with return_audio, sent back to the caller.
+        buf = io.BytesIO()
+        sf.write(buf, audio_data, sample_rate, format='WAV', subtype=subtype)
+        encoded = buf.getvalue()
 
-        # Transpose to (samples, channels) for soundfile
-        audio_data = audio_data.T
+        if output_path:
+            write_atomic(output_path, encoded)
+            print(f"Wrote {len(encoded)} bytes to {output_path}")
+        return encoded
+    except Exception as e:
+        print(f"Error saving audio to {output_path}: {e}", file=sys.stderr)
+        return None
 
-        print(f"About to call sf.write with path: {repr(output_path)}")
-        print(f"Current working directory: {os.getcwd()}")
-        print(f"Absolute path: {os.path.abspath(output_path)}")
 
-        # Write to a safe temp location first
-        temp_path = f"/tmp/audio_{os.path.basename(output_path)}"
-        print(f"Writing to safe temp path: {temp_path}")
-        sf.write(temp_path, audio_data, model.sample_rate)
+def write_atomic(path: str, data: bytes):
+    """Write `data` to `path` via a temp file in the same directory and an atomic rename.
 
-        if os.path.exists(temp_path):
-            print(f"Temp file created successfully, size: {os.path.getsize(temp_path)}")
-        else:
-            print("Temp file was not created!")
-            return False
-
-        # Now copy to final location using shell command
-        import subprocess
+    Readers (including other containers sharing the volume) never observe a partial file,
+    and the data is written exactly once.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
         try:
-            result = subprocess.run(['cp', temp_path, output_path], check=True, capture_output=True, text=True)
-            print(f"Shell copy completed successfully")
-        except subprocess.CalledProcessError as e:
-            print(f"Shell copy failed: {e}")
-            print(f"stderr: {e.stderr}")
-            return False
-
-        # Verify the final file exists
-        if os.path.exists(output_path):
-            print(f"Final file created successfully, size: {os.path.getsize(output_path)}")
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def make_job(instrument: str, output: str = None, duration: int = 5, prompt: str = None, seed: int = None,
+             params: dict = None, model: str = None, accel: str = None) -> dict:
+    """Normalize a generation job: {instrument, prompt, duration, output, seed, model, accel, <sampling params>}.
+
+    `model` selects the MusicGen variant for this job (None uses the caller's default);
+    `accel` its inference mode (see musicgen_inference.ACCEL_MODES, None = float32).
+    """
+    if accel not in (None,) + ACCEL_MODES:
+        raise ValueError(f"Unknown accel mode {accel!r}; expected one of {', '.join(ACCEL_MODES)}")
+    job = {
+        'instrument': instrument,
+        'prompt': prompt or build_prompt(instrument),
+        'duration': int(duration),
+        'output': output or default_output_path(instrument),
+        'seed': None if seed is None else int(seed),
+        'model': canonical_name(model) if model else None,
+        'accel': None if accel == 'none' else accel,
+    }
+    for name, default in GENERATION_PARAMS.items():
+        value = (params or {}).get(name)
+        job[name] = type(default)(default if value is None else value)
+    return job
+
+
+def job_from_dict(entry: dict, defaults: dict = None) -> dict:
+    """Build a job from a manifest/request entry, filling missing fields from `defaults`."""
+    if not isinstance(entry, dict) or not entry.get('instrument'):
+        raise ValueError(f"Job without an instrument: {entry!r}")
+    defaults = defaults or {}
+    merged = {**defaults, **{k: v for k, v in entry.items() if v is not None}}
+    return make_job(
+        merged['instrument'],
+        merged.get('output'),
+        merged.get('duration', 5),
+        merged.get('prompt'),
+        merged.get('seed'),
+        {name: merged.get(name) for name in GENERATION_PARAMS},
+        merged.get('model'),
+        merged.get('accel'),
+    )
+
+
+def load_manifest(path: str, defaults: dict = None) -> list:
+    """Load a JSON manifest: a list of jobs, or an object with a "jobs" list.
+
+    Each job is {"instrument", "prompt"?, "duration"?, "output"?, "seed"?, "model"?, "accel"?, "temperature"?,
+    "top_k"?, "top_p"?, "cfg_coef"?}; missing fields come from `defaults`.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('jobs', [])
+    if not isinstance(data, list):
+        raise ValueError(f"Manifest {path} must contain a list of jobs")
+    return [job_from_dict(entry, defaults) for entry in data]
+
+
+def generate_batch(jobs: list, model=None, max_batch_size: int = 8, model_name: str = DEFAULT_MODEL,
+                   cache: StemCache = None, audio_out: dict = None, postprocess_config: dict = None,
+                   slot: int = 0) -> list:
+    """Generate several stems, one `model.generate` call per group of compatible jobs.
+
+    MusicGen applies one duration and one set of sampling parameters per call, so jobs
+    are grouped by those and each group is decoded as a single batch (split into chunks
+    of `max_batch_size` to bound memory). Seeded jobs are decoded one per call with RNG
+    state reseeded first: sampling draws from one RNG stream for the whole batch, so a
+    batched row would otherwise depend on its batch mates. Jobs already present in
+    `cache` are copied from it and never reach the model. Jobs are also grouped by their
+    `model` (default `model_name`); each model is taken from the warm pool for worker
+    `slot` only when one of its jobs needs generating. Each decoded batch goes
+    through `audio_postprocess.postprocess` in place (see `postprocess_config`). Every written WAV gets a
+    sidecar JSON describing how it was produced. When `audio_out` is given, the encoded
+    WAV bytes of each successful job are stored in it by job index. Returns one success
+    flag per job, in input order.
+    """
+    results = [False] * len(jobs)
+    params = [job_cache_params(job, model_name, postprocess_config) for job in jobs]
+    keys = [cache_key(p) for p in params]
+    pending = []
+    for idx, job in enumerate(jobs):
+        if cache is not None and cache.get(keys[idx], job['output']):
+            print(f"Cache hit for {job['instrument']}: {job['output']}")
+            write_sidecar(job, params[idx], keys[idx], 'cache')
+            if audio_out is not None:
+                with open(job['output'], 'rb') as f:
+                    audio_out[idx] = f.read()
+            results[idx] = True
         else:
-            print("Final file does not exist after copy!")
-            return False
-
-        print(f"Successfully generated audio for {instrument} at {output_path}")
+            pending.append(idx)
+    if not pending:
+        return results
+
+    groups = {}
+    for idx in pending:
+        job = jobs[idx]
+        group = (params[idx]['model'], job.get('accel') or 'none', job['duration'], job['seed']) + tuple(
+            job[name] for name in GENERATION_PARAMS)
+        groups.setdefault(group, []).append(idx)
+
+    # Group jobs of one model together so a model is fetched from the pool once per batch
+    for group, indices in sorted(groups.items(), key=lambda item: item[0][:2]):
+        first = jobs[indices[0]]
+        seed = first['seed']
+        try:
+            group_model = model if model is not None else get_model(group[0], slot, group[1])
+        except Exception as e:
+            print(f"Error loading MusicGen model {group[0]}: {e}", file=sys.stderr)
+            continue
+        step = 1 if seed is not None else max(1, max_batch_size)
+        for start in range(0, len(indices), step):
+            chunk = indices[start:start + step]
+            prompts = [jobs[i]['prompt'] for i in chunk]
+            names = ', '.join(jobs[i]['instrument'] for i in chunk)
+            print(f"Generating {first['duration']}s of audio for {len(chunk)} job(s) [{names}] (seed={seed})")
+            try:
+                wav = generate_audio(group_model, prompts, first)
+                pcm = postprocess(wav, group_model.sample_rate, postprocess_config)
+            except Exception as e:
+                print(f"Error generating audio for [{names}]: {e}", file=sys.stderr)
+                continue
+            for pos, i in enumerate(chunk):
+                job = jobs[i]
+                encoded = save_audio(pcm[pos], job['output'], group_model.sample_rate)
+                results[i] = encoded is not None
+                if results[i]:
+                    if audio_out is not None:
+                        audio_out[i] = encoded
+                    print(f"Successfully generated audio for {job['instrument']} at {job['output']}")
+                    write_sidecar(job, params[i], keys[i], 'generated')
+                    if cache is not None:
+                        try:
+                            cache.put(keys[i], job['output'], params[i])
+                        except OSError as e:
+                            print(f"Warning: failed to cache {job['output']}: {e}")
+    return results
+
+
+def generate_streaming(job: dict, model=None, model_name: str = DEFAULT_MODEL, chunk_seconds: float = 10.0,
+                       context_seconds: float = 5.0, slot: int = 0) -> bool:
+    """Generate a long stem window by window, appending each window to the output as it is ready.
+
+    Windows come from `musicgen_inference.generate_windows`, so only `context_seconds`
+    of audio is kept in memory. The WAV header is written up front with
+    the final length, so `job['output']` may be a FIFO or a file another process is
+    already reading. Peak normalization needs the whole signal, so streamed audio is
+    clipped to [-1, 1] instead. Streamed stems are not cached.
+    """
+    try:
+        if model is None:
+            model = get_model(job.get('model') or model_name, slot, job.get('accel'))
+        sample_rate = model.sample_rate
+        total = int(job['duration'] * sample_rate)
+        windows = generate_windows(model, job, chunk_seconds, context_seconds)
+        print(f"Streaming {job['duration']}s of audio for {job['instrument']} in {chunk_seconds}s windows")
+        chunk = next(windows)
+        written = 0
+
+        with wave.open(job['output'], 'wb') as out:
+            out.setnchannels(chunk.shape[0])
+            out.setsampwidth(2)
+            out.setframerate(sample_rate)
+            out.setnframes(total)
+            for chunk in itertools.chain([chunk], windows):
+                out.writeframes(_pcm16_frames(chunk))
+                written += chunk.shape[-1]
+                print(f"Streamed {written / sample_rate:.1f}/{job['duration']}s to {job['output']}")
+            if written < total:
+                # Keep the header's declared length truthful for non-seekable outputs
+                out.writeframes(b'\0' * (total - written) * 2 * out.getnchannels())
         return True
-
     except Exception as e:
-        print(f"Error generating audio for {instrument}: {e}", file=sys.stderr)
+        print(f"Error streaming audio for {job['instrument']}: {e}", file=sys.stderr)
         return False
 
-def main():
-    parser = argparse.ArgumentParser(description="Generate instrument audio using MusicGen")
-    parser.add_argument('--instrument', help='Instrument name')
-    parser.add_argument('--instrument-file', help='File containing instrument name/description')
-    parser.add_argument('--output', required=False, help='Output WAV file path (default: generated/instruments/)')
-    parser.add_argument('--duration', type=int, default=5, help='Duration in seconds')
 
-    args = parser.parse_args()
+def _pcm16_frames(audio_tensor) -> bytes:
+    """Convert a (channels, samples) float tensor into interleaved 16-bit PCM frames."""
+    import numpy as np
+    import torch
 
-    # Ensure exactly one of --instrument or --instrument-file is provided
-    if not args.instrument and not args.instrument_file:
-        parser.error("Either --instrument or --instrument-file must be provided")
-    if args.instrument and args.instrument_file:
-        parser.error("Cannot specify both --instrument and --instrument-file")
+    data = audio_tensor.detach().cpu().clamp(-1.0, 1.0).mul(32767).to(torch.int16).numpy()
+    return np.ascontiguousarray(data.T).tobytes()
 
-    # Read instrument from file if specified
-    if args.instrument_file:
-        try:
-            with open(args.instrument_file, 'r') as f:
-                args.instrument = f.read().strip()
-        except Exception as e:
-            print(f"Error reading instrument file {args.instrument_file}: {e}", file=sys.stderr)
-            return False
 
-    print(f"Raw args.output: {repr(args.output)}")
-    print(f"Current working directory: {os.getcwd()}")
-
-    # Set default output path if not provided
-    if not args.output:
-        timestamp = datetime.now().strftime('%Y-%m-%dT%H-%M-%S')
-        args.output = f'/workspace/generated/instruments/{timestamp}_{args.instrument}.wav'
+def generate_instrument_audio(instrument: str, output_path: str, duration: int = 5, model=None,
+                              cache: StemCache = None, seed: int = None) -> bool:
+    print(f"DEBUG: generate_instrument_audio called with instrument='{instrument}', output_path='{output_path}', duration={duration}")
+    job = make_job(instrument, output_path, duration, seed=seed)
+    print(f"Generating {duration}s of audio for {instrument} with prompt: '{job['prompt']}'")
+    return generate_batch([job], model=model, cache=cache)[0]
 
-    print(f"Final args.output: {repr(args.output)}")
 
+def prepare_output_path(output: str) -> str:
+    """Ensure the output directory exists, returning the (possibly absolutized) output path."""
     # Ensure output directory exists - force Linux path
-    output_dir = os.path.dirname(args.output)
+    output_dir = os.path.dirname(output)
     print(f"os.path.dirname result: {repr(output_dir)}")
 
     if output_dir and output_dir != '/' and output_dir != '.':
@@ -270,21 +392,398 @@ def main():
             print(f"Trying absolute path: {abs_output_dir}")
             try:
                 os.makedirs(abs_output_dir, exist_ok=True)
-                args.output = os.path.join(abs_output_dir, os.path.basename(args.output))
-                print(f"Used absolute path, new output: {args.output}")
+                output = os.path.join(abs_output_dir, os.path.basename(output))
+                print(f"Used absolute path, new output: {output}")
             except Exception as e2:
                 print(f"Absolute path creation also failed: {e2}")
     else:
         print(f"No directory creation needed for: {output_dir}")
+    return output
+
+
+def run_generation_request(req: dict, slot: int = 0) -> dict:
+    """Run one queued `/generate` or `/jobs` request on worker `slot`.
+
+    `req['jobs']` holds resolved jobs; generated WAV bytes go to `req['audio_out']`
+    when the caller asked for them.
+    """
+    jobs = req['jobs']
+    if req.get('stream'):
+        # The output file grows while the request is running, so callers can start
+        # reading it before the reply arrives.
+        flags = [generate_streaming(jobs[0], chunk_seconds=float(req.get('chunk_seconds', 10.0)),
+                                    context_seconds=float(req.get('context_seconds', 5.0)), slot=slot)]
+    else:
+        flags = generate_batch(jobs, cache=req.get('cache'), audio_out=req.get('audio_out'),
+                               postprocess_config=req.get('postprocess'), slot=slot)
+    return {
+        'success': all(flags),
+        'results': [{'instrument': job['instrument'], 'output': job['output'], 'success': ok}
+                    for job, ok in zip(jobs, flags)],
+    }
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front-end for the warm MusicGen worker.
+
+    GET  /health       -> {"status": "ok", "models": [...], "queue": {...}}
+    GET  /cache/stats  -> stem cache hit/miss statistics
+    POST /generate     -> body {"instrument", "output"?, "duration"?, "prompt"?, "seed"?, "model"?, <sampling params>?}
+                          or   {"jobs": [{...same fields...}, ...]}
+                          single jobs may add "stream": true (plus "chunk_seconds"/"context_seconds")
+                          "postprocess": {...} overrides audio_postprocess.DEFAULT_POSTPROCESS
+                          "return_audio": true replies with the WAV bytes (audio/wav for a single
+                          job, "audio_base64" per result for "jobs")
+                          "job_id": "<id>" names the queued job, so its status can be polled
+                          on /jobs/<id> while /generate is still waiting (409 if taken)
+                          reply {"success", "results": [{"instrument", "output", "success"}, ...]}
+    POST /jobs         -> same body as /generate (without "return_audio"); queues it and replies
+                          202 with the job status instead of waiting
+    GET  /jobs         -> queue statistics (slots, running, queued, ...)
+    GET  /jobs/<id>    -> {"id", "status", "position", "eta_seconds", "progress", "result", ...}
+
+    Requests run on the worker's job queue; when it is full, /generate and /jobs
+    reply 503 with a Retry-After header instead of starting another generation.
+    """
+
+    # Stem cache shared by all requests (None disables caching); set by serve().
+    cache = None
+    # job_queue.JobQueue running generations on a fixed number of slots; set by serve().
+    queue = None
+    # Model used for jobs that do not name one; set by serve().
+    default_model = DEFAULT_MODEL
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        self._send_bytes(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw.decode('utf-8') or '{}')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'models': MODEL_POOL.loaded(), 'pool': MODEL_POOL.stats(),
+                                  'queue': self.queue.stats()})
+            return
+        if self.path == '/cache/stats':
+            if self.cache is None:
+                self._send_json(404, {'error': 'Stem cache disabled'})
+            else:
+                self._send_json(200, self.cache.stats())
+            return
+        if self.path == '/jobs':
+            self._send_json(200, self.queue.stats())
+            return
+        if self.path.startswith('/jobs/'):
+            status = self.queue.status(self.path[len('/jobs/'):])
+            if status is None:
+                self._send_json(404, {'error': 'Unknown job'})
+            else:
+                self._send_json(200, status)
+            return
+        self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path not in ('/generate', '/jobs'):
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        try:
+            req = self._read_json()
+            entries = req['jobs'] if 'jobs' in req else [req]
+            jobs = [job_from_dict(entry, {'model': self.default_model, 'accel': DEFAULT_ACCEL}) for entry in entries]
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            self._send_json(400, {'error': f'Invalid request: {e}'})
+            return
+        for job in jobs:
+            job['output'] = prepare_output_path(job['output'])
+        if req.get('stream') and len(jobs) != 1:
+            self._send_json(400, {'error': 'stream requires a single job'})
+            return
+        job_id = req.get('job_id')
+        if job_id is not None and not (isinstance(job_id, str) and JOB_ID_PATTERN.fullmatch(job_id)):
+            self._send_json(400, {'error': 'job_id must be 1-64 letters, digits, "_", "." or "-"'})
+            return
+
+        wait = self.path == '/generate'
+        audio = {} if wait and req.get('return_audio') and not req.get('stream') else None
+        work = {
+            'jobs': jobs,
+            'stream': req.get('stream'),
+            'chunk_seconds': req.get('chunk_seconds', 10.0),
+            'context_seconds': req.get('context_seconds', 5.0),
+            'postprocess': req.get('postprocess'),
+            'cache': self.cache,
+            'audio_out': audio,
+            'audio_seconds': sum(job['duration'] for job in jobs),
+        }
+        try:
+            status = self.queue.submit(work, job_id)
+        except QueueFull as e:
+            self._send_json(503, {'error': str(e), 'retry_after': e.retry_after},
+                            {'Retry-After': str(max(1, int(e.retry_after)))})
+            return
+        except ValueError as e:
+            self._send_json(409, {'error': str(e)})
+            return
+        if not wait:
+            self._send_json(202, status, {'Location': f"/jobs/{status['id']}"})
+            return
+
+        status = self.queue.wait(status['id'])
+        result = status['result'] or {'success': False, 'results': [
+            {'instrument': job['instrument'], 'output': job['output'], 'success': False} for job in jobs]}
+        if audio is not None:
+            if 'jobs' not in req and result['success']:
+                # Single job: reply with the WAV itself so the caller never re-reads the file
+                self._send_bytes(200, audio[0], 'audio/wav')
+                return
+            for i, entry in enumerate(result['results']):
+                entry['audio_base64'] = base64.b64encode(audio[i]).decode('ascii') if i in audio else None
+        self._send_json(200 if result['success'] else 500, {**result, 'job_id': status['id']})
+
+    def log_message(self, format, *args):
+        print(f"[musicgen-server] {self.address_string()} {format % args}")
+
+
+def serve(host: str = DEFAULT_SERVER_HOST, port: int = DEFAULT_SERVER_PORT, model_name: str = DEFAULT_MODEL,
+          cache: StemCache = None, slots: int = DEFAULT_WORKER_SLOTS, max_queued: int = DEFAULT_MAX_QUEUED):
+    """Load one model per slot and serve generation requests until interrupted."""
+    # Every slot needs its default model resident at once
+    MODEL_POOL.max_models = max(MODEL_POOL.max_models, slots)
+    for slot in range(slots):
+        get_model(model_name, slot)
+    GenerationRequestHandler.cache = cache
+    GenerationRequestHandler.default_model = model_name
+    GenerationRequestHandler.queue = JobQueue(run_generation_request, slots=slots, max_queued=max_queued)
+    server = ThreadingHTTPServer((host, port), GenerationRequestHandler)
+    print(f"MusicGen worker listening on http://{host}:{port} (model: {model_name}, slots: {slots}, "
+          f"queue limit: {max_queued})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("MusicGen worker shutting down")
+    finally:
+        server.server_close()
+
+
+def request_generation(server_url: str, jobs: list, postprocess_config: dict = None, timeout: float = 600.0,
+                       max_retries: int = DEFAULT_SERVER_MAX_RETRIES) -> list:
+    """Ask a running `--serve` worker to generate the given jobs; returns one flag per job.
+
+    A 503 (the worker's queue is full) is retried after its Retry-After, up to
+    `max_retries` times. Raises urllib.error.URLError (or OSError) if the worker
+    cannot be reached so the caller can fall back to in-process generation.
+    """
+    body = json.dumps({'jobs': jobs, 'postprocess': postprocess_config}).encode('utf-8')
+    for attempt in itertools.count():
+        req = urllib.request.Request(
+            server_url.rstrip('/') + '/generate',
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                result = json.loads(resp.read().decode('utf-8'))
+            break
+        except urllib.error.HTTPError as e:
+            payload = e.read().decode('utf-8', errors='replace')
+            if e.code == 503 and attempt < max_retries:
+                try:
+                    wait = max(0.0, float(e.headers.get('Retry-After', 5)))
+                except ValueError:
+                    wait = 5.0
+                print(f"MusicGen worker busy; retrying in {wait:g}s ({attempt + 1}/{max_retries})")
+                time.sleep(wait)
+                continue
+            # The worker answered but generation failed; do not retry locally.
+            print(f"MusicGen worker returned HTTP {e.code}: {payload}", file=sys.stderr)
+            try:
+                result = json.loads(payload)
+            except ValueError:
+                return [False] * len(jobs)
+            break
+    flags = [bool(r.get('success')) for r in result.get('results', [])]
+    return flags if len(flags) == len(jobs) else [False] * len(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate instrument audio using MusicGen")
+    parser.add_argument('--instrument', help='Instrument name')
+    parser.add_argument('--instrument-file', help='File containing instrument name/description')
+    parser.add_argument('--instruments', help='Comma-separated instrument names to generate as one batch')
+    parser.add_argument('--manifest', help='JSON manifest of {instrument, prompt, duration, output} jobs to generate as a batch')
+    parser.add_argument('--output', required=False, help='Output WAV file path (default: generated/instruments/)')
+    parser.add_argument('--output-dir', help='Output directory for --instruments (default: generated/instruments/)')
+    parser.add_argument('--duration', type=int, default=5, help='Duration in seconds')
+    parser.add_argument('--batch-size', type=int, default=8, help='Maximum prompts per model.generate call')
+    parser.add_argument('--seed', type=int, help='Seed torch/numpy RNG state for reproducible output')
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help='MusicGen variant (small, medium, melody), Hugging Face id or local directory')
+    parser.add_argument('--accel', choices=ACCEL_MODES, default=DEFAULT_ACCEL,
+                        help='Inference mode: none (float32), cpu (int8 dynamic quantization, quota-sized '
+                             'threads, inference_mode) or cpu-compile (cpu plus torch.compile)')
+    parser.add_argument('--max-models', type=int, default=MODEL_POOL.max_models,
+                        help='Models kept loaded at once; the least recently used is unloaded beyond this')
+    parser.add_argument('--model-memory-bytes', type=int, default=MODEL_POOL.max_bytes,
+                        help='Resident model memory budget in bytes (0 = no limit)')
+    parser.add_argument('--normalize', choices=('peak', 'lufs', 'none'), default=DEFAULT_POSTPROCESS['normalize'],
+                        help='Loudness normalization applied after generation')
+    parser.add_argument('--peak-db', type=float, default=DEFAULT_POSTPROCESS['peak_db'], help='Target peak (dBFS) for --normalize peak')
+    parser.add_argument('--target-lufs', type=float, default=DEFAULT_POSTPROCESS['lufs'], help='Target loudness for --normalize lufs')
+    parser.add_argument('--fade-in-ms', type=float, default=DEFAULT_POSTPROCESS['fade_in_ms'], help='Fade-in length (ms)')
+    parser.add_argument('--fade-out-ms', type=float, default=DEFAULT_POSTPROCESS['fade_out_ms'], help='Fade-out length (ms)')
+    parser.add_argument('--dc-remove', action='store_true', help='Remove DC offset before normalization')
+    parser.add_argument('--dither', action='store_true', help='Apply TPDF dither before integer conversion')
+    parser.add_argument('--output-dtype', choices=('int16', 'float32'), default=DEFAULT_POSTPROCESS['dtype'],
+                        help='Sample format of the written WAV')
+    parser.add_argument('--stream', action='store_true',
+                        help='Generate in windows and append each to --output (file or FIFO) as soon as it is ready')
+    parser.add_argument('--chunk-seconds', type=float, default=10.0, help='Window length for --stream')
+    parser.add_argument('--context-seconds', type=float, default=5.0,
+                        help='Trailing audio used to prompt each continuation window with --stream')
+    parser.add_argument('--temperature', type=float, default=GENERATION_PARAMS['temperature'], help='Sampling temperature')
+    parser.add_argument('--top-k', type=int, default=GENERATION_PARAMS['top_k'], help='Top-k sampling cutoff')
+    parser.add_argument('--top-p', type=float, default=GENERATION_PARAMS['top_p'], help='Top-p sampling cutoff (0 disables)')
+    parser.add_argument('--cfg-coef', type=float, default=GENERATION_PARAMS['cfg_coef'], help='Classifier-free guidance coefficient')
+    parser.add_argument('--serve', action='store_true', help='Run as a long-lived worker that keeps the model loaded')
+    parser.add_argument('--host', default=DEFAULT_SERVER_HOST, help='Worker bind address (with --serve)')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('MUSICGEN_SERVER_PORT', DEFAULT_SERVER_PORT)),
+                        help='Worker port (with --serve)')
+    parser.add_argument('--slots', type=int, default=DEFAULT_WORKER_SLOTS,
+                        help='Concurrent generations in the worker, one model instance each (with --serve)')
+    parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED,
+                        help='Requests allowed to wait for a slot before the worker replies 503 (with --serve)')
+    parser.add_argument('--server', default=os.environ.get('MUSICGEN_SERVER_URL'),
+                        help='URL of a running --serve worker to send the request to (e.g. http://127.0.0.1:8765)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Generated stem cache directory')
+    parser.add_argument('--cache-max-bytes', type=int, default=DEFAULT_MAX_BYTES, help='Stem cache size cap (LRU eviction)')
+    parser.add_argument('--no-cache', action='store_true', help='Always generate; do not read or write the stem cache')
+    parser.add_argument('--cache-stats', action='store_true', help='Print stem cache hit/miss statistics and exit')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the resolved jobs and whether each is already cached, without loading MusicGen')
+
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else StemCache(args.cache_dir, args.cache_max_bytes)
+    MODEL_POOL.max_models = max(1, args.max_models)
+    MODEL_POOL.max_bytes = args.model_memory_bytes
 
-    success = generate_instrument_audio(args.instrument, args.output, args.duration)
+    if args.cache_stats:
+        print(json.dumps(StemCache(args.cache_dir, args.cache_max_bytes).stats(), indent=2))
+        sys.exit(0)
 
-    if success:
-        print(f"Audio generation completed: {args.output}")
+    if args.serve:
+        serve(args.host, args.port, model_name=args.model, cache=cache, slots=args.slots, max_queued=args.max_queued)
         sys.exit(0)
+
+    # Ensure exactly one job source is provided
+    sources = [s for s in (args.instrument, args.instrument_file, args.instruments, args.manifest) if s]
+    if not sources:
+        parser.error("One of --instrument, --instrument-file, --instruments or --manifest must be provided")
+    if len(sources) > 1:
+        parser.error("Specify only one of --instrument, --instrument-file, --instruments or --manifest")
+
+    # Read instrument from file if specified
+    if args.instrument_file:
+        try:
+            with open(args.instrument_file, 'r') as f:
+                args.instrument = f.read().strip()
+        except Exception as e:
+            print(f"Error reading instrument file {args.instrument_file}: {e}", file=sys.stderr)
+            return False
+
+    defaults = {
+        'duration': args.duration,
+        'seed': args.seed,
+        'model': args.model,
+        'accel': args.accel,
+        'temperature': args.temperature,
+        'top_k': args.top_k,
+        'top_p': args.top_p,
+        'cfg_coef': args.cfg_coef,
+    }
+    if args.manifest:
+        try:
+            jobs = load_manifest(args.manifest, defaults)
+        except (OSError, ValueError) as e:
+            print(f"Error reading manifest {args.manifest}: {e}", file=sys.stderr)
+            sys.exit(2)
+    elif args.instruments:
+        names = [n.strip() for n in args.instruments.split(',') if n.strip()]
+        jobs = [
+            job_from_dict({'instrument': n, 'output': os.path.join(args.output_dir, f'{n}.wav') if args.output_dir else None},
+                          defaults)
+            for n in names
+        ]
     else:
-        print(f"Audio generation failed for {args.instrument}", file=sys.stderr)
-        sys.exit(1)
+        print(f"Raw args.output: {repr(args.output)}")
+        print(f"Current working directory: {os.getcwd()}")
+        jobs = [job_from_dict({'instrument': args.instrument, 'output': args.output}, defaults)]
+        print(f"Final args.output: {repr(jobs[0]['output'])}")
+
+    if args.stream:
+        if len(jobs) != 1:
+            parser.error("--stream generates a single stem; use --instrument or --instrument-file")
+        job = jobs[0]
+        job['output'] = prepare_output_path(job['output'])
+        ok = generate_streaming(job, chunk_seconds=args.chunk_seconds, context_seconds=args.context_seconds)
+        if ok and os.path.isfile(job['output']):
+            params = job_cache_params(job, DEFAULT_MODEL)
+            write_sidecar(job, {**params, 'stream': {'chunk_seconds': args.chunk_seconds,
+                                                     'context_seconds': args.context_seconds}},
+                          None, 'streamed')
+        if ok:
+            print(f"Audio generation completed: {job['output']}")
+        else:
+            print(f"Audio generation failed for {job['instrument']}", file=sys.stderr)
+        sys.exit(0 if ok else 1)
+
+    postprocess_config = {
+        'dc_remove': args.dc_remove,
+        'normalize': args.normalize,
+        'peak_db': args.peak_db,
+        'lufs': args.target_lufs,
+        'fade_in_ms': args.fade_in_ms,
+        'fade_out_ms': args.fade_out_ms,
+        'dither': args.dither,
+        'dtype': args.output_dtype,
+    }
+    if args.dry_run:
+        for job in jobs:
+            params = job_cache_params(job, DEFAULT_MODEL, postprocess_config)
+            key = cache_key(params)
+            print(json.dumps({**job, 'cache_key': key, 'cached': bool(cache and cache.contains(key))}))
+        sys.exit(0)
+
+    flags = None
+    if args.server:
+        try:
+            flags = request_generation(args.server, jobs, postprocess_config)
+        except (urllib.error.URLError, OSError) as e:
+            print(f"MusicGen worker at {args.server} unreachable ({e}); generating in-process")
+
+    if flags is None:
+        for job in jobs:
+            job['output'] = prepare_output_path(job['output'])
+        flags = generate_batch(jobs, max_batch_size=args.batch_size, cache=cache, postprocess_config=postprocess_config)
+
+    for job, ok in zip(jobs, flags):
+        if ok:
+            print(f"Audio generation completed: {job['output']}")
+        else:
+            print(f"Audio generation failed for {job['instrument']}", file=sys.stderr)
+    sys.exit(0 if all(flags) else 1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Bounded generation job queue for the MusicGen worker.
+
+A fixed number of inference slots (worker threads) pull jobs from a FIFO
+queue. The queue has a hard cap: `submit()` raises `QueueFull` instead of
+accepting unbounded work, so callers get backpressure rather than a pile of
+concurrent model loads. Every job keeps a status record (queued, running,
+done, failed) with its queue position and an estimated time remaining, based
+on the observed seconds of wall time per second of generated audio.
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Wall-clock seconds per second of generated audio assumed before any job has
+# finished (MusicGen small on CPU is roughly this slow).
+DEFAULT_SECONDS_PER_AUDIO_SECOND = 4.0
+# Finished job records kept for status lookups.
+MAX_FINISHED_JOBS = 256
+
+
+class QueueFull(Exception):
+    """Raised by `JobQueue.submit` when the queue is at capacity."""
+
+    def __init__(self, max_queued: int, retry_after: float):
+        super().__init__(f"Generation queue is full ({max_queued} jobs waiting)")
+        self.retry_after = round(retry_after, 1)
+
+
+class JobQueue:
+    """FIFO of generation jobs served by `slots` worker threads.
+
+    `runner(payload, slot)` does the work for one job and returns its result
+    dict; it runs on slot thread `slot` (0 .. slots-1), so a runner can keep
+    per-slot state such as a dedicated model instance. A job's expected cost
+    is `payload['audio_seconds']` (default 1) and is used for ETAs.
+    """
+
+    def __init__(self, runner, slots: int = 1, max_queued: int = 16):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.runner = runner
+        self.slots = slots
+        self.max_queued = max_queued
+        self.seconds_per_audio_second = DEFAULT_SECONDS_PER_AUDIO_SECOND
+        self._pending = deque()
+        self._jobs = OrderedDict()
+        self._cond = threading.Condition()
+        self._counter = itertools.count(1)
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        self._threads = [
+            threading.Thread(target=self._work, args=(slot,), name=f'musicgen-slot-{slot}', daemon=True)
+            for slot in range(slots)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, payload: dict, job_id: str = None) -> dict:
+        """Queue `payload` and return its status record. Raises `QueueFull` at capacity.
+
+        `job_id` lets the caller pick the id (so it can poll the status while it
+        waits); a ValueError is raised if that id is already known.
+        """
+        with self._cond:
+            if job_id is not None and job_id in self._jobs:
+                raise ValueError(f"Job id {job_id!r} is already in use")
+            if len(self._pending) >= self.max_queued:
+                self._stats['rejected'] += 1
+                raise QueueFull(self.max_queued, self._eta_locked(len(self._pending)))
+            job_id = job_id or f'{next(self._counter)}-{uuid.uuid4().hex[:8]}'
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'audio_seconds': float(payload.get('audio_seconds') or 1.0),
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'payload': payload,
+                'done': threading.Event(),
+            }
+            self._pending.append(job_id)
+            self._stats['submitted'] += 1
+            self._cond.notify()
+            return self._status_locked(job_id)
+
+    def wait(self, job_id: str, timeout: float = None) -> dict:
+        """Block until `job_id` finishes (or `timeout` elapses) and return its status."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job['done'].wait(timeout)
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> dict:
+        """Return the status record for `job_id`, or None if it is unknown or expired."""
+        with self._cond:
+            if job_id not in self._jobs:
+                return None
+            return self._status_locked(job_id)
+
+    def stats(self) -> dict:
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job['status'] == 'running')
+            return {
+                **self._stats,
+                'slots': self.slots,
+                'running': running,
+                'queued': len(self._pending),
+                'max_queued': self.max_queued,
+                'seconds_per_audio_second': round(self.seconds_per_audio_second, 3),
+            }
+
+    def _status_locked(self, job_id: str) -> dict:
+        job = self._jobs[job_id]
+        status = {key: job[key] for key in ('id', 'status', 'submitted_at', 'started_at', 'finished_at',
+                                            'result', 'error')}
+        expected = job['audio_seconds'] * self.seconds_per_audio_second
+        if job['status'] == 'queued':
+            position = self._pending.index(job_id)
+            status['position'] = position + 1
+            status['eta_seconds'] = round(self._eta_locked(position) + expected, 1)
+            status['progress'] = 0.0
+        elif job['status'] == 'running':
+            elapsed = time.time() - job['started_at']
+            status['position'] = 0
+            status['eta_seconds'] = round(max(expected - elapsed, 0.0), 1)
+            # Never report 100% before the job has actually finished
+            status['progress'] = round(min(elapsed / expected, 0.99), 3) if expected > 0 else 0.0
+        else:
+            status['position'] = 0
+            status['eta_seconds'] = 0.0
+            status['progress'] = 1.0
+        return status
+
+    def _eta_locked(self, position: int) -> float:
+        """Seconds until a slot frees up for the job at queue index `position`."""
+        now = time.time()
+        remaining = [
+            max(job['audio_seconds'] * self.seconds_per_audio_second - (now - job['started_at']), 0.0)
+            for job in self._jobs.values() if job['status'] == 'running'
+        ]
+        remaining += [0.0] * (self.slots - len(remaining))
+        ahead = [self._jobs[job_id]['audio_seconds'] * self.seconds_per_audio_second
+                 for job_id in itertools.islice(self._pending, position)]
+        # Simulate slots picking up the jobs ahead in FIFO order
+        for cost in ahead:
+            remaining.sort()
+            remaining[0] += cost
+        return min(remaining)
+
+    def _work(self, slot: int):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job_id = self._pending.popleft()
+                job = self._jobs[job_id]
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+            try:
+                result = self.runner(job['payload'], slot)
+                error = None
+            except Exception as e:
+                result, error = None, str(e)
+            with self._cond:
+                job['finished_at'] = time.time()
+                job['result'] = result
+                job['error'] = error
+                failed = error is not None or not (result or {}).get('success', True)
+                job['status'] = 'failed' if failed else 'done'
+                self._stats['failed' if failed else 'completed'] += 1
+                if not failed:
+                    observed = (job['finished_at'] - job['started_at']) / job['audio_seconds']
+                    # Exponential moving average keeps ETAs tracking the current load
+                    self.seconds_per_audio_second = 0.7 * self.seconds_per_audio_second + 0.3 * observed
+                job['payload'] = None
+                self._prune_locked()
+            job['done'].set()
+
+    def _prune_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
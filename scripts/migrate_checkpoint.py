@@ -1,45 +1,205 @@
 #!/usr/bin/env python3
 """
 Simple checkpoint migration helper for Harmonia DiffSinger checkpoint compatibility.
-Usage: python3 scripts/migrate_checkpoint.py <input_ckpt> <output_ckpt>
+Usage:
+    python3 scripts/migrate_checkpoint.py <input_ckpt> <output_ckpt>
+    python3 scripts/migrate_checkpoint.py --batch models/diffsinger [--workers N]
 
 If the input checkpoint appears to be an "old-style" state dict, this script
 wraps it into the newer format expected by DiffSinger (adds 'category' and
 ensures the state is under 'state_dict').
+
+Migration is idempotent and cached by a content hash of the input: wrapped
+checkpoints are stored once under the migration cache (default
+/workspace/models/diffsinger/.migrated, env DIFFSINGER_MIGRATION_CACHE) and
+linked to the output path. The format is detected from the pickled structure
+alone (see checkpoint_inspect.py); checkpoints that are already in the new
+format are linked, not re-saved, and raw state dicts are wrapped by streaming
+their tensor data to the output rather than loading it. The batch mode
+migrates every checkpoint under a tree in parallel processes, writing
+<name>.migrated.ckpt beside each.
 """
+import argparse
+import hashlib
+import json
+import os
 import sys
-import torch
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from checkpoint_inspect import load_skeleton, rewrite
+from diffsinger_helper import link_file
+
+CACHE_DIR = Path(os.environ.get('DIFFSINGER_MIGRATION_CACHE', '/workspace/models/diffsinger/.migrated'))
+MIGRATED_SUFFIX = '.migrated.ckpt'
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def load_index(cache_dir: Path = CACHE_DIR) -> dict:
+    """Source digests recorded by earlier runs: {abs path: {size, mtime_ns, digest}}."""
+    try:
+        with open(Path(cache_dir) / 'index.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index: dict, cache_dir: Path = CACHE_DIR):
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f'index.json.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, cache_dir / 'index.json')
 
-def migrate(input_path: Path, output_path: Path):
-    ckpt = torch.load(input_path, map_location='cpu')
+
+def source_digest(path: Path, index: dict) -> str:
+    """BLAKE2b of the file contents. Reuses the digest in `index` while size and mtime
+    are unchanged, so an untouched checkpoint is not re-read."""
+    key = str(Path(path).resolve())
+    st = os.stat(path)
+    record = index.get(key)
+    if record and record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns:
+        return record['digest']
+    h = hashlib.blake2b(digest_size=20)
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    index[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digest': h.hexdigest()}
+    return index[key]['digest']
+
+
+def is_new_format(ckpt) -> bool:
     # Heuristics: if it already has keys 'state_dict' and maybe 'category', assume new format
-    if isinstance(ckpt, dict) and ('state_dict' in ckpt or 'model' in ckpt):
-        print('Checkpoint already appears to be in new format; copying to output path')
-        torch.save(ckpt, output_path)
+    return isinstance(ckpt, dict) and ('state_dict' in ckpt or 'model' in ckpt)
+
+
+def migrate(input_path: Path, output_path: Path, cache_dir: Path = CACHE_DIR, index: dict = None):
+    """Make `output_path` a new-format version of `input_path`. Returns 0 on success.
+
+    Pass `index` to collect digest records instead of updating the on-disk index
+    (the batch mode merges them once at the end).
+    """
+    cache_dir = Path(cache_dir)
+    own_index = index is None
+    if own_index:
+        index = load_index(cache_dir)
+    digest = source_digest(input_path, index)
+    if own_index:
+        save_index(index, cache_dir)
+
+    artifact = cache_dir / f'{digest}.ckpt'
+    if artifact.exists():
+        link_file(str(artifact), str(output_path))
+        print(f'Checkpoint unchanged since its last migration; linked {artifact} -> {output_path}')
+        return 0
+
+    try:
+        skeleton = load_skeleton(input_path)
+    except Exception as e:
+        print('Could not read the checkpoint structure without loading it:', e)
+        skeleton = None
+    if skeleton is not None and is_new_format(skeleton):
+        print('Checkpoint already appears to be in new format; linking to output path')
+        link_file(str(input_path), str(output_path))
         return 0
 
-    # Otherwise assume it's a raw state_dict -> wrap
-    print('Wrapping raw state_dict into new checkpoint format')
-    wrapped = {
-        'category': 'acoustic',
-        'state_dict': ckpt if isinstance(ckpt, dict) else {},
-        'meta': {'migrated_by': 'harmonia/migrate_checkpoint.py'}
-    }
-    torch.save(wrapped, output_path)
+    meta = {'migrated_by': 'harmonia/migrate_checkpoint.py', 'source_digest': digest}
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if isinstance(skeleton, dict):
+        # Raw state_dict -> wrap, streaming the tensor data instead of loading it
+        print('Wrapping raw state_dict into new checkpoint format')
+        rewrite(input_path, artifact, wrap=True, category='acoustic', meta=meta)
+    else:
+        import torch
+
+        ckpt = torch.load(input_path, map_location='cpu')
+        if is_new_format(ckpt):
+            print('Checkpoint already appears to be in new format; linking to output path')
+            link_file(str(input_path), str(output_path))
+            return 0
+        # Otherwise assume it's a raw state_dict -> wrap
+        print('Wrapping raw state_dict into new checkpoint format')
+        wrapped = {
+            'category': 'acoustic',
+            'state_dict': ckpt if isinstance(ckpt, dict) else {},
+            'meta': meta
+        }
+        tmp = cache_dir / f'{digest}.ckpt.{os.getpid()}.tmp'
+        torch.save(wrapped, tmp)
+        os.replace(tmp, artifact)
+    link_file(str(artifact), str(output_path))
     print(f'Wrote migrated checkpoint to {output_path}')
     return 0
 
 
+def find_checkpoints(root: Path, cache_dir: Path = CACHE_DIR) -> list:
+    """Source checkpoints under `root`, skipping migrated outputs and the migration cache."""
+    cache_dir = Path(cache_dir).resolve()
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if (Path(dirpath) / d).resolve() != cache_dir)
+        found.extend(Path(dirpath) / name for name in sorted(filenames)
+                     if name.endswith('.ckpt') and not name.endswith(MIGRATED_SUFFIX))
+    return found
+
+
+def migrated_path(ckpt: Path) -> Path:
+    return ckpt.with_name(ckpt.name[:-len('.ckpt')] + MIGRATED_SUFFIX)
+
+
+def _migrate_job(src: Path, out: Path, cache_dir: Path, records: dict):
+    try:
+        code = migrate(src, out, cache_dir, records)
+    except Exception as e:
+        print(f'Migration failed for {src}: {e}')
+        code = 1
+    return records, code
+
+
+def migrate_tree(root: Path, cache_dir: Path = CACHE_DIR, workers: int = None) -> int:
+    """Migrate every checkpoint under `root` across `workers` processes; returns failures."""
+    index = load_index(cache_dir)
+    jobs = find_checkpoints(root, cache_dir)
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = []
+        for src in jobs:
+            key = str(src.resolve())
+            records = {key: index[key]} if key in index else {}
+            futures.append(pool.submit(_migrate_job, src, migrated_path(src), cache_dir, records))
+        for future in futures:
+            records, code = future.result()
+            index.update(records)
+            failures += code != 0
+    save_index(index, cache_dir)
+    print(f'Migrated {len(jobs) - failures}/{len(jobs)} checkpoints under {root}')
+    return failures
+
+
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
+    parser = argparse.ArgumentParser(description='Migrate DiffSinger checkpoints to the new format')
+    parser.add_argument('input_ckpt', nargs='?')
+    parser.add_argument('output_ckpt', nargs='?')
+    parser.add_argument('--batch', metavar='DIR', help='Migrate every *.ckpt under DIR in parallel')
+    parser.add_argument('--workers', type=int, default=None, help='Batch worker processes (default: CPU count)')
+    parser.add_argument('--cache-dir', default=str(CACHE_DIR), help='Migrated checkpoint cache')
+    args = parser.parse_args()
+    if args.batch:
+        sys.exit(1 if migrate_tree(Path(args.batch), Path(args.cache_dir), args.workers) else 0)
+    if not args.output_ckpt:
         print('Usage: migrate_checkpoint.py <input_ckpt> <output_ckpt>')
         sys.exit(2)
-    inp = Path(sys.argv[1])
-    out = Path(sys.argv[2])
+    inp = Path(args.input_ckpt)
+    out = Path(args.output_ckpt)
     if not inp.exists():
         print('Input checkpoint not found:', inp)
         sys.exit(3)
     out.parent.mkdir(parents=True, exist_ok=True)
-    sys.exit(migrate(inp, out))
+    sys.exit(migrate(inp, out, Path(args.cache_dir)))
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Sampled fingerprints for fast model presence checks in Harmonia.
+
+A fingerprint hashes a file's size plus fixed-size samples from its head,
+its tail and N evenly strided offsets, so it costs a few reads per file
+however large the checkpoint is. It catches missing, truncated, replaced and
+partially downloaded files, but not a flipped byte between samples, so every
+fingerprint is recorded next to a full BLAKE2b digest. When a fingerprint
+does not match, the file is escalated to a full hash. If the full digest
+still matches, the file is fine (it was recorded with other sampling
+settings) and its fingerprint is refreshed; otherwise it is reported as
+changed.
+
+The manifest (`<models root>/.fingerprints.json`) keys files by their path
+relative to the models root, so it is valid both on the host (`models/`)
+and in the worker (`/workspace/models`). Usage:
+    python3 scripts/model_fingerprint.py record [ROOT] [--min-size BYTES]
+    python3 scripts/model_fingerprint.py verify [ROOT] [--no-escalate]
+
+`verify` exits 0 when every recorded file matches, 3 on a changed file,
+4 on a missing one and 2 when there is no manifest.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+DEFAULT_ROOT = os.environ.get('HARMONIA_MODELS_ROOT', '/workspace/models')
+MANIFEST_NAME = '.fingerprints.json'
+# Bytes read per sample and number of strided samples between head and tail
+SAMPLE_BYTES = 64 * 1024
+SAMPLES = 8
+# Files smaller than this are not worth recording (configs, tokenizers, READMEs)
+DEFAULT_MIN_SIZE = 1024 * 1024
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def fingerprint(path: str, samples: int = SAMPLES, sample_bytes: int = SAMPLE_BYTES) -> str:
+    """BLAKE2b of the file size and `samples` + 2 sampled blocks (head, strided, tail)."""
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f'{size}:{samples}:{sample_bytes}'.encode('ascii'))
+    buf = bytearray(sample_bytes)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        if size <= (samples + 2) * sample_bytes:
+            offsets = range(0, size, sample_bytes)
+        else:
+            last = size - sample_bytes
+            offsets = [last * i // (samples + 1) for i in range(samples + 2)]
+        for offset in offsets:
+            f.seek(offset)
+            n = f.readinto(buf)
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def full_digest(path: str) -> str:
+    h = hashlib.blake2b()
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def load_manifest(root: str) -> dict:
+    """{"samples", "sample_bytes", "files": {relpath: {size, fingerprint, blake2b}}}, or {} if absent."""
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: dict, root: str):
+    path = os.path.join(root, MANIFEST_NAME)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def record(root: str, min_size: int = DEFAULT_MIN_SIZE, samples: int = SAMPLES,
+           sample_bytes: int = SAMPLE_BYTES) -> dict:
+    """Fingerprint and fully hash every file of at least `min_size` bytes under `root`."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.startswith('.') or not os.path.isfile(path) or os.path.getsize(path) < min_size:
+                continue
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            files[rel] = {
+                'size': os.path.getsize(path),
+                'fingerprint': fingerprint(path, samples, sample_bytes),
+                'blake2b': full_digest(path),
+            }
+            print(f'Recorded {rel}')
+    manifest = {'samples': samples, 'sample_bytes': sample_bytes, 'files': files}
+    save_manifest(manifest, root)
+    return manifest
+
+
+def verify_file(path: str, entry: dict, samples: int = SAMPLES, sample_bytes: int = SAMPLE_BYTES,
+                escalate: bool = True) -> dict:
+    """Check one file against its manifest entry.
+
+    Returns {status, escalated}; status is 'ok', 'missing' or 'changed'. A
+    fingerprint mismatch is settled by a full hash when `escalate` is set
+    (and the entry has a full digest); `refreshed` then carries the new
+    fingerprint of a file whose full digest still matches.
+    """
+    if not os.path.isfile(path):
+        return {'status': 'missing', 'escalated': False}
+    if os.path.getsize(path) != entry['size']:
+        return {'status': 'changed', 'escalated': False}
+    current = fingerprint(path, samples, sample_bytes)
+    if current == entry.get('fingerprint'):
+        return {'status': 'ok', 'escalated': False}
+    if not escalate or not entry.get('blake2b'):
+        return {'status': 'changed', 'escalated': False}
+    if full_digest(path) == entry['blake2b']:
+        return {'status': 'ok', 'escalated': True, 'refreshed': current}
+    return {'status': 'changed', 'escalated': True}
+
+
+def verify(root: str, escalate: bool = True, refresh: bool = True) -> dict:
+    """Verify every file in the manifest under `root`; returns {relpath: verify_file() result}.
+
+    With `refresh`, fingerprints confirmed by a full hash are rewritten in the manifest.
+    """
+    manifest = load_manifest(root)
+    samples = manifest.get('samples', SAMPLES)
+    sample_bytes = manifest.get('sample_bytes', SAMPLE_BYTES)
+    results = {}
+    refreshed = False
+    for rel, entry in manifest.get('files', {}).items():
+        result = verify_file(os.path.join(root, rel), entry, samples, sample_bytes, escalate)
+        if result.get('refreshed'):
+            entry['fingerprint'] = result['refreshed']
+            refreshed = True
+        results[rel] = result
+    if refreshed and refresh:
+        try:
+            save_manifest(manifest, root)
+        except OSError as e:  # read-only model mounts
+            print(f'Could not refresh fingerprints in {root}: {e}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record or verify sampled model fingerprints')
+    parser.add_argument('command', choices=('record', 'verify'))
+    parser.add_argument('root', nargs='?', default=DEFAULT_ROOT, help='Models root (env HARMONIA_MODELS_ROOT)')
+    parser.add_argument('--min-size', type=int, default=DEFAULT_MIN_SIZE, help='record: smallest file to include')
+    parser.add_argument('--samples', type=int, default=SAMPLES, help='record: strided samples per file')
+    parser.add_argument('--sample-bytes', type=int, default=SAMPLE_BYTES, help='record: bytes per sample')
+    parser.add_argument('--no-escalate', action='store_true', help='verify: report fingerprint mismatches '
+                                                                   'without a confirming full hash')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        manifest = record(args.root, args.min_size, args.samples, args.sample_bytes)
+        print(f"Recorded {len(manifest['files'])} files in {os.path.join(args.root, MANIFEST_NAME)}")
+        return 0
+
+    if not load_manifest(args.root):
+        print(f'No fingerprint manifest in {args.root}; run `record` first')
+        return 2
+    started = time.time()
+    results = verify(args.root, escalate=not args.no_escalate)
+    for rel, result in results.items():
+        if result['status'] != 'ok' or result['escalated']:
+            print(f"{result['status'].upper()}{' (full hash)' if result['escalated'] else ''}: {rel}")
+    counts = {status: sum(r['status'] == status for r in results.values()) for status in ('ok', 'changed', 'missing')}
+    print(f"Verified {len(results)} model files in {time.time() - started:.2f}s: "
+          f"{counts['ok']} ok, {counts['changed']} changed, {counts['missing']} missing")
+    if counts['changed']:
+        return 3
+    return 4 if counts['missing'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
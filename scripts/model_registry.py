@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+MusicGen model registry and warm model pool for Harmonia.
+
+Resolves a requested variant ("small", "medium", "melody", a Hugging Face id
+such as "facebook/musicgen-small", or a directory) to local weights under
+`models/`, using `inventory/combined_inventory.json` and the download layout
+of `scripts/download_musicgen_full.sh`:
+
+    models/facebook/facebook_musicgen-small/models--facebook--musicgen-small/snapshots/<rev>/
+
+A memory-mapped snapshot exported to `models/snapshots/<name>` (see
+model_snapshot.py) takes precedence over the pickled checkpoints.
+
+`ModelPool` keeps up to N loaded models resident under a memory budget and
+unloads the least recently used one to make room, so switching quality tiers
+does not pay a full load every time. Usage:
+    python3 scripts/model_registry.py resolve small [--models-dir DIR] [--inventory FILE]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+DEFAULT_MODELS_DIR = Path(os.environ.get('HARMONIA_MODELS_DIR', Path.cwd() / 'models'))
+DEFAULT_INVENTORY = Path(os.environ.get('HARMONIA_INVENTORY', Path.cwd() / 'inventory' / 'combined_inventory.json'))
+
+VARIANTS = {
+    'small': 'facebook/musicgen-small',
+    'medium': 'facebook/musicgen-medium',
+    'large': 'facebook/musicgen-large',
+    'melody': 'facebook/musicgen-melody',
+    'melody-large': 'facebook/musicgen-melody-large',
+}
+
+# Approximate resident size (float32 weights, LM + EnCodec) used when the local
+# weights are not available to measure.
+APPROX_BYTES = {
+    'facebook/musicgen-small': 1_400_000_000,
+    'facebook/musicgen-medium': 6_200_000_000,
+    'facebook/musicgen-large': 13_500_000_000,
+    'facebook/musicgen-melody': 6_400_000_000,
+    'facebook/musicgen-melody-large': 13_700_000_000,
+}
+
+# audiocraft checkpoint files inside a MusicGen repo snapshot.
+WEIGHT_FILES = ('state_dict.bin', 'compression_state_dict.bin')
+# Weight files of an exported memory-mapped snapshot (model_snapshot.py).
+SNAPSHOT_FILES = ('lm.safetensors', 'compression.safetensors')
+
+DEFAULT_MAX_MODELS = int(os.environ.get('MUSICGEN_MAX_MODELS', 2))
+DEFAULT_MEMORY_BUDGET = int(os.environ.get('MUSICGEN_MODEL_MEMORY_BYTES', 0))  # 0 = no byte limit
+
+
+def canonical_name(name: str) -> str:
+    """Map a variant alias to its Hugging Face id; other names are returned unchanged."""
+    name = (name or '').strip()
+    if name in VARIANTS:
+        return VARIANTS[name]
+    if name.startswith('musicgen-') and f'facebook/{name}' in VARIANTS.values():
+        return f'facebook/{name}'
+    return name
+
+
+def load_inventory(path=DEFAULT_INVENTORY) -> list:
+    """Return the model entries of a combined inventory, or [] if it is missing."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return data.get('models', []) if isinstance(data, dict) else []
+
+
+def _local_path(recorded: str, models_dir: Path) -> Path:
+    """Re-root an inventory path (often recorded on another host) under `models_dir`."""
+    parts = [p for p in recorded.replace('\\', '/').split('/') if p]
+    if 'models' in parts:
+        idx = len(parts) - 1 - parts[::-1].index('models')
+        return models_dir.joinpath(*parts[idx + 1:])
+    return Path(recorded)
+
+
+def find_snapshot(folder: Path, repo_id: str):
+    """Return the directory under `folder` holding the audiocraft weights of `repo_id`, or None."""
+    if (folder / WEIGHT_FILES[0]).is_file():
+        return folder
+    repo_dir = folder / ('models--' + repo_id.replace('/', '--'))
+    snapshots = repo_dir / 'snapshots'
+    if not snapshots.is_dir():
+        return None
+    ref = repo_dir / 'refs' / 'main'
+    if ref.is_file():
+        pinned = snapshots / ref.read_text(encoding='utf-8').strip()
+        if (pinned / WEIGHT_FILES[0]).is_file():
+            return pinned
+    candidates = [d for d in snapshots.iterdir() if (d / WEIGHT_FILES[0]).is_file()]
+    return max(candidates, key=lambda d: d.stat().st_mtime) if candidates else None
+
+
+def resolve_model(name: str, models_dir: Path = None, inventory: list = None) -> dict:
+    """Resolve a variant, Hugging Face id or directory to {name, path, bytes}.
+
+    `path` is the local snapshot directory when the weights are present under
+    `models_dir`, else None (the caller loads by `name`, from the HF cache).
+    """
+    models_dir = Path(models_dir or DEFAULT_MODELS_DIR)
+    repo_id = canonical_name(name)
+    slug = repo_id.split('/')[-1]
+    if os.path.isdir(repo_id):
+        path = Path(repo_id)
+    elif (models_dir / 'snapshots' / slug / 'snapshot.json').is_file():
+        path = models_dir / 'snapshots' / slug
+    else:
+        folders = [
+            models_dir / 'facebook' / repo_id.replace('/', '_'),
+            models_dir / 'facebook' / slug,
+            models_dir / slug,
+        ]
+        for entry in (load_inventory() if inventory is None else inventory):
+            names = {entry.get('repo_id'), entry.get('name'), entry.get('folder_name')}
+            if names & {repo_id, slug, repo_id.replace('/', '_')}:
+                recorded = entry.get('local_path') or entry.get('path')
+                if recorded:
+                    folders.insert(0, _local_path(recorded, models_dir))
+        path = next((snap for snap in (find_snapshot(f, repo_id) for f in folders) if snap), None)
+    if path is not None:
+        size = sum((path / f).stat().st_size for f in WEIGHT_FILES + SNAPSHOT_FILES if (path / f).is_file())
+    else:
+        size = APPROX_BYTES.get(repo_id, 0)
+    return {'name': repo_id, 'path': str(path) if path else None, 'bytes': size}
+
+
+def available_variants(models_dir: Path = None, inventory: list = None) -> dict:
+    """Return {variant: resolved} for every known variant, local or not."""
+    return {variant: resolve_model(variant, models_dir, inventory) for variant in VARIANTS}
+
+
+class ModelPool:
+    """Keep up to `max_models` loaded models within `max_bytes`, unloading the LRU one.
+
+    `loader(resolved)` turns a `resolve_model()` result (plus the requested
+    "accel" mode) into a model. Entries are keyed by (model name, slot, accel) so
+    each worker slot and inference mode holds its own instance.
+    A model evicted while a caller still holds it is freed once that caller drops it.
+    Loads run outside the pool lock: other keys stay servable meanwhile, and
+    concurrent requests for a key that is loading wait on that one load.
+    """
+
+    def __init__(self, loader, max_models: int = DEFAULT_MAX_MODELS, max_bytes: int = DEFAULT_MEMORY_BUDGET,
+                 resolver=resolve_model):
+        self.loader = loader
+        self.resolver = resolver
+        self.max_models = max(1, max_models)
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'loads': 0, 'evictions': 0}
+        # key -> {'future', 'bytes'} for loads in progress; their bytes count against the budget
+        self._loading = {}
+
+    def get(self, name: str, slot: int = 0, accel: str = 'none'):
+        key = (canonical_name(name), slot, accel)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry['model']
+            pending = self._loading.get(key)
+            if pending is None:
+                resolved = {**self.resolver(name), 'accel': accel}
+                self._make_room(resolved['bytes'])
+                future = Future()
+                self._loading[key] = {'future': future, 'bytes': resolved['bytes']}
+        if pending is not None:
+            return pending['future'].result()
+
+        print(f"Loading MusicGen model {resolved['name']} (slot {slot}, accel {accel}) "
+              f"from {resolved['path'] or 'Hugging Face cache'}")
+        try:
+            model = self.loader(resolved)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[key]
+            self._models[key] = {'model': model, 'bytes': resolved['bytes'], 'path': resolved['path']}
+            self._stats['loads'] += 1
+        future.set_result(model)
+        return model
+
+    def _make_room(self, incoming: int):
+        incoming += sum(pending['bytes'] for pending in self._loading.values())
+        while self._models and (
+            len(self._models) + len(self._loading) >= self.max_models
+            or (self.max_bytes and self._resident_bytes() + incoming > self.max_bytes)
+        ):
+            (name, slot, accel), _ = self._models.popitem(last=False)
+            self._stats['evictions'] += 1
+            print(f"Unloading MusicGen model {name} (slot {slot}, accel {accel}) to make room")
+        gc.collect()
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return self._resident_bytes()
+
+    def loaded(self) -> list:
+        """Loaded models as "name[#slot][@accel]", least recently used first."""
+        with self._lock:
+            return self._loaded()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'loaded': self._loaded(), 'resident_bytes': self._resident_bytes(),
+                    'max_models': self.max_models, 'max_bytes': self.max_bytes}
+
+    # Callers of the helpers below hold self._lock
+
+    def _resident_bytes(self) -> int:
+        return sum(entry['bytes'] for entry in self._models.values())
+
+    def _loaded(self) -> list:
+        return [name + (f'#{slot}' if slot else '') + (f'@{accel}' if accel != 'none' else '')
+                for name, slot, accel in self._models]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve MusicGen variants to local weights")
+    parser.add_argument('command', choices=('resolve', 'variants'))
+    parser.add_argument('model', nargs='?', default='small', help='Variant, Hugging Face id or directory')
+    parser.add_argument('--models-dir', default=str(DEFAULT_MODELS_DIR), help='Local models directory')
+    parser.add_argument('--inventory', default=str(DEFAULT_INVENTORY), help='combined_inventory.json path')
+    args = parser.parse_args()
+
+    inventory = load_inventory(args.inventory)
+    if args.command == 'resolve':
+        print(json.dumps(resolve_model(args.model, Path(args.models_dir), inventory), indent=2))
+    else:
+        print(json.dumps(available_variants(Path(args.models_dir), inventory), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped MusicGen snapshots for Harmonia.
+
+`export_snapshot` converts the pickled audiocraft checkpoints of a MusicGen
+repo (`state_dict.bin`, `compression_state_dict.bin`) into a snapshot
+directory:
+
+    snapshot.json            format marker, source, config, quantization
+    lm.safetensors           language model weights
+    compression.safetensors  EnCodec weights (absent when the repo points at a
+                             pretrained EnCodec, which is then loaded by name)
+
+The .safetensors files use the safetensors layout (8-byte header length, JSON
+header, one contiguous data block) so other tools can read them. With
+`quantize=True` the LM's Linear weights are stored as per-row symmetric int8
+plus a float32 scale (`<name>.scale`), a quarter of the float32 size.
+
+`load_snapshot` maps the files read-only and assigns the tensors straight into
+the model, so worker processes share the same physical pages and a cold start
+costs page faults instead of a full read and unpickle. int8 layers become
+dynamic-quantized Linear modules; their packed weights are per-process.
+Usage:
+    python3 scripts/model_snapshot.py export <repo dir> <out dir> [--quantize]
+    python3 scripts/model_snapshot.py inspect <snapshot dir>
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+SNAPSHOT_FORMAT = 'harmonia-musicgen-snapshot'
+SNAPSHOT_VERSION = 1
+MANIFEST = 'snapshot.json'
+LM_FILE = 'lm.safetensors'
+COMPRESSION_FILE = 'compression.safetensors'
+# Data block alignment; tensors are laid out by descending element size so every
+# tensor starts on a multiple of its own element size.
+HEADER_ALIGN = 64
+
+_DTYPE_NAMES = {
+    'float64': 'F64', 'float32': 'F32', 'float16': 'F16', 'bfloat16': 'BF16',
+    'int64': 'I64', 'int32': 'I32', 'int16': 'I16', 'int8': 'I8', 'uint8': 'U8', 'bool': 'BOOL',
+}
+
+
+def is_snapshot(path) -> bool:
+    return path is not None and (Path(path) / MANIFEST).is_file()
+
+
+def _torch_dtype(code: str):
+    import torch
+
+    return {code: getattr(torch, name) for name, code in _DTYPE_NAMES.items()}[code]
+
+
+def write_safetensors(path, tensors: dict, metadata: dict = None):
+    """Write `tensors` to `path` in safetensors layout, streaming one tensor at a time."""
+    import torch
+
+    order = sorted(tensors, key=lambda name: (-tensors[name].element_size(), name))
+    header, offset = {}, 0
+    for name in order:
+        t = tensors[name]
+        size = t.numel() * t.element_size()
+        header[name] = {'dtype': _DTYPE_NAMES[str(t.dtype).replace('torch.', '')], 'shape': list(t.shape),
+                        'data_offsets': [offset, offset + size]}
+        offset += size
+    if metadata:
+        header['__metadata__'] = {k: v if isinstance(v, str) else json.dumps(v) for k, v in metadata.items()}
+    raw = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    raw += b' ' * (-(8 + len(raw)) % HEADER_ALIGN)
+
+    tmp = Path(f'{path}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack('<Q', len(raw)))
+        f.write(raw)
+        for name in order:
+            t = tensors[name].detach().to('cpu').contiguous()
+            if t.numel():
+                f.write(t.reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp, path)
+
+
+def read_safetensors(path, copy: bool = False):
+    """Return ({name: tensor}, metadata) for a safetensors file.
+
+    Tensors are read-only views of a shared read-only mapping unless `copy` is set.
+    """
+    import torch
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    length = struct.unpack('<Q', mapped[:8])[0]
+    header = json.loads(mapped[8:8 + length].decode('utf-8'))
+    metadata = header.pop('__metadata__', {})
+    base = 8 + length
+    tensors = {}
+    with warnings.catch_warnings():
+        # torch warns that the buffer is not writable; the weights are never written
+        warnings.simplefilter('ignore', UserWarning)
+        for name, info in header.items():
+            dtype = _torch_dtype(info['dtype'])
+            start, end = info['data_offsets']
+            if end == start:
+                t = torch.empty(info['shape'], dtype=dtype)
+            else:
+                count = (end - start) // torch.empty((), dtype=dtype).element_size()
+                t = torch.frombuffer(mapped, dtype=dtype, count=count, offset=base + start).reshape(info['shape'])
+            tensors[name] = t.clone() if copy else t
+    return tensors, metadata
+
+
+def _quantizable(name: str, tensor) -> bool:
+    """Linear weights: 2-D floating ".weight" tensors that are not embeddings or norms."""
+    return (tensor.dim() == 2 and tensor.is_floating_point() and name.endswith('.weight')
+            and not any(part in name for part in ('emb', 'norm')))
+
+
+def _plain_cfg(cfg):
+    """audiocraft stores the experiment config as a dict or an OmegaConf object; return a dict."""
+    if isinstance(cfg, (dict, str)):
+        return cfg
+    from omegaconf import OmegaConf
+
+    return OmegaConf.to_container(cfg, resolve=True)
+
+
+def quantize_rows(weight):
+    """Symmetric per-row int8 quantization: returns (int8 weight, float32 scale per row)."""
+    import torch
+
+    w = weight.float()
+    scale = w.abs().amax(dim=1).clamp(min=1e-12) / 127.0
+    q = torch.round(w / scale[:, None]).clamp(-127, 127).to(torch.int8)
+    return q, scale
+
+
+def export_snapshot(repo_dir, out_dir, quantize: bool = False, dtype: str = 'float32', name: str = None) -> dict:
+    """Convert audiocraft checkpoints in `repo_dir` into a snapshot in `out_dir`; returns the manifest."""
+    import torch
+
+    repo_dir, out_dir = Path(repo_dir), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = getattr(torch, dtype)
+    manifest = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION, 'name': name or repo_dir.name,
+                'source': str(repo_dir), 'dtype': dtype, 'quantized': bool(quantize), 'quantized_tensors': 0}
+
+    pkg = torch.load(repo_dir / 'state_dict.bin', map_location='cpu')
+    manifest['lm_cfg'] = _plain_cfg(pkg['xp.cfg'])
+    lm = {}
+    for name, tensor in pkg['best_state'].items():
+        if quantize and _quantizable(name, tensor):
+            lm[name], lm[f'{name}.scale'] = quantize_rows(tensor)
+            manifest['quantized_tensors'] += 1
+        else:
+            lm[name] = tensor.to(target) if tensor.is_floating_point() else tensor
+    write_safetensors(out_dir / LM_FILE, lm, {'format': SNAPSHOT_FORMAT})
+    del pkg, lm
+
+    pkg = torch.load(repo_dir / 'compression_state_dict.bin', map_location='cpu')
+    if 'pretrained' in pkg:
+        manifest['compression_pretrained'] = pkg['pretrained']
+    else:
+        manifest['compression_cfg'] = _plain_cfg(pkg['xp.cfg'])
+        write_safetensors(out_dir / COMPRESSION_FILE,
+                          {k: v.to(target) if v.is_floating_point() else v for k, v in pkg['best_state'].items()},
+                          {'format': SNAPSHOT_FORMAT})
+    del pkg
+
+    tmp = out_dir / f'{MANIFEST}.tmp'
+    tmp.write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    os.replace(tmp, out_dir / MANIFEST)
+    return manifest
+
+
+@contextmanager
+def _skip_weight_init():
+    """Make torch.nn.init a no-op while building a skeleton whose weights get replaced.
+
+    The skeleton's freshly allocated (never written) parameters cost no resident
+    memory and no init time; the snapshot tensors are assigned over them.
+    """
+    import torch
+
+    names = ('uniform_', 'normal_', 'trunc_normal_', 'constant_', 'zeros_', 'ones_', 'xavier_uniform_',
+             'xavier_normal_', 'kaiming_uniform_', 'kaiming_normal_', 'orthogonal_')
+    originals = {name: getattr(torch.nn.init, name) for name in names if hasattr(torch.nn.init, name)}
+    for name in originals:
+        setattr(torch.nn.init, name, lambda tensor, *args, **kwargs: tensor)
+    try:
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(torch.nn.init, name, fn)
+
+
+def _assign(module, tensors: dict, swapped: set = None):
+    """Load `tensors` into `module` by reference (no copy).
+
+    Every key must match, except those of the `swapped` int8 Linear modules,
+    whose packed weights are installed by `_install_int8_linears()`.
+    """
+    result = module.load_state_dict(tensors, strict=not swapped, assign=True)
+    if swapped:
+        def stray(keys):
+            return [k for k in keys if not any(k.startswith(f'{path}.') for path in swapped)]
+        missing, unexpected = stray(result.missing_keys), stray(result.unexpected_keys)
+        if missing or unexpected:
+            raise RuntimeError(f"Snapshot does not match {type(module).__name__}: "
+                               f"missing keys {missing}, unexpected keys {unexpected}")
+    return module.eval()
+
+
+def _install_int8_linears(lm, tensors: dict):
+    """Swap Linear modules whose weights are stored as int8 for dynamic-quantized Linears.
+
+    Returns the tensors left to assign (the floats, plus the swapped modules'
+    own state so they load as-is) and the set of swapped module paths.
+    """
+    import torch
+
+    floats = {k: v for k, v in tensors.items() if not k.endswith('.scale') and v.dtype != torch.int8}
+    modules = dict(lm.named_modules())
+    swapped = set()
+    for name, q in tensors.items():
+        if q.dtype != torch.int8 or not name.endswith('.weight'):
+            continue
+        scale = tensors[f'{name}.scale'].double()
+        path = name[:-len('.weight')]
+        module = modules.get(path)
+        if isinstance(module, torch.nn.Linear):
+            qweight = torch._make_per_channel_quantized_tensor(q, scale, torch.zeros(len(scale), dtype=torch.long), 0)
+            dq = torch.ao.nn.quantized.dynamic.Linear(module.in_features, module.out_features,
+                                                       bias_=module.bias is not None, dtype=torch.qint8)
+            bias = floats.pop(f'{path}.bias', None)
+            dq.set_weight_bias(qweight, None if bias is None else bias.float().clone())
+            parent, _, attr = path.rpartition('.')
+            setattr(modules[parent] if parent else lm, attr, dq)
+            floats.update({f'{path}.{k}': v for k, v in dq.state_dict().items()})
+            swapped.add(path)
+        else:
+            # Not a Linear in this audiocraft version: fall back to float
+            floats[name] = (q.float() * scale.float()[:, None])
+    # Quantized modules read their state by version, as recorded by state_dict()
+    floats = OrderedDict(floats)
+    floats._metadata = {name: {'version': module._version} for name, module in lm.named_modules()}
+    return floats, swapped
+
+
+def load_snapshot(path, device: str = 'cpu'):
+    """Build a MusicGen model from the snapshot at `path`, mapping weights read-only."""
+    from audiocraft.models import MusicGen, builders
+    from audiocraft.models.encodec import CompressionModel
+    from omegaconf import OmegaConf
+
+    path = Path(path)
+    manifest = json.loads((path / MANIFEST).read_text(encoding='utf-8'))
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a {SNAPSHOT_FORMAT}")
+
+    cfg = OmegaConf.create(manifest['lm_cfg'])
+    cfg.device, cfg.dtype = device, manifest['dtype']
+    tensors, _ = read_safetensors(path / LM_FILE)
+    with _skip_weight_init():
+        lm = builders.get_lm_model(cfg)
+    if manifest['quantized']:
+        lm = _assign(lm, *_install_int8_linears(lm, tensors))
+    else:
+        lm = _assign(lm, tensors)
+    lm.cfg = cfg
+
+    if 'compression_pretrained' in manifest:
+        compression = CompressionModel.get_pretrained(manifest['compression_pretrained'], device=device)
+    else:
+        ccfg = OmegaConf.create(manifest['compression_cfg'])
+        ccfg.device = device
+        with _skip_weight_init():
+            compression = builders.get_compression_model(ccfg)
+        compression = _assign(compression, read_safetensors(path / COMPRESSION_FILE)[0])
+
+    if 'self_wav' in lm.condition_provider.conditioners:
+        lm.condition_provider.conditioners['self_wav'].match_len_on_eval = True
+    return MusicGen(manifest.get('name') or path.name, compression, lm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or inspect memory-mapped MusicGen snapshots")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_export = sub.add_parser('export', help='Convert audiocraft checkpoints into a snapshot')
+    p_export.add_argument('repo_dir', help='Directory holding state_dict.bin and compression_state_dict.bin')
+    p_export.add_argument('out_dir', help='Snapshot directory to write')
+    p_export.add_argument('--quantize', action='store_true', help='Store LM Linear weights as int8')
+    p_export.add_argument('--dtype', default='float32', choices=('float32', 'float16', 'bfloat16'),
+                          help='Storage dtype of floating-point weights')
+    p_export.add_argument('--name', help='Model name recorded in the manifest (default: repo dir name)')
+    p_inspect = sub.add_parser('inspect', help='Print a snapshot manifest and tensor summary')
+    p_inspect.add_argument('snapshot_dir')
+    args = parser.parse_args()
+
+    if args.cmd == 'export':
+        manifest = export_snapshot(args.repo_dir, args.out_dir, args.quantize, args.dtype, args.name)
+        print(json.dumps({k: v for k, v in manifest.items() if not k.endswith('_cfg')}, indent=2))
+        return 0
+    manifest = json.loads((Path(args.snapshot_dir) / MANIFEST).read_text(encoding='utf-8'))
+    tensors, _ = read_safetensors(Path(args.snapshot_dir) / LM_FILE)
+    print(json.dumps({
+        **{k: v for k, v in manifest.items() if not k.endswith('_cfg')},
+        'lm_tensors': len(tensors),
+        'lm_bytes': sum(t.numel() * t.element_size() for t in tensors.values()),
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
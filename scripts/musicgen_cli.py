@@ -1,36 +1,183 @@
 #!/usr/bin/env python3
-"""Music generation CLI (scaffold)
+"""Music generation CLI
 
-This script provides a minimal CLI to validate local model presence, select a variant
-and (optionally) run a lightweight generation flow. It is intentionally conservative
-and uses local artifacts only.
+This script provides a minimal CLI to validate local model presence, select a variant,
+run a CPU generation through the shared inference path (`musicgen_inference.py`) and
+benchmark throughput. It is intentionally conservative and uses local artifacts only.
 """
 import argparse
 import json
 import os
 from pathlib import Path
+import statistics
 import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows hosts: no peak RSS reporting
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from model_registry import VARIANTS, available_variants, load_inventory, resolve_model
 
 
 ROOT = Path.cwd()
 MODELS_DIR = ROOT / "models"
 ARTIFACTS_DIR = ROOT / "artifacts"
+INVENTORY_PATH = ROOT / "inventory" / "combined_inventory.json"
 
 
 def list_models():
     if not MODELS_DIR.exists():
         print("No models directory found.")
         return []
-    candidates = []
-    for p in MODELS_DIR.iterdir():
-        if p.is_dir():
-            candidates.append(p.name)
-    return candidates
+    # One directory listing: cheaper than refreshing the recursive filesystem index
+    return sorted(p.name for p in MODELS_DIR.iterdir() if p.is_dir())
 
 
 def check_model_path(model_name):
     p = MODELS_DIR / model_name
-    return p.exists()
+    if p.exists():
+        return True
+    # Variants ("small", "facebook/musicgen-medium", ...) resolve through the registry
+    return resolve_model(model_name, MODELS_DIR, load_inventory(INVENTORY_PATH))['path'] is not None
+
+
+def resolve_target(model_name):
+    """Return what to load for `model_name`: a folder under `models/`, else the name itself."""
+    folder = MODELS_DIR / model_name
+    return str(folder) if folder.is_dir() else model_name
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_generation(model_name, seconds, instrument, prompt=None, output=None, seed=None):
+    """Generate one stem on CPU via the same path as generate_musicgen_audio.py; returns success."""
+    import generate_musicgen_audio as gen
+
+    output = output or str(ARTIFACTS_DIR / "musicgen_cli" / f"{Path(model_name).name}_{instrument}.wav")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    job = gen.make_job(instrument, output, seconds, prompt, seed, model=resolve_target(model_name))
+    return gen.generate_batch([job])[0]
+
+
+def bench(model_name, durations, batch_sizes, chunk_seconds=5.0, repeats=1, instrument="piano", accel="none"):
+    """Measure load time, time to first audio, real-time factor and peak RSS for one inference mode.
+
+    Time to first audio is how long the streaming path takes to produce its first
+    `chunk_seconds` window. The real-time factor is seconds of audio generated per
+    second of compute (higher is faster), taken from the median of `repeats` runs.
+    Peak RSS is cumulative for the process, so it is reported after each case.
+    """
+    import generate_musicgen_audio as gen
+    from musicgen_inference import generate_audio, generate_windows, get_model
+
+    target = resolve_target(model_name)
+    start = time.perf_counter()
+    model = get_model(target, accel=accel)
+    report = {
+        "model": target,
+        "accel": accel,
+        "load_s": round(time.perf_counter() - start, 3),
+        "sample_rate": model.sample_rate,
+        "peak_rss_mb_after_load": peak_rss_mb(),
+        "first_audio": [],
+        "cases": [],
+    }
+    try:
+        import torch  # type: ignore
+        report["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+
+    for duration in durations:
+        job = gen.make_job(instrument, "", duration, seed=0, accel=accel)
+        window = min(chunk_seconds, duration)
+        start = time.perf_counter()
+        next(generate_windows(model, job, window, min(5.0, 30 - window)))
+        report["first_audio"].append({
+            "duration": duration,
+            "chunk_seconds": window,
+            "first_audio_s": round(time.perf_counter() - start, 3),
+        })
+        for batch_size in batch_sizes:
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                generate_audio(model, [job["prompt"]] * batch_size, job)
+                timings.append(time.perf_counter() - start)
+            elapsed = statistics.median(timings)
+            report["cases"].append({
+                "duration": duration,
+                "batch_size": batch_size,
+                "generate_s": round(elapsed, 3),
+                "audio_seconds": duration * batch_size,
+                "rtf": round(duration * batch_size / elapsed, 4),
+                "peak_rss_mb": peak_rss_mb(),
+            })
+            print(f"[{accel}] duration={duration}s batch={batch_size}: {elapsed:.2f}s, "
+                  f"rtf={duration * batch_size / elapsed:.3f}", file=sys.stderr)
+    return report
+
+
+def quality_drift(model_name, accel, duration=5, instrument="piano", seed=0):
+    """Compare `accel` output against the float32 baseline for the same prompt and seed.
+
+    Sampling diverges once a single token differs, so sample-wise error is not
+    meaningful; instead this reports the mean absolute difference of the long-term
+    average spectra (dB) and the integrated loudness difference (LU).
+    """
+    import numpy as np
+    import generate_musicgen_audio as gen
+    from audio_postprocess import as_batch, integrated_loudness
+    from musicgen_inference import generate_audio, get_model
+
+    target = resolve_target(model_name)
+    outputs = {}
+    for mode in ("none", accel):
+        job = gen.make_job(instrument, "", duration, seed=seed, accel=mode)
+        model = get_model(target, accel=mode)
+        outputs[mode] = as_batch(generate_audio(model, [job["prompt"]], job))[0]
+        sample_rate = model.sample_rate
+
+    def spectrum_db(audio):
+        mono = audio.mean(axis=0)
+        frames = mono[: len(mono) // 2048 * 2048].reshape(-1, 2048) * np.hanning(2048)
+        return 20 * np.log10(np.abs(np.fft.rfft(frames, axis=-1)).mean(axis=0) + 1e-9)
+
+    return {
+        "accel": accel,
+        "duration": duration,
+        "seed": seed,
+        "spectral_drift_db": round(float(np.abs(spectrum_db(outputs[accel]) - spectrum_db(outputs["none"])).mean()), 3),
+        "loudness_delta_lu": round(integrated_loudness(outputs[accel], sample_rate)
+                                   - integrated_loudness(outputs["none"], sample_rate), 3),
+    }
+
+
+def compare_modes(reports):
+    """RTF speedup of each mode over the float32 ("none") baseline, per case."""
+    baseline = {(c["duration"], c["batch_size"]): c["rtf"] for c in reports["none"]["cases"]}
+    return {
+        mode: [
+            {"duration": c["duration"], "batch_size": c["batch_size"],
+             "rtf_speedup": round(c["rtf"] / baseline[(c["duration"], c["batch_size"])], 3)}
+            for c in report["cases"] if (c["duration"], c["batch_size"]) in baseline
+        ]
+        for mode, report in reports.items() if mode != "none"
+    }
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
 
 
 def main():
@@ -39,12 +186,35 @@ def main():
 
     ps = sub.add_parser("list", help="List available model folders under `models/`")
 
+    p_variants = sub.add_parser("variants", help="Resolve MusicGen variants to local weights")
+    p_variants.add_argument("model", nargs="?", help=f"Variant ({', '.join(VARIANTS)}) or Hugging Face id")
+
     p_check = sub.add_parser("check", help="Check model presence")
     p_check.add_argument("model", help="Model folder name")
 
-    p_run = sub.add_parser("run", help="Run a conservative generation (scaffold)")
-    p_run.add_argument("model", help="Model folder name")
+    p_run = sub.add_parser("run", help="Generate a short preview on CPU")
+    p_run.add_argument("model", help="Model folder name or variant (small, medium, melody)")
     p_run.add_argument("--seconds", type=int, default=5, help="Preview seconds (small)")
+    p_run.add_argument("--instrument", default="piano", help="Instrument to generate")
+    p_run.add_argument("--prompt", help="Override the instrument's prompt")
+    p_run.add_argument("--output", help="Output WAV (default: artifacts/musicgen_cli/<model>_<instrument>.wav)")
+    p_run.add_argument("--seed", type=int, help="Seed for reproducible output")
+
+    p_export = sub.add_parser("export", help="Export a local model as a memory-mapped snapshot")
+    p_export.add_argument("model", help="Model folder name or variant (small, medium, melody)")
+    p_export.add_argument("--out", help="Snapshot directory (default: models/snapshots/<name>[-int8])")
+    p_export.add_argument("--quantize", action="store_true", help="Store the LM's Linear weights as int8")
+
+    p_bench = sub.add_parser("bench", help="Benchmark load time, time to first audio, RTF and peak RSS")
+    p_bench.add_argument("model", help="Model folder name or variant (small, medium, melody)")
+    p_bench.add_argument("--durations", type=_int_list, default=[5, 10], help="Comma-separated durations (s)")
+    p_bench.add_argument("--batch-sizes", type=_int_list, default=[1, 2], help="Comma-separated batch sizes")
+    p_bench.add_argument("--chunk-seconds", type=float, default=5.0, help="Streaming window for time to first audio")
+    p_bench.add_argument("--repeats", type=int, default=1, help="Runs per case (median is reported)")
+    p_bench.add_argument("--accel", default="none",
+                         help="Comma-separated inference modes (none, cpu, cpu-compile); other modes are compared "
+                              "against float32 for speed and quality drift")
+    p_bench.add_argument("--json", dest="json_out", help="Also write the report to this JSON file")
 
     args = parser.parse_args()
 
@@ -53,12 +223,39 @@ def main():
         print(json.dumps({"models": models}, indent=2))
         return 0
 
+    if args.cmd == "variants":
+        inventory = load_inventory(INVENTORY_PATH)
+        if args.model:
+            print(json.dumps(resolve_model(args.model, MODELS_DIR, inventory), indent=2))
+        else:
+            print(json.dumps(available_variants(MODELS_DIR, inventory), indent=2))
+        return 0
+
     if args.cmd == "check":
         ok = check_model_path(args.model)
         print(f"Model {args.model}: {'FOUND' if ok else 'MISSING'}")
         return 0 if ok else 2
 
-    if args.cmd == "run":
+    if args.cmd == "export":
+        resolved = resolve_model(resolve_target(args.model), MODELS_DIR, load_inventory(INVENTORY_PATH))
+        if resolved["path"] is None or not (Path(resolved["path"]) / "state_dict.bin").is_file():
+            print("Model not present. Use the downloader to fetch the model or mount models/ into the container.")
+            return 3
+        try:
+            import torch  # type: ignore
+        except Exception:
+            print("PyTorch not available in this environment. For a full run install the runtime or use the Docker worker image.")
+            return 4
+        from model_snapshot import export_snapshot
+
+        name = resolved["name"].split("/")[-1]
+        out = args.out or str(MODELS_DIR / "snapshots" / (name + ("-int8" if args.quantize else "")))
+        manifest = export_snapshot(resolved["path"], out, quantize=args.quantize, name=resolved["name"])
+        print(json.dumps({"snapshot": out, "quantized": manifest["quantized"],
+                          "quantized_tensors": manifest["quantized_tensors"]}, indent=2))
+        return 0
+
+    if args.cmd in ("run", "bench"):
         if not check_model_path(args.model):
             print("Model not present. Use the downloader to fetch the model or mount models/ into the container.")
             return 3
@@ -69,7 +266,27 @@ def main():
             print("PyTorch not available in this environment. For a full run install the runtime or use the Docker worker image.")
             return 4
 
-        print(f"Would run model {args.model} for {args.seconds}s (scaffold). Implement inference in `scripts/generate_with_musicgen.py` or extend this CLI.")
+        if args.cmd == "run":
+            ok = run_generation(args.model, args.seconds, args.instrument, args.prompt, args.output, args.seed)
+            return 0 if ok else 5
+
+        modes = [m.strip() for m in args.accel.split(",") if m.strip()]
+        if "none" not in modes:
+            modes.insert(0, "none")
+        reports = {mode: bench(args.model, args.durations, args.batch_sizes, args.chunk_seconds, args.repeats,
+                               accel=mode) for mode in modes}
+        if len(reports) == 1:
+            report = reports[modes[0]]
+        else:
+            report = {
+                "modes": reports,
+                "speedup": compare_modes(reports),
+                "drift": [quality_drift(args.model, mode, args.durations[0]) for mode in modes if mode != "none"],
+            }
+        print(json.dumps(report, indent=2))
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
         return 0
 
     parser.print_help()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Shared MusicGen inference for Harmonia.
+
+Model loading (through the `model_registry` warm pool), seeding, sampling
+parameters and the actual `generate` / windowed `generate_continuation` calls
+live here so `generate_musicgen_audio.py`, its `--serve` worker and
+`musicgen_cli.py run|bench` all drive the model the same way. Output handling
+(post-processing, WAV encoding, cache, sidecars) stays with the callers.
+
+torch and audiocraft are imported on first use.
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from model_registry import ModelPool
+from model_snapshot import is_snapshot, load_snapshot
+
+DEFAULT_MODEL = os.environ.get('MUSICGEN_MODEL', 'facebook/musicgen-small')
+
+# Default sampling parameters passed to `set_generation_params`. Every job carries
+# its own copy (overridable per job) alongside its duration and optional seed.
+GENERATION_PARAMS = {
+    'temperature': 1.0,
+    'top_k': 250,
+    'top_p': 0.0,
+    'cfg_coef': 3.0,
+}
+
+# Models configured on a Windows host can hand ffmpeg temp paths under this
+# prefix; inside the Linux worker they live in /tmp. See `ffmpeg_temp_path_shim`.
+FOREIGN_TEMP_PREFIX = os.environ.get('HARMONIA_FOREIGN_TEMP_PREFIX', 'C:/Users/Sanford/AppData/Local/Temp/')
+
+# MusicGen attends over at most this many seconds of audio per call.
+MAX_WINDOW_SECONDS = 30
+
+# Inference modes selectable per job ("accel"):
+#   none        - float32 model, default torch threading (the original behaviour)
+#   cpu         - dynamic int8 quantization of the LM's Linear layers, torch threads
+#                 sized to the container's CPU quota, torch.inference_mode
+#   cpu-compile - as "cpu", plus torch.compile of the LM (slow first call)
+ACCEL_MODES = ('none', 'cpu', 'cpu-compile')
+DEFAULT_ACCEL = os.environ.get('MUSICGEN_ACCEL', 'none')
+
+_THREADS_LOCK = threading.Lock()
+_threads_configured = None
+
+
+# Active ffmpeg_temp_path_shim blocks: the prefixes they rewrite (a refcount each)
+# and the subprocess functions saved when the first one installed the wrappers
+_SHIM_LOCK = threading.Lock()
+_shim_prefixes = {}
+_shim_originals = None
+
+
+def _install_ffmpeg_shim():
+    global _shim_originals
+    _shim_originals = original_call, original_run, original_popen = (
+        subprocess.call, subprocess.run, subprocess.Popen)
+
+    def rewrite(cmd):
+        if isinstance(cmd, list) and cmd and isinstance(cmd[0], str) and 'ffmpeg' in cmd[0]:
+            for prefix in list(_shim_prefixes):
+                cmd = [arg.replace(prefix, '/tmp/') if isinstance(arg, str) else arg for arg in cmd]
+        return cmd
+
+    class ShimPopen(original_popen):
+        def __init__(self, cmd, *args, **kwargs):
+            super().__init__(rewrite(cmd), *args, **kwargs)
+
+    subprocess.call = lambda cmd, *args, **kwargs: original_call(rewrite(cmd), *args, **kwargs)
+    subprocess.run = lambda cmd, *args, **kwargs: original_run(rewrite(cmd), *args, **kwargs)
+    subprocess.Popen = ShimPopen
+
+
+@contextmanager
+def ffmpeg_temp_path_shim(prefix: str = FOREIGN_TEMP_PREFIX):
+    """Rewrite `prefix` to /tmp/ in ffmpeg commands started inside this block.
+
+    Only wraps subprocess.call/run/Popen while at least one block is active
+    (MusicGen load and generation); the wrappers are installed by the first
+    block to enter and removed by the last to leave, so overlapping blocks on
+    worker slot threads restore the real functions. Disable with
+    HARMONIA_FFMPEG_PATH_SHIM=0.
+    """
+    global _shim_originals
+    if not prefix or os.environ.get('HARMONIA_FFMPEG_PATH_SHIM', '1') == '0':
+        yield
+        return
+
+    with _SHIM_LOCK:
+        if not _shim_prefixes:
+            _install_ffmpeg_shim()
+        _shim_prefixes[prefix] = _shim_prefixes.get(prefix, 0) + 1
+    try:
+        yield
+    finally:
+        with _SHIM_LOCK:
+            _shim_prefixes[prefix] -= 1
+            if not _shim_prefixes[prefix]:
+                del _shim_prefixes[prefix]
+            if not _shim_prefixes:
+                subprocess.call, subprocess.run, subprocess.Popen = _shim_originals
+                _shim_originals = None
+
+
+def cpu_quota() -> int:
+    """CPUs this process may use: the cgroup CPU quota if set, else the affinity mask size."""
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max', 'r', encoding='utf-8') as f:
+            limit, period = f.read().split()[:2]
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r', encoding='utf-8') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r', encoding='utf-8') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is None:
+        return available
+    return max(1, min(available, int(quota)))
+
+
+def configure_cpu_threads(threads: int = None) -> int:
+    """Size torch's intra-op pool to `threads` (default: the CPU quota) and inter-op to 1.
+
+    MusicGen decodes one token step at a time, so intra-op parallelism is what helps;
+    more threads than the quota allows only cause throttling. Applied once per process.
+    """
+    global _threads_configured
+    import torch
+
+    with _THREADS_LOCK:
+        if _threads_configured is None:
+            _threads_configured = threads or cpu_quota()
+            torch.set_num_threads(_threads_configured)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # Only settable before any inter-op work has started
+                pass
+        return _threads_configured
+
+
+def optimize_for_cpu(model, compile_graph: bool = False):
+    """Quantize the LM's Linear layers to dynamic int8 in place; optionally compile the LM.
+
+    The EnCodec decoder is left in float32: it is cheap and sensitive to precision.
+    """
+    import torch
+
+    configure_cpu_threads()
+    torch.ao.quantization.quantize_dynamic(model.lm, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if compile_graph:
+        try:
+            model.lm = torch.compile(model.lm)
+        except Exception as e:
+            print(f"Warning: torch.compile unavailable, continuing without it: {e}")
+    return model
+
+
+def load_musicgen(resolved: dict):
+    """Load MusicGen from a `model_registry.resolve_model()` result (plus its "accel" mode).
+
+    Exported snapshots (see model_snapshot.py) are memory-mapped; CPU modes prefer a
+    pre-quantized "<snapshot>-int8" sibling when one exists.
+    """
+    accel = resolved.get('accel') or 'none'
+    path = resolved['path']
+    if is_snapshot(path):
+        if accel != 'none' and is_snapshot(f'{path}-int8'):
+            path = f'{path}-int8'
+        with ffmpeg_temp_path_shim():
+            model = load_snapshot(path)
+        quantized = json.loads((Path(path) / 'snapshot.json').read_text(encoding='utf-8')).get('quantized')
+        if accel != 'none':
+            if quantized:
+                configure_cpu_threads()
+            else:
+                optimize_for_cpu(model, compile_graph=accel == 'cpu-compile')
+        return model
+
+    from audiocraft.models import MusicGen
+
+    # The CPU modes stay on CPU even where CUDA is present (dynamic int8 is CPU-only)
+    device = 'cpu' if accel != 'none' else None
+    with ffmpeg_temp_path_shim():
+        model = MusicGen.get_pretrained(path or resolved['name'], device=device)
+    if accel != 'none':
+        optimize_for_cpu(model, compile_graph=accel == 'cpu-compile')
+    return model
+
+
+def _inference_context(job: dict):
+    if (job.get('accel') or 'none') == 'none':
+        return nullcontext()
+    import torch
+
+    return torch.inference_mode()
+
+
+# Models loaded by this process. The `--serve` worker keeps up to
+# MUSICGEN_MAX_MODELS of them warm (LRU-unloaded beyond that or beyond
+# MUSICGEN_MODEL_MEMORY_BYTES); one-shot CLI runs load exactly once.
+MODEL_POOL = ModelPool(load_musicgen)
+
+
+def get_model(model_name: str = DEFAULT_MODEL, slot: int = 0, accel: str = None):
+    """Return a loaded MusicGen model, loading it on first use.
+
+    `model_name` may be a variant ("small", "medium", "melody"), a Hugging Face id
+    or a directory. `accel` is one of ACCEL_MODES; each mode is a separate pool
+    entry. MusicGen is not safe to drive from several threads at once, so each
+    worker slot gets its own instance.
+    """
+    accel = accel or 'none'
+    if accel not in ACCEL_MODES:
+        raise ValueError(f"Unknown accel mode {accel!r}; expected one of {', '.join(ACCEL_MODES)}")
+    return MODEL_POOL.get(model_name, slot, accel)
+
+
+def apply_generation_params(model, job: dict, duration: float = None):
+    model.set_generation_params(
+        duration=job['duration'] if duration is None else duration,  # seconds
+        use_sampling=True,
+        **{name: job[name] for name in GENERATION_PARAMS},
+    )
+
+
+def seed_everything(seed: int):
+    """Seed Python, numpy and torch RNG state so a generation can be reproduced."""
+    import numpy as np
+    import torch
+
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    torch.manual_seed(seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed_all(seed)
+
+
+def generate_audio(model, prompts: list, job: dict):
+    """Generate one clip per prompt with `job`'s duration, sampling params and seed.
+
+    Returns the model output, a (batch, channels, samples) float tensor at
+    `model.sample_rate`.
+    """
+    if job.get('seed') is not None:
+        seed_everything(job['seed'])
+    apply_generation_params(model, job)
+    with ffmpeg_temp_path_shim(), _inference_context(job):
+        return model.generate(prompts, progress=True)
+
+
+def generate_windows(model, job: dict, chunk_seconds: float = 10.0, context_seconds: float = 5.0):
+    """Yield `job`'s audio as consecutive (channels, samples) windows of about `chunk_seconds`.
+
+    The first window comes from `model.generate`; each later one from
+    `model.generate_continuation`, prompted with the last `context_seconds` of audio,
+    so only that context is kept in memory. The windows together may fall short of
+    `job['duration']` if the model stops early; they never exceed it.
+    """
+    import torch
+
+    if context_seconds + chunk_seconds > MAX_WINDOW_SECONDS:
+        raise ValueError(f"context_seconds + chunk_seconds must not exceed MusicGen's {MAX_WINDOW_SECONDS}s window")
+    sample_rate = model.sample_rate
+    total = int(job['duration'] * sample_rate)
+    context_len = int(context_seconds * sample_rate)
+    if job.get('seed') is not None:
+        seed_everything(job['seed'])
+
+    apply_generation_params(model, job, min(chunk_seconds, job['duration']))
+    with ffmpeg_temp_path_shim(), _inference_context(job):
+        chunk = model.generate([job['prompt']], progress=True)[0]
+    context = chunk[..., -context_len:]
+    produced = 0
+    while True:
+        take = min(chunk.shape[-1], total - produced)
+        yield chunk[..., :take]
+        produced += take
+        if produced >= total:
+            return
+        step = min(chunk_seconds, (total - produced) / sample_rate)
+        apply_generation_params(model, job, context.shape[-1] / sample_rate + step)
+        with ffmpeg_temp_path_shim(), _inference_context(job):
+            continued = model.generate_continuation(context[None], sample_rate, [job['prompt']], progress=True)[0]
+        chunk = continued[..., context.shape[-1]:]
+        if chunk.shape[-1] == 0:
+            return
+        context = torch.cat([context, chunk], dim=-1)[..., -context_len:]
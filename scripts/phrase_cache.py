@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Phrase-level cache of rendered DiffSinger vocals for Harmonia.
+
+Each phrase of a .ds project is cached on its own, keyed by everything that
+determines how it sounds: its text, phonemes and phoneme durations, notes
+and note durations, pitch curve and any other synthesis input in the phrase,
+plus content hashes of the acoustic checkpoint (and config) and of the
+vocoder. A phrase's `offset` only places it in the song and is not part of
+the key, so moving a phrase does not re-render it.
+
+When one lyric line changes, only its phrase goes through the model; the
+cached phrases are spliced back around it with the usual gap filling and
+overlap cross-fades (`diffsinger_infer_helper.assemble_phrases`).
+
+Storage is a `StemCache` (LRU under a byte cap) of 16-bit phrase WAVs.
+Usage:
+    python3 scripts/phrase_cache.py stats [--cache-dir DIR]
+    python3 scripts/phrase_cache.py clear [--cache-dir DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from migrate_checkpoint import load_index, save_index, source_digest
+from stem_cache import StemCache
+
+DEFAULT_CACHE_DIR = os.environ.get('DIFFSINGER_PHRASE_CACHE_DIR', '/workspace/artifacts/phrase_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('DIFFSINGER_PHRASE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Phrase fields that only position the phrase in the song
+POSITION_FIELDS = ('offset',)
+
+
+def default_cache():
+    """The phrase cache at DIFFSINGER_PHRASE_CACHE_DIR, or None when DIFFSINGER_PHRASE_CACHE=0."""
+    if os.environ.get('DIFFSINGER_PHRASE_CACHE', '1') == '0':
+        return None
+    return PhraseCache()
+
+
+def files_digest(paths: list, digest_dir: str) -> str:
+    """Combined content hash of `paths`; per-file digests are memoized by size and mtime."""
+    index = load_index(digest_dir)
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode('utf-8') + b'\0' + source_digest(path, index).encode('ascii'))
+    save_index(index, digest_dir)
+    return h.hexdigest()
+
+
+def phrase_key(param: dict, acoustic_hash: str, vocoder_hash: str) -> str:
+    """Return the sha256 hex digest identifying one rendered phrase."""
+    canonical = {
+        'phrase': {k: v for k, v in param.items() if k not in POSITION_FIELDS},
+        'acoustic': acoustic_hash,
+        'vocoder': vocoder_hash,
+    }
+    data = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class PhraseCache:
+    """Rendered phrase waveforms in a `StemCache`, keyed by `phrase_key()`."""
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.store = StemCache(root, max_bytes)
+
+    def model_hashes(self, acoustic_files: list, vocoder_files: list) -> tuple:
+        digest_dir = os.path.join(self.root, 'digests')
+        return files_digest(acoustic_files, digest_dir), files_digest(vocoder_files, digest_dir)
+
+    def get(self, key: str):
+        """(waveform, sample rate) of a cached phrase, or None on a miss."""
+        from diffsinger_infer_helper import read_wav
+
+        with tempfile.TemporaryDirectory(prefix='phrase-') as tmp:
+            path = os.path.join(tmp, 'phrase.wav')
+            if not self.store.get(key, path):
+                return None
+            return read_wav(path)
+
+    def put(self, key: str, waveform, sample_rate: int):
+        from diffsinger_infer_helper import write_wav
+
+        with tempfile.TemporaryDirectory(prefix='phrase-') as tmp:
+            self.store.put(key, write_wav(os.path.join(tmp, 'phrase.wav'), waveform, sample_rate))
+
+
+def fetch_or_render(cache, key: str, param: dict, render, sample_rate: int) -> tuple:
+    """(waveform, rendered) for one phrase: from `cache` when present, else `render(param)`
+    (stored for next time). `cache` may be None to always render."""
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None and cached[1] == sample_rate:
+        return cached[0], False
+    waveform = render(param)
+    if cache is not None:
+        cache.put(key, waveform, sample_rate)
+    return waveform, True
+
+
+def render_song(params: list, keys: list, cache, render, sample_rate: int) -> tuple:
+    """Render a song phrase by phrase, reusing cached phrases.
+
+    `keys` are the phrases' `phrase_key()`s; `render(param)` is only called on
+    a miss. Returns (assembled waveform, number of phrases rendered).
+    """
+    from diffsinger_infer_helper import assemble_phrases
+
+    results = [fetch_or_render(cache, key, param, render, sample_rate) for param, key in zip(params, keys)]
+    return assemble_phrases(params, [waveform for waveform, _ in results], sample_rate), sum(r for _, r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the DiffSinger phrase cache")
+    parser.add_argument('command', choices=('stats', 'clear'))
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Cache directory')
+    args = parser.parse_args()
+
+    cache = PhraseCache(args.cache_dir)
+    if args.command == 'stats':
+        print(json.dumps(cache.store.stats(), indent=2))
+    else:
+        cache.store.clear()
+        print(f"Cleared phrase cache at {args.cache_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Timed, logged subprocess runs for Harmonia's render scripts.
+
+`run_logged` starts a command without a shell in its own process group and
+streams its combined stdout/stderr to a log file (and to our stdout) as it
+arrives, keeping only the last lines in memory. The job is killed, with its
+whole process group, when it exceeds a wall-clock timeout, prints nothing
+for `idle_timeout` seconds (any bytes count, so `\r` progress bars keep it
+alive), or grows past a resident memory limit.
+"""
+import codecs
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+# Lines of output kept in memory for error messages
+TAIL_LINES = 50
+# Largest chunk of output read at once
+READ_BYTES = 64 * 1024
+# Seconds between timeout / memory checks
+POLL_SECONDS = 0.5
+# Seconds a killed job gets to exit after SIGTERM before SIGKILL
+KILL_GRACE_SECONDS = 5
+
+
+def split_command(cmd) -> list:
+    """A command as an argv list; strings are split like a POSIX shell would, without running one."""
+    return shlex.split(cmd) if isinstance(cmd, str) else [str(arg) for arg in cmd]
+
+
+def _tree_pids(pid: int) -> list:
+    """`pid` and its descendants (Linux /proc; just `pid` elsewhere)."""
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children', 'r', encoding='ascii') as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            pass
+    return pids
+
+
+def tree_rss_bytes(pid: int) -> int:
+    """Resident memory of `pid` and its descendants, or 0 where /proc is unavailable."""
+    total = 0
+    for current in _tree_pids(pid):
+        try:
+            with open(f'/proc/{current}/status', 'r', encoding='ascii') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            pass
+    return total
+
+
+def _kill_group(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run_logged(cmd, log_path: str, timeout: float = None, idle_timeout: float = None,
+               memory_bytes: int = None, cwd: str = None, env: dict = None, echo: bool = True) -> dict:
+    """Run `cmd` (argv list, or a string split with shlex) and stream its output to `log_path`.
+
+    Returns {returncode, killed, seconds, peak_rss_bytes, tail, log}. `killed`
+    is None, or why the job was stopped: 'timeout', 'idle' or 'memory'.
+    """
+    argv = split_command(cmd)
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    tail = deque(maxlen=TAIL_LINES)
+    last_output = [time.monotonic()]
+    started = time.monotonic()
+    killed = None
+    peak_rss = 0
+
+    with open(log_path, 'ab', buffering=0) as log:
+        log.write(f'$ {shlex.join(argv)}\n'.encode('utf-8'))
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                cwd=cwd, env=env, start_new_session=True)
+
+        def pump():
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            partial = ''
+            while True:
+                chunk = proc.stdout.read1(READ_BYTES)
+                if not chunk:
+                    break
+                last_output[0] = time.monotonic()
+                log.write(chunk)
+                text = decoder.decode(chunk)
+                if echo:
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                # Progress bars redraw with \r: each redraw counts as a line of the tail
+                lines = (partial + text).replace('\r', '\n').split('\n')
+                partial = lines.pop()
+                tail.extend(line for line in lines if line)
+            partial += decoder.decode(b'', final=True)
+            if partial:
+                tail.append(partial)
+
+        reader = threading.Thread(target=pump, daemon=True)
+        reader.start()
+        while proc.poll() is None:
+            now = time.monotonic()
+            if memory_bytes or sys.platform.startswith('linux'):
+                peak_rss = max(peak_rss, tree_rss_bytes(proc.pid))
+            if timeout and now - started > timeout:
+                killed = 'timeout'
+            elif idle_timeout and now - last_output[0] > idle_timeout:
+                killed = 'idle'
+            elif memory_bytes and peak_rss > memory_bytes:
+                killed = 'memory'
+            if killed:
+                log.write(f'[killed: {killed}]\n'.encode('utf-8'))
+                _kill_group(proc)
+                break
+            try:
+                proc.wait(POLL_SECONDS)
+            except subprocess.TimeoutExpired:
+                pass
+        reader.join(KILL_GRACE_SECONDS)
+
+    return {
+        'returncode': proc.returncode,
+        'killed': killed,
+        'seconds': round(time.monotonic() - started, 2),
+        'peak_rss_bytes': peak_rss,
+        'tail': list(tail),
+        'log': log_path,
+    }
@@ -4,13 +4,29 @@ Simple DiffSinger wrapper for Harmonia.
 Usage: python3 scripts/run_diffsinger.py <meta_json_path> <output_wav_path>
 
 This script attempts to import DiffSinger and run a minimal inference.
+When a DiffSinger session (scripts/diffsinger_session.py) is listening, the
+render goes to it and reuses its loaded models; otherwise the one-shot helper
+runs in a subprocess under process_runner.run_logged: its output streams to
+/workspace/generate_script/debug/, and it is killed (with its process group)
+after DIFFSINGER_TIMEOUT seconds, DIFFSINGER_IDLE_TIMEOUT seconds without
+output, or once it holds more than DIFFSINGER_MEMORY_BYTES of RAM (0 = no limit).
 If DiffSinger isn't available, it writes a placeholder WAV file with the lyrics text encoded as bytes.
 """
 import json
+import socket
 import sys
 import os
+import time
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from process_runner import run_logged, split_command
+
+LOG_DIR = '/workspace/generate_script/debug'
+JOB_TIMEOUT = float(os.environ.get('DIFFSINGER_TIMEOUT', 1800))
+JOB_IDLE_TIMEOUT = float(os.environ.get('DIFFSINGER_IDLE_TIMEOUT', 600))
+JOB_MEMORY_BYTES = int(os.environ.get('DIFFSINGER_MEMORY_BYTES', 0))
+
 def write_placeholder_wav(out_path, text):
     # Create a small placeholder binary file (not a valid WAV) but helps debugging
     with open(out_path, 'wb') as f:
@@ -18,6 +34,42 @@ def write_placeholder_wav(out_path, text):
         f.write(text.encode('utf-8'))
 
 
+def run_job(cmd, name):
+    """Run one DiffSinger job under the configured limits, logging to LOG_DIR/<name>_<timestamp>_<pid>.log."""
+    log_file = os.path.join(LOG_DIR, f"{name}_{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}.log")
+    return run_logged(cmd, log_file, timeout=JOB_TIMEOUT or None, idle_timeout=JOB_IDLE_TIMEOUT or None,
+                      memory_bytes=JOB_MEMORY_BYTES or None)
+
+
+def render_via_session(meta, out_path, meta_path):
+    """Render through a running DiffSinger session. Returns the WAV path, or None when
+    no session is listening, it does not reply within DIFFSINGER_TIMEOUT seconds or the
+    render failed (the caller then runs the helper)."""
+    from diffsinger_session import DEFAULT_SOCKET, request
+
+    if not os.path.exists(DEFAULT_SOCKET):
+        return None
+    payload = {'cmd': 'render', 'meta': meta, 'out_path': os.path.abspath(out_path)}
+    if meta.get('ds_project'):
+        # The session runs from /opt/DiffSinger; resolve the project as the helper does
+        payload['project'] = os.path.join(os.path.dirname(os.path.abspath(meta_path)), meta['ds_project'])
+    try:
+        reply = request(payload, DEFAULT_SOCKET, timeout=JOB_TIMEOUT or None)
+    except socket.timeout:
+        # Closing the connection cancels the render, so the session stops before writing out_path
+        print(f'DiffSinger session did not answer within {JOB_TIMEOUT:g}s; cancelled it, running the helper instead')
+        return None
+    except (OSError, ValueError) as e:
+        print('DiffSinger session unreachable, running the helper instead:', e)
+        return None
+    if not reply.get('ok'):
+        print('DiffSinger session render failed, running the helper instead:', reply.get('error'))
+        return None
+    print(f"DiffSinger session rendered {reply['wav']} in {reply['seconds']}s "
+          f"({reply['rendered']}/{reply['phrases']} phrases rendered, the rest cached)")
+    return reply['wav']
+
+
 def run_diffsinger(meta_path, out_path):
     try:
         # Do not attempt to import heavy ML packages here; prefer invoking the
@@ -30,13 +82,17 @@ def run_diffsinger(meta_path, out_path):
         lyrics = meta.get('lyrics', '')
         title = meta.get('title', 'song')
 
+        # A user-provided command bypasses the session
+        if not meta.get('diffsinger_cmd') and render_via_session(meta, out_path, meta_path):
+            return 0
+
         # If the upstream cloned repo's infer script exists, prefer invoking it (best-effort).
         infer_script = '/opt/DiffSinger/scripts/infer.py'
         if os.path.isfile(infer_script):
             try:
                 # If there are checkpoints in the workspace (models/diffsinger/*),
-                # copy them into the cloned repo's checkpoints folder so infer.py
-                # can find them by --exp.
+                # link them into the cloned repo's checkpoints folder so infer.py
+                # can find them by --exp (a symlink, not a copy of the weights).
                 try:
                     import glob
                     workspace_ckpts = sorted(glob.glob('/workspace/models/diffsinger/*'))
@@ -49,92 +105,87 @@ def run_diffsinger(meta_path, out_path):
                             dest = os.path.join(chk_dest_root, base)
                             if not os.path.exists(dest):
                                 try:
-                                    shutil.copytree(src, dest)
-                                    print(f'Copied checkpoint {src} -> {dest}')
-                                except Exception as e:
-                                    print(f'Warning: failed to copy checkpoint {src} -> {dest}: {e}')
+                                    os.symlink(os.path.abspath(src), dest, target_is_directory=os.path.isdir(src))
+                                    print(f'Linked checkpoint {src} -> {dest}')
+                                except OSError:
+                                    try:
+                                        shutil.copytree(src, dest)
+                                        print(f'Copied checkpoint {src} -> {dest}')
+                                    except Exception as e:
+                                        print(f'Warning: failed to copy checkpoint {src} -> {dest}: {e}')
                 except Exception as _:
                     pass
 
-                # If the metadata provides an explicit command, run that. Otherwise run a dry-run help command to ensure infer is callable.
-                import subprocess
+                # If the metadata provides an explicit command, run that. Otherwise run the programmatic helper.
                 if meta.get('diffsinger_cmd'):
-                    cmd = meta['diffsinger_cmd']
+                    # Run without a shell; {out_path}, {out_dir} and {title} in the arguments are filled in
+                    fields = {'out_path': os.path.abspath(out_path), 'out_dir': os.path.dirname(os.path.abspath(out_path)), 'title': title}
+                    cmd = [arg.format(**fields) for arg in split_command(meta['diffsinger_cmd'])]
                     print('Running user-provided DiffSinger command:', cmd)
-                    res = subprocess.run(cmd, shell=True)
-                    if res.returncode == 0:
+                    started = time.time()
+                    res = run_job(cmd, 'diffsinger_cmd')
+                    if res['returncode'] == 0 and not res['killed']:
                         print('DiffSinger external command completed successfully.')
-                        write_placeholder_wav(out_path, f'DiffSinger external command completed for: {title}\n\n(see container logs)')
+                        if os.path.isfile(out_path) and os.path.getmtime(out_path) >= started:
+                            print('DiffSinger: command wrote', out_path)
+                        else:
+                            write_placeholder_wav(out_path, f'DiffSinger external command completed for: {title}\n\n(see {res["log"]})')
                         return 0
                     else:
                         print('DiffSinger external command failed, falling back to placeholder.')
                 else:
-                    # Try calling infer.py acoustic with any checkpoint we copied. Use a sample .ds file
-                    # from the cloned repo as an input to get a realistic exercise of the pipeline.
-                    sample_ds = '/opt/DiffSinger/samples/03_撒娇八连.ds'
-                    out_dir = os.path.dirname(out_path) or '/workspace/generated/songs'
+                    out_dir = os.path.dirname(os.path.abspath(out_path)) or '/workspace/generated/songs'
                     # Prefer programmatic invocation to avoid CLI parsing differences.
                     try:
                         # Pre-migrate any old-format checkpoint found in the embedded folder.
                         ckpt_dir = '/opt/DiffSinger/checkpoints/0102_xiaoma_pe'
-                        orig_ckpt = None
-                        migrated_ckpt = None
                         try:
                             import glob
-                            found = glob.glob(ckpt_dir + '/model_ckpt_steps_*.ckpt')
+                            found = [p for p in glob.glob(ckpt_dir + '/model_ckpt_steps_*.ckpt')
+                                     if not p.endswith('.migrated.ckpt')]
                             if found:
                                 orig_ckpt = sorted(found)[-1]
-                                migrated_ckpt = orig_ckpt.replace('.ckpt', '.migrated.ckpt')
-                                if not os.path.exists(migrated_ckpt):
-                                    print('Migrating checkpoint', orig_ckpt, '->', migrated_ckpt)
-                                    try:
-                                        subprocess.run(['python3', '/workspace/scripts/migrate_checkpoint.py', orig_ckpt, migrated_ckpt], check=True)
-                                        print('Migration finished')
-                                    except Exception as e:
-                                        print('Checkpoint migration failed:', e)
+                                migrated_ckpt = orig_ckpt[:-len('.ckpt')] + '.migrated.ckpt'
+                                # Always run: migration is cached by the checkpoint's content hash, so
+                                # an unchanged checkpoint only costs a stat, and a replaced one is redone
+                                print('Migrating checkpoint', orig_ckpt, '->', migrated_ckpt)
+                                res = run_job(['python3', '/workspace/scripts/migrate_checkpoint.py', orig_ckpt, migrated_ckpt], 'migrate')
+                                if res['returncode'] == 0 and not res['killed']:
+                                    print('Migration finished')
+                                else:
+                                    print('Checkpoint migration failed:', res['killed'] or f"exit {res['returncode']}")
                         except Exception:
                             pass
 
-                        # Use a helper script (workspace) to run programmatic DiffSinger invocation
-                        cmd = ['python3', '/workspace/scripts/diffsinger_infer_helper.py', out_dir, title]
-                        print('Running programmatic DiffSinger helper:', cmd)
-                        import time
-                        ts = time.strftime('%Y%m%dT%H%M%S')
-                        log_dir = '/workspace/generate_script/debug'
-                        try:
-                            os.makedirs(log_dir, exist_ok=True)
-                        except Exception:
-                            pass
-                        log_file = os.path.join(log_dir, f'diffsinger_{ts}.log')
+                        # Use a helper script (workspace) to run programmatic DiffSinger invocation. It renders
+                        # into a private job directory, so concurrent renders into out_dir never see each
+                        # other's files, and its one output is moved onto out_path.
                         import shutil
-                        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                        out, _ = proc.communicate()
+                        import tempfile
+                        job_dir = tempfile.mkdtemp(prefix='.diffsinger-', dir=out_dir)
                         try:
-                            with open(log_file, 'wb') as lf:
-                                lf.write(out or b'')
-                        except Exception:
-                            pass
-                        res = proc
-                        stdout = (out.decode('utf-8', errors='replace') if out else '')
-                        stderr = ''
-                        print('Program log saved to', log_file)
-                        print('programmatic infer exit', res.returncode)
-                        if res.returncode == 0:
-                            try:
-                                import glob
-                                candidates = glob.glob(os.path.join(out_dir, '*.wav'))
-                                if candidates:
-                                    chosen = sorted(candidates)[-1]
-                                    shutil.copy(chosen, out_path)
-                                    print('DiffSinger: copied generated wav', chosen, '->', out_path)
+                            cmd = ['python3', '/workspace/scripts/diffsinger_infer_helper.py', job_dir, 'render']
+                            if meta.get('ds_project'):
+                                cmd.append(os.path.join(os.path.dirname(os.path.abspath(meta_path)), meta['ds_project']))
+                            print('Running programmatic DiffSinger helper:', cmd)
+                            res = run_job(cmd, 'diffsinger')
+                            print('Program log saved to', res['log'])
+                            print('programmatic infer exit', res['returncode'], f"({res['seconds']}s)")
+                            artifact = os.path.join(job_dir, 'render.wav')
+                            if res['killed']:
+                                print(f"Programmatic DiffSinger run killed ({res['killed']}). See log:", res['log'])
+                            elif res['returncode'] == 0:
+                                if os.path.isfile(artifact):
+                                    os.replace(artifact, out_path)
+                                    print('DiffSinger: moved generated wav', artifact, '->', out_path)
                                     return 0
-                            except Exception as e:
-                                print('Error copying generated wav:', e)
-                            write_placeholder_wav(out_path, f'DiffSinger ran but no output found. stdout:\n{stdout}\nstderr:\n{stderr}')
-                            return 0
-                        else:
-                            print('Programmatic DiffSinger run failed. See log:', log_file)
-                            print(stdout)
+                                tail = '\n'.join(res['tail'])
+                                write_placeholder_wav(out_path, f'DiffSinger ran but no output found. Log tail:\n{tail}')
+                                return 0
+                            else:
+                                print('Programmatic DiffSinger run failed. See log:', res['log'])
+                        finally:
+                            shutil.rmtree(job_dir, ignore_errors=True)
                     except Exception as e:
                         print('Programmatic DiffSinger invocation error:', e)
             except Exception as e:
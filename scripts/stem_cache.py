@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of generated stems for Harmonia.
+
+Generated audio is stored under a key derived from everything that determines
+the output: model id, prompt, duration, the sampling parameters
+(temperature, top_k, top_p, cfg_coef, seed) and post-processing. A repeated request is served by
+copying the cached WAV instead of running MusicGen again.
+
+The cache has a size cap; when it is exceeded, least recently used entries are
+evicted. Usage:
+    python3 scripts/stem_cache.py stats [--cache-dir DIR]
+    python3 scripts/stem_cache.py clear [--cache-dir DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows hosts: fall back to the in-process lock only
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.environ.get('MUSICGEN_CACHE_DIR', '/workspace/artifacts/stem_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('MUSICGEN_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
+# Parameters that make up a cache key, in canonical order.
+KEY_FIELDS = ('model', 'prompt', 'duration', 'temperature', 'top_k', 'top_p', 'cfg_coef', 'seed', 'postprocess')
+# Parameters that only enter the key when set, so entries cached before they
+# existed keep their keys.
+OPTIONAL_KEY_FIELDS = ('accel',)
+
+
+def cache_key(params: dict) -> str:
+    """Return the sha256 hex digest identifying a generation request."""
+    canonical = {field: params.get(field) for field in KEY_FIELDS}
+    canonical.update({field: params[field] for field in OPTIONAL_KEY_FIELDS if params.get(field) is not None})
+    data = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class StemCache:
+    """On-disk LRU cache of generated WAV files keyed by `cache_key()`."""
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.objects_dir = self.root / 'objects'
+        self.index_path = self.root / 'index.json'
+        self._lock = threading.Lock()
+
+    def _object_path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f'{key}.wav'
+
+    @contextmanager
+    def _locked(self):
+        """Serialize index updates across threads and (where supported) processes."""
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / '.lock', 'a+') as lf:
+                if fcntl is not None:
+                    fcntl.flock(lf, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _load_index(self) -> dict:
+        try:
+            with self.index_path.open('r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault('entries', {})
+        index.setdefault('stats', {'hits': 0, 'misses': 0, 'evictions': 0})
+        return index
+
+    def _save_index(self, index: dict):
+        tmp = self.index_path.with_suffix('.json.tmp')
+        with tmp.open('w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+
+    def contains(self, key: str) -> bool:
+        """Return True if `key` is cached, without touching hit/miss stats or LRU order."""
+        with self._locked():
+            entry = self._load_index()['entries'].get(key)
+        return entry is not None and self._object_path(key).is_file()
+
+    def get(self, key: str, dest_path: str) -> bool:
+        """Materialize the cached stem for `key` at `dest_path`. Returns False on a miss."""
+        with self._locked():
+            index = self._load_index()
+            entry = index['entries'].get(key)
+            src = self._object_path(key)
+            if entry is None or not src.is_file():
+                if entry is not None:
+                    index['entries'].pop(key, None)
+                index['stats']['misses'] += 1
+                self._save_index(index)
+                return False
+            _place_file(src, Path(dest_path))
+            entry['last_access'] = time.time()
+            index['stats']['hits'] += 1
+            self._save_index(index)
+            return True
+
+    def put(self, key: str, src_path: str, params: dict = None):
+        """Store a generated stem under `key`, evicting LRU entries beyond the size cap."""
+        src = Path(src_path)
+        size = src.stat().st_size
+        if size > self.max_bytes:
+            return
+        with self._locked():
+            index = self._load_index()
+            _place_file(src, self._object_path(key))
+            index['entries'][key] = {
+                'size': size,
+                'last_access': time.time(),
+                'params': ({field: params.get(field) for field in KEY_FIELDS + OPTIONAL_KEY_FIELDS}
+                           if params is not None else None),
+            }
+            self._evict(index)
+            self._save_index(index)
+
+    def _evict(self, index: dict):
+        entries = index['entries']
+        total = sum(e['size'] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]['size']
+            del entries[key]
+            try:
+                self._object_path(key).unlink()
+            except OSError:
+                pass
+            index['stats']['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._locked():
+            index = self._load_index()
+        stats = dict(index['stats'])
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'entries': len(index['entries']),
+            'total_bytes': sum(e['size'] for e in index['entries'].values()),
+            'max_bytes': self.max_bytes,
+            'hit_rate': (stats['hits'] / lookups) if lookups else None,
+        })
+        return stats
+
+    def clear(self):
+        with self._locked():
+            shutil.rmtree(self.objects_dir, ignore_errors=True)
+            self._save_index({})
+
+
+def _place_file(src: Path, dest: Path):
+    """Copy `src` to `dest`, replacing `dest` atomically.
+
+    Copies rather than hardlinks: callers may later rewrite an output path in
+    place, which must never alter the cached object.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f'.{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the generated stem cache")
+    parser.add_argument('command', choices=('stats', 'clear'))
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Cache directory')
+    args = parser.parse_args()
+
+    cache = StemCache(args.cache_dir)
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == 'clear':
+        cache.clear()
+        print(f"Cleared stem cache at {args.cache_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
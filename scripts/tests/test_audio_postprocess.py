@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from scripts.audio_postprocess import as_batch, integrated_loudness, normalize_peak, postprocess
+
+
+def _sine(freq=440.0, seconds=1.0, sr=32000, amp=0.25, channels=1, batch=1):
+    t = np.arange(int(seconds * sr), dtype=np.float32) / sr
+    wave = (amp * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return np.tile(wave, (batch, channels, 1))
+
+
+def test_as_batch_reshapes_without_copy():
+    mono = np.zeros(100, dtype=np.float32)
+    assert as_batch(mono).shape == (1, 1, 100)
+    assert as_batch(mono).base is mono
+    stereo = np.zeros((2, 100), dtype=np.float32)
+    assert as_batch(stereo).shape == (1, 2, 100)
+
+
+def test_default_matches_peak_normalized_int16():
+    audio = _sine(amp=0.25, batch=2)
+    audio[1] *= 0.5
+    out = postprocess(audio, 32000)
+    assert out.dtype == np.int16 and out.shape == audio.shape
+    # Each batch item is normalized independently to full scale
+    assert abs(int(out[0].max()) - 32767) <= 1
+    assert abs(int(out[1].max()) - 32767) <= 1
+
+
+def test_peak_normalization_is_in_place():
+    audio = _sine(amp=0.1)
+    result = normalize_peak(audio, peak_db=-6.0)
+    assert result is audio
+    assert abs(float(audio.max()) - 10 ** (-6 / 20)) < 1e-3
+
+
+def test_fades_dc_and_float_output():
+    audio = _sine(amp=0.5) + 0.1
+    out = postprocess(audio, 32000, {'dc_remove': True, 'fade_in_ms': 10, 'fade_out_ms': 10, 'dtype': 'float32'})
+    assert out.dtype == np.float32
+    assert abs(float(out.mean())) < 1e-3
+    assert out[0, 0, 0] == 0.0 and abs(float(out[0, 0, -1])) < 1e-6
+
+
+def test_lufs_normalization_reaches_target():
+    audio = _sine(freq=1000.0, seconds=3.0, amp=0.05)
+    out = postprocess(audio, 32000, {'normalize': 'lufs', 'lufs': -20.0, 'dtype': 'float32'})
+    assert abs(integrated_loudness(out[0], 32000) - (-20.0)) < 0.5
+
+
+def test_dither_stays_within_one_lsb():
+    audio = _sine(amp=0.5)
+    plain = postprocess(audio.copy(), 32000, {'normalize': 'none'})
+    dithered = postprocess(audio.copy(), 32000, {'normalize': 'none', 'dither': True})
+    assert np.abs(plain.astype(np.int32) - dithered.astype(np.int32)).max() <= 2
@@ -0,0 +1,35 @@
+import zipfile
+
+import pytest
+
+from scripts.checkpoint_inspect import ZIP_ALIGNMENT, load_skeleton, rewrite, tensor_table
+
+torch = pytest.importorskip('torch')
+
+
+def test_lists_tensors_without_loading_them(tmp_path):
+    path = tmp_path / 'model.ckpt'
+    torch.save({'state_dict': {'proj.weight': torch.zeros(3, 4), 'steps': torch.tensor(5)}, 'category': 'acoustic'},
+               path)
+    assert tensor_table(path) == [
+        {'key': 'state_dict.proj.weight', 'dtype': 'float32', 'shape': [3, 4], 'bytes': 48},
+        {'key': 'state_dict.steps', 'dtype': 'int64', 'shape': [], 'bytes': 8},
+    ]
+
+
+def test_rewrite_wraps_and_stays_loadable(tmp_path):
+    src, out = tmp_path / 'raw.ckpt', tmp_path / 'wrapped.ckpt'
+    state = {'proj.weight': torch.randn(16, 8), 'proj.bias': torch.randn(16)}
+    torch.save(state, src)
+    rewrite(src, out, wrap=True, category='acoustic')
+
+    loaded = torch.load(out, map_location='cpu')
+    assert loaded['category'] == 'acoustic'
+    assert all(torch.equal(loaded['state_dict'][k], v) for k, v in state.items())
+    # Records stay aligned, so the rewritten file can still be memory-mapped
+    with zipfile.ZipFile(out) as zf:
+        for info in zf.infolist():
+            assert (info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)) % ZIP_ALIGNMENT == 0
+    mapped = torch.load(out, map_location='cpu', mmap=True)
+    assert torch.equal(mapped['state_dict']['proj.bias'], state['proj.bias'])
+    assert list(load_skeleton(out)) == ['category', 'state_dict']
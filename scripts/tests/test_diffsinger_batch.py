@@ -0,0 +1,52 @@
+import json
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scripts import diffsinger_batch
+from scripts.diffsinger_batch import load_song
+from scripts.diffsinger_infer_helper import assemble_phrases, write_wav
+
+
+def test_phrases_are_placed_at_offsets_and_overlaps_cross_faded():
+    params = [{'offset': 0.0}, {'offset': 1.0}, {'offset': 1.5}]
+    waveforms = [np.ones(8), np.full(6, 0.5), np.full(4, 0.25)]
+    audio = assemble_phrases(params, waveforms, sample_rate=10)
+    # gap of 2 samples of silence, then a 2-sample overlap cross-fade from 0.5 to 0.25
+    assert audio.shape == (19,)
+    np.testing.assert_allclose(audio[:8], 1.0)
+    np.testing.assert_allclose(audio[8:10], 0.0)
+    np.testing.assert_allclose(audio[10:15], 0.5)
+    np.testing.assert_allclose(audio[15:17], [0.5, 0.25])
+    np.testing.assert_allclose(audio[17:], 0.25)
+
+
+def test_load_song_and_write_wav(tmp_path):
+    project = tmp_path / 'verse.ds'
+    project.write_text(json.dumps([{'offset': 0}, {'offset': 2}]), encoding='utf-8')
+    meta = tmp_path / 'meta.json'
+    meta.write_text(json.dumps({'title': 'Song', 'ds_project': 'verse.ds'}), encoding='utf-8')
+    assert load_song(str(project)) == {'title': 'verse', 'params': [{'offset': 0}, {'offset': 2}]}
+    assert load_song(str(meta))['title'] == 'Song'
+
+    out = write_wav(str(tmp_path / 'out' / 'song.wav'), np.array([0.0, 0.5, -2.0]), 44100)
+    with wave.open(out) as w:
+        assert (w.getframerate(), w.getnframes()) == (44100, 3)
+        assert np.frombuffer(w.readframes(3), '<i2').tolist() == [0, 16383, -32767]
+
+
+def test_songs_sharing_a_title_are_all_rendered(tmp_path, monkeypatch):
+    monkeypatch.setattr(diffsinger_batch, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(diffsinger_batch, '_init_worker', lambda threads: None)
+    monkeypatch.setattr(diffsinger_batch, '_render', lambda param: (np.full(4, param['level']), 10))
+    songs = [{'title': 'song', 'params': [{'offset': 0, 'level': 0.5}]},
+             {'title': 'song', 'params': [{'offset': 0, 'level': 0.25}, {'offset': 1, 'level': 0.25}]},
+             {'title': 'Other', 'params': [{'offset': 0, 'level': 0.125}]}]
+
+    results = diffsinger_batch.render_songs(songs, str(tmp_path), workers=2)
+    assert [(r['title'], os.path.basename(r['wav'])) for r in results] == [
+        ('song', 'song.wav'), ('song', 'song-2.wav'), ('Other', 'Other.wav')]
+    with wave.open(results[1]['wav']) as w:
+        assert w.getnframes() == 14
@@ -20,3 +20,54 @@ def test_diffsinger_infer_helper_missing_imports():
         or '/opt/DiffSinger' in combined
         or 'Failed' in combined
     )
+
+
+def test_vocoder_resolution_is_recorded_and_reused(tmp_path, monkeypatch):
+    from scripts import diffsinger_infer_helper as helper
+
+    workspace = tmp_path / 'workspace' / 'hifigan'
+    (workspace / 'release').mkdir(parents=True)
+    (workspace / 'release' / 'model_ckpt_steps_1.ckpt').write_bytes(b'vocoder')
+    (workspace / 'release' / 'config.yaml').write_text('k: v')
+    repo_vocoder = tmp_path / 'repo' / 'checkpoints' / 'hifigan'
+    monkeypatch.setattr(helper, 'DIFFSINGER_ROOT', str(tmp_path / 'repo'))
+    monkeypatch.setattr(helper, 'VOCODER_DIR', str(repo_vocoder))
+    monkeypatch.setattr(helper, 'WORKSPACE_VOCODER_DIR', str(workspace))
+    monkeypatch.setattr(helper, 'VOCODER_SEARCH_ROOTS', (str(workspace),))
+    manifest = str(workspace / '.harmonia_resolved.json')
+
+    hparams = {'vocoder_ckpt': 'hifigan/model_ckpt_steps_0.ckpt'}
+    helper.resolve_vocoder(hparams, manifest)
+    linked = repo_vocoder / 'model_ckpt_steps_1.ckpt'
+    assert hparams['vocoder_ckpt'] == str(linked)
+    assert os.path.samefile(linked, workspace / 'release' / 'model_ckpt_steps_1.ckpt')
+    assert (repo_vocoder / 'config.yaml').exists()
+
+    # A later run validates the manifest instead of searching, and restores missing links
+    monkeypatch.setattr(helper, 'find_first_ckpt', None)
+    os.unlink(linked)
+    hparams = {'vocoder_ckpt': 'hifigan/model_ckpt_steps_0.ckpt'}
+    helper.resolve_vocoder(hparams, manifest)
+    assert hparams['vocoder_ckpt'] == str(linked) and linked.exists()
+
+    # A changed source invalidates the manifest
+    (workspace / 'release' / 'model_ckpt_steps_1.ckpt').write_bytes(b'retrained vocoder')
+    assert helper.load_resolved('hifigan/model_ckpt_steps_0.ckpt', manifest) is None
+
+
+def test_cancelled_render_does_not_write_the_output(tmp_path, monkeypatch):
+    import numpy as np
+    import pytest
+    from scripts import diffsinger_infer_helper as helper
+
+    calls = []
+    monkeypatch.setattr(helper, 'render_phrase', lambda infer, param, hparams: calls.append(param) or np.ones(4))
+    hparams = {'audio_sample_rate': 10}
+    params = [{'offset': 0}, {'offset': 1}]
+    out = tmp_path / 'song.wav'
+
+    with pytest.raises(helper.HelperError) as e:
+        helper.render_to_file(params, hparams, str(out), lambda: None, cancelled=lambda: len(calls) == 1)
+    assert e.value.code == 6 and calls == [{'offset': 0}] and not out.exists()
+    assert helper.render_to_file(params, hparams, str(out), lambda: None, cancelled=lambda: False) == 2
+    assert out.exists()
@@ -0,0 +1,93 @@
+import json
+import socketserver
+import threading
+import time
+
+from scripts.diffsinger_session import SessionHandler, project_params, request
+from scripts.run_diffsinger import render_via_session
+
+
+class FakeSession:
+    renders = 0
+
+    def __init__(self):
+        self.requests = []
+
+    def render(self, req, cancelled=None):
+        self.renders += 1
+        self.requests.append(req)
+        return {'wav': req['out_path'], 'phrases': 0, 'rendered': 0}
+
+    def status(self):
+        return {'ok': True, 'renders': self.renders}
+
+
+def _serve(socket_path, session):
+    SessionHandler.session = session
+    server = socketserver.ThreadingUnixStreamServer(socket_path, SessionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_render_and_ping_over_the_socket(tmp_path):
+    socket_path = str(tmp_path / 'session.sock')
+    server = _serve(socket_path, FakeSession())
+    try:
+        reply = request({'cmd': 'render', 'out_path': '/out/song.wav', 'params': []}, socket_path, timeout=5)
+        assert reply['ok'] and reply['wav'] == '/out/song.wav'
+        assert request({'cmd': 'ping'}, socket_path, timeout=5) == {'ok': True, 'renders': 1}
+        assert request({'cmd': 'nope'}, socket_path, timeout=5)['ok'] is False
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_project_params_sources(tmp_path):
+    project = tmp_path / 'song.ds'
+    project.write_text(json.dumps({'text': 'la', 'offset': 0}), encoding='utf-8')
+    assert project_params({'params': {'text': 'a'}}) == [{'text': 'a'}]
+    assert project_params({'project': str(project)}) == [{'text': 'la', 'offset': 0}]
+    assert project_params({'meta': {'ds_project': str(project)}}) == [{'text': 'la', 'offset': 0}]
+
+
+def test_wrapper_sends_the_project_resolved_against_the_meta_file(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / 'session.sock')
+    # run_diffsinger imports the session module from scripts/ on sys.path
+    monkeypatch.setattr('diffsinger_session.DEFAULT_SOCKET', socket_path)
+    session = FakeSession()
+    server = _serve(socket_path, session)
+    try:
+        meta_path = tmp_path / 'lyrics' / 'meta.json'
+        wav = render_via_session({'ds_project': 'song.ds'}, str(tmp_path / 'out.wav'), str(meta_path))
+        assert wav == str(tmp_path / 'out.wav')
+        assert session.requests[0]['project'] == str(tmp_path / 'lyrics' / 'song.ds')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_wrapper_falls_back_when_the_session_does_not_answer(tmp_path, monkeypatch):
+    class StuckSession(FakeSession):
+        cancelled = threading.Event()
+
+        def render(self, req, cancelled=None):
+            deadline = time.time() + 5
+            while time.time() < deadline and not cancelled():
+                time.sleep(0.05)
+            if cancelled():
+                self.cancelled.set()
+                raise RuntimeError('cancelled')
+            return super().render(req)
+
+    socket_path = str(tmp_path / 'session.sock')
+    monkeypatch.setattr('diffsinger_session.DEFAULT_SOCKET', socket_path)
+    monkeypatch.setattr('scripts.run_diffsinger.JOB_TIMEOUT', 0.2)
+    session = StuckSession()
+    server = _serve(socket_path, session)
+    try:
+        assert render_via_session({}, str(tmp_path / 'out.wav'), str(tmp_path / 'meta.json')) is None
+        # the timed-out client's disconnect cancels the session's render
+        assert session.cancelled.wait(5) and session.renders == 0
+    finally:
+        server.shutdown()
+        server.server_close()
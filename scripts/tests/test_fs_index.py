@@ -0,0 +1,42 @@
+import os
+
+from scripts.fs_index import FsIndex
+
+
+def age(*dirs):
+    """Backdate directory mtimes so the index treats them as settled."""
+    for d in dirs:
+        os.utime(d, ns=(10 ** 18, 10 ** 18))
+
+
+def test_incremental_update_follows_directory_changes(tmp_path):
+    root = tmp_path / 'models'
+    (root / 'org' / 'snap').mkdir(parents=True)
+    (root / 'org' / 'snap' / 'model.bin').write_bytes(b'x' * 100)
+    (root / 'org' / 'config.json').write_bytes(b'{}')
+    (root / 'org' / '__pycache__').mkdir()
+    (tmp_path / 'models2').mkdir()
+    (tmp_path / 'models2' / 'other.bin').write_bytes(b'y')
+    age(root, root / 'org', root / 'org' / 'snap')
+
+    index = FsIndex(str(tmp_path / 'index.sqlite'))
+    assert index.update(root)['scanned'] == 3
+    index.update(tmp_path / 'models2')
+    assert sorted(os.path.relpath(p, root) for p, _ in index.files(root)) == ['org/config.json', 'org/snap/model.bin']
+    assert index.subdirs(root) == ['org']
+    assert index.folder_summary(root / 'org', top=1) == {
+        'size_bytes': 102, 'files_count': 2, 'top_files': [{'path': os.path.join('snap', 'model.bin'), 'size_bytes': 100}]}
+
+    # Unchanged directories are not listed again
+    assert index.update(root)['scanned'] == 0
+    (root / 'org' / 'snap' / 'extra.bin').write_bytes(b'z' * 5)
+    assert index.update(root)['scanned'] == 1
+    assert index.folder_summary(root)['files_count'] == 3
+
+    (root / 'org' / 'snap' / 'extra.bin').unlink()
+    (root / 'org' / 'snap' / 'model.bin').unlink()
+    (root / 'org' / 'snap').rmdir()
+    index.update(root)
+    assert [os.path.basename(p) for p, _ in index.files(root)] == ['config.json']
+    assert index.folder_summary(tmp_path / 'models2')['files_count'] == 1
+    index.close()
@@ -0,0 +1,181 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'generate_musicgen_audio.py')
+
+
+def test_import_does_not_load_torch_or_patch_subprocess():
+    code = (f"import subprocess, sys; sys.path.insert(0, {os.path.dirname(SCRIPT)!r}); run = subprocess.run; "
+            "import generate_musicgen_audio; "
+            "assert 'torch' not in sys.modules and 'audiocraft' not in sys.modules; "
+            "assert subprocess.run is run")
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_dry_run_lists_jobs_and_cache_state(tmp_path):
+    proc = subprocess.run([sys.executable, SCRIPT, '--instruments', 'piano,drums', '--dry-run',
+                           '--output-dir', str(tmp_path), '--cache-dir', str(tmp_path / 'cache'), '--seed', '3'],
+                          capture_output=True, text=True, check=True)
+    jobs = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [j['instrument'] for j in jobs] == ['piano', 'drums']
+    assert all(j['seed'] == 3 and not j['cached'] for j in jobs)
+    assert jobs[0]['output'] == str(tmp_path / 'piano.wav')
+    assert not list(tmp_path.glob('*.wav'))
+
+
+def test_ffmpeg_temp_path_shim_is_scoped():
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import generate_musicgen_audio as gen
+
+    original = subprocess.run
+    with gen.ffmpeg_temp_path_shim('C:/Temp/'):
+        assert subprocess.run is not original
+    assert subprocess.run is original
+
+
+def test_overlapping_ffmpeg_shims_restore_subprocess():
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import generate_musicgen_audio as gen
+
+    originals = (subprocess.call, subprocess.run, subprocess.Popen)
+    first_in, second_in = threading.Event(), threading.Event()
+
+    def first():
+        with gen.ffmpeg_temp_path_shim('C:/Temp/'):
+            first_in.set()
+            assert second_in.wait(5)
+
+    worker = threading.Thread(target=first)
+    worker.start()
+    assert first_in.wait(5)
+    # the first block leaves while the second is still running
+    with gen.ffmpeg_temp_path_shim('C:/Temp/'):
+        second_in.set()
+        worker.join(5)
+        assert subprocess.Popen is not originals[2]
+    assert (subprocess.call, subprocess.run, subprocess.Popen) == originals
+
+
+class FakeModel:
+    sample_rate = 8000
+
+    def set_generation_params(self, **params):
+        self.params = params
+
+    def generate(self, prompts, progress=False):
+        import numpy as np
+
+        t = np.arange(self.params['duration'] * self.sample_rate, dtype=np.float32) / self.sample_rate
+        return np.stack([np.sin(2 * np.pi * 440 * t)[None, :] * (i + 1) for i in range(len(prompts))])
+
+
+def test_generate_batch_writes_wavs_and_sidecars(tmp_path):
+    pytest.importorskip('soundfile')
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import generate_musicgen_audio as gen
+
+    jobs = [gen.make_job(name, str(tmp_path / f'{name}.wav'), duration=1) for name in ('piano', 'drums')]
+    audio = {}
+    assert gen.generate_batch(jobs, model=FakeModel(), audio_out=audio) == [True, True]
+    for idx, job in enumerate(jobs):
+        with open(job['output'], 'rb') as f:
+            assert f.read() == audio[idx] and audio[idx][:4] == b'RIFF'
+        with open(gen.sidecar_path(job['output']), encoding='utf-8') as f:
+            assert json.load(f)['source'] == 'generated'
+    assert not list(tmp_path.glob('.*.tmp'))
+
+
+def test_thin_client_waits_out_a_full_queue():
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import generate_musicgen_audio as gen
+
+    replies = [(503, {'Retry-After': '0'}, {'error': 'queue full'}),
+               (200, {}, {'results': [{'success': True}]})]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            code, headers, payload = replies.pop(0)
+            self.send_response(code)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(json.dumps(payload).encode('utf-8'))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f'http://127.0.0.1:{server.server_port}'
+        assert gen.request_generation(url, [{'instrument': 'piano'}]) == [True]
+        replies.append((503, {'Retry-After': '0'}, {'error': 'queue full'}))
+        assert gen.request_generation(url, [{'instrument': 'piano'}], max_retries=0) == [False]
+    finally:
+        server.shutdown()
+
+
+def test_generate_job_id_can_be_polled_while_waiting(tmp_path):
+    import threading
+    import urllib.error
+    import urllib.request
+    from http.server import ThreadingHTTPServer
+
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import generate_musicgen_audio as gen
+    from job_queue import JobQueue
+
+    release = threading.Event()
+
+    def runner(req, slot):
+        release.wait(5)
+        return {'success': True, 'results': []}
+
+    gen.GenerationRequestHandler.queue = JobQueue(runner)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), gen.GenerationRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+
+    def post(body):
+        req = urllib.request.Request(url + '/generate', data=json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    job = {'instrument': 'piano', 'output': str(tmp_path / 'piano.wav'), 'job_id': 'exp-1'}
+    replies = []
+    waiter = threading.Thread(target=lambda: replies.append(post(job)))
+    try:
+        waiter.start()
+        status = None
+        for _ in range(100):
+            try:
+                with urllib.request.urlopen(url + '/jobs/exp-1', timeout=5) as resp:
+                    status = json.loads(resp.read())
+                break
+            except urllib.error.HTTPError:
+                time.sleep(0.05)
+        assert status['status'] in ('queued', 'running') and 'eta_seconds' in status
+        assert post(job) == 409
+        assert post({**job, 'job_id': '../x'}) == 400
+        release.set()
+        waiter.join(10)
+        assert replies == [200]
+    finally:
+        release.set()
+        server.shutdown()
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from scripts.job_queue import JobQueue, QueueFull
+
+
+def _blocking_runner(release: threading.Event, seen: list):
+    def run(payload, slot):
+        seen.append((payload['name'], slot))
+        release.wait(5)
+        return {'success': payload.get('ok', True)}
+    return run
+
+
+def test_bounded_queue_rejects_when_full():
+    release, seen = threading.Event(), []
+    queue = JobQueue(_blocking_runner(release, seen), slots=1, max_queued=2)
+    running = queue.submit({'name': 'a', 'audio_seconds': 5})
+    first = queue.submit({'name': 'b', 'audio_seconds': 5})
+    # Wait until the slot has taken the first job, so only 'b' is pending
+    while queue.status(running['id'])['status'] != 'running':
+        time.sleep(0.01)
+    second = queue.submit({'name': 'c', 'audio_seconds': 5})
+    with pytest.raises(QueueFull) as exc:
+        queue.submit({'name': 'd'})
+    assert exc.value.retry_after > 0
+
+    assert queue.status(first['id'])['position'] == 1
+    assert queue.status(second['id'])['position'] == 2
+    # Later jobs wait longer
+    assert queue.status(second['id'])['eta_seconds'] > queue.status(first['id'])['eta_seconds']
+    assert queue.stats()['rejected'] == 1
+
+    release.set()
+    assert queue.wait(second['id'], timeout=5)['status'] == 'done'
+    assert [name for name, _ in seen] == ['a', 'b', 'c']
+
+
+def test_failed_and_raising_jobs_are_reported():
+    def run(payload, slot):
+        if payload['name'] == 'boom':
+            raise RuntimeError('model exploded')
+        return {'success': False}
+
+    queue = JobQueue(run, slots=2)
+    failed = queue.wait(queue.submit({'name': 'bad'})['id'], timeout=5)
+    raised = queue.wait(queue.submit({'name': 'boom'})['id'], timeout=5)
+    assert failed['status'] == 'failed' and failed['progress'] == 1.0
+    assert raised['status'] == 'failed' and raised['error'] == 'model exploded'
+    assert queue.status('missing') is None
+
+
+def test_caller_chosen_job_ids():
+    release, seen = threading.Event(), []
+    queue = JobQueue(_blocking_runner(release, seen), slots=1)
+    assert queue.submit({'name': 'a'}, 'export-1')['id'] == 'export-1'
+    assert queue.status('export-1')['status'] in ('queued', 'running')
+    with pytest.raises(ValueError):
+        queue.submit({'name': 'b'}, 'export-1')
+    release.set()
+    assert queue.wait('export-1', timeout=5)['status'] == 'done'
@@ -0,0 +1,71 @@
+import os
+import pickle
+
+import pytest
+
+from scripts.checkpoint_inspect import LEGACY_MAGIC, load_skeleton, top_level_keys
+from scripts.migrate_checkpoint import find_checkpoints, load_index, migrate, migrate_tree
+
+
+def _legacy_ckpt(path, obj):
+    # torch.save's legacy layout: magic, protocol, sys info, then the object
+    with open(path, 'wb') as f:
+        for value in (LEGACY_MAGIC, 1001, {'little_endian': True}, obj):
+            pickle.dump(value, f, protocol=2)
+        pickle.dump([], f, protocol=2)
+
+
+def test_new_format_is_detected_from_structure_and_linked(tmp_path):
+    src = tmp_path / 'model_ckpt_steps_1.ckpt'
+    _legacy_ckpt(src, {'category': 'acoustic', 'state_dict': {}})
+    assert top_level_keys(src) == ['category', 'state_dict']
+
+    out = tmp_path / 'model_ckpt_steps_1.migrated.ckpt'
+    cache = tmp_path / 'cache'
+    assert migrate(src, out, cache) == 0
+    assert os.path.samefile(src, out)
+    digest = load_index(cache)[str(src.resolve())]['digest']
+    # Re-running reuses the recorded digest
+    assert migrate(src, out, cache) == 0
+    assert load_index(cache)[str(src.resolve())]['digest'] == digest
+
+
+def test_batch_mode_skips_outputs_and_cache(tmp_path):
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        _legacy_ckpt(tmp_path / name / 'model_ckpt_steps_1.ckpt', {'model': {}})
+    cache = tmp_path / '.migrated'
+    cache.mkdir()
+    (cache / 'deadbeef.ckpt').write_bytes(b'')
+    assert [p.parent.name for p in find_checkpoints(tmp_path, cache)] == ['a', 'b']
+
+    assert migrate_tree(tmp_path, cache, workers=2) == 0
+    assert (tmp_path / 'a' / 'model_ckpt_steps_1.migrated.ckpt').exists()
+    assert len(load_index(cache)) == 2
+    assert len(find_checkpoints(tmp_path, cache)) == 2
+
+
+def test_raw_state_dict_is_wrapped_once(tmp_path):
+    torch = pytest.importorskip('torch')
+    src = tmp_path / 'raw.ckpt'
+    torch.save({'weight': torch.zeros(2)}, src)
+    cache = tmp_path / 'cache'
+    assert migrate(src, tmp_path / 'raw.migrated.ckpt', cache) == 0
+    assert top_level_keys(tmp_path / 'raw.migrated.ckpt') == ['category', 'state_dict', 'meta']
+    assert len(list(cache.glob('*.ckpt'))) == 1
+
+
+def test_raw_state_dict_is_wrapped_by_streaming_rewrite(tmp_path):
+    src = tmp_path / 'model_ckpt_steps_2.ckpt'
+    _legacy_ckpt(src, {'encoder.weight': 1, 'decoder.bias': 2})
+    with open(src, 'ab') as f:
+        f.write(b'\x07' * 4096)  # stands in for the raw storage bytes
+    out = tmp_path / 'model_ckpt_steps_2.migrated.ckpt'
+    cache = tmp_path / 'cache'
+    assert migrate(src, out, cache) == 0
+
+    skeleton = load_skeleton(out)
+    assert skeleton['category'] == 'acoustic'
+    assert skeleton['state_dict'] == {'encoder.weight': 1, 'decoder.bias': 2}
+    assert out.read_bytes().endswith(b'\x07' * 4096)
+    assert [p.name for p in cache.glob('*.ckpt')] == [skeleton['meta']['source_digest'] + '.ckpt']
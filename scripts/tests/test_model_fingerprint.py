@@ -0,0 +1,43 @@
+import os
+
+from scripts import model_fingerprint as mf
+
+
+def test_fingerprint_reads_samples_and_escalates_on_mismatch(tmp_path):
+    weights = tmp_path / 'org' / 'model.bin'
+    weights.parent.mkdir()
+    data = bytearray(os.urandom(2 * 1024 * 1024))
+    weights.write_bytes(data)
+    (tmp_path / 'config.json').write_text('{}')
+
+    manifest = mf.record(str(tmp_path), min_size=1024)
+    assert list(manifest['files']) == ['org/model.bin']
+    assert mf.verify(str(tmp_path)) == {'org/model.bin': {'status': 'ok', 'escalated': False}}
+
+    # A byte between samples slips past the fingerprint alone...
+    data[mf.SAMPLE_BYTES + 10] ^= 0xFF
+    weights.write_bytes(data)
+    assert mf.verify(str(tmp_path))['org/model.bin']['status'] == 'ok'
+    # ...while a changed head is caught and confirmed by the full hash
+    data[0] ^= 0xFF
+    weights.write_bytes(data)
+    assert mf.verify(str(tmp_path))['org/model.bin'] == {'status': 'changed', 'escalated': True}
+    assert mf.verify(str(tmp_path), escalate=False)['org/model.bin'] == {'status': 'changed', 'escalated': False}
+
+    weights.write_bytes(data[:-1])
+    assert mf.verify(str(tmp_path))['org/model.bin']['status'] == 'changed'
+    weights.unlink()
+    assert mf.verify(str(tmp_path))['org/model.bin']['status'] == 'missing'
+
+
+def test_stale_fingerprint_is_refreshed_when_the_full_hash_matches(tmp_path):
+    (tmp_path / 'model.bin').write_bytes(os.urandom(3 * 1024 * 1024))
+    mf.record(str(tmp_path), min_size=1024, samples=2)
+    manifest = mf.load_manifest(str(tmp_path))
+    manifest['files']['model.bin']['fingerprint'] = 'stale'
+    mf.save_manifest(manifest, str(tmp_path))
+
+    assert mf.verify(str(tmp_path), refresh=False)['model.bin']['escalated'] is True
+    assert mf.load_manifest(str(tmp_path))['files']['model.bin']['fingerprint'] == 'stale'
+    assert mf.verify(str(tmp_path))['model.bin']['escalated'] is True
+    assert mf.verify(str(tmp_path))['model.bin'] == {'status': 'ok', 'escalated': False}
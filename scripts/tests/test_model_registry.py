@@ -0,0 +1,116 @@
+import threading
+
+from scripts.model_registry import ModelPool, canonical_name, resolve_model
+
+
+def _snapshot(models_dir, repo_id, rev='abc123', size=100):
+    repo_dir = models_dir / 'facebook' / repo_id.replace('/', '_') / ('models--' + repo_id.replace('/', '--'))
+    snap = repo_dir / 'snapshots' / rev
+    snap.mkdir(parents=True)
+    (snap / 'state_dict.bin').write_bytes(b'\0' * size)
+    (snap / 'compression_state_dict.bin').write_bytes(b'\0' * 10)
+    (repo_dir / 'refs').mkdir()
+    (repo_dir / 'refs' / 'main').write_text(rev)
+    return snap
+
+
+def test_resolves_variants_to_local_snapshots(tmp_path):
+    snap = _snapshot(tmp_path, 'facebook/musicgen-small')
+    assert canonical_name('small') == canonical_name('musicgen-small') == 'facebook/musicgen-small'
+
+    resolved = resolve_model('small', tmp_path, inventory=[])
+    assert resolved == {'name': 'facebook/musicgen-small', 'path': str(snap), 'bytes': 110}
+    # Missing weights fall back to the Hugging Face id with an estimated size
+    medium = resolve_model('medium', tmp_path, inventory=[])
+    assert medium['path'] is None and medium['bytes'] > 0
+
+
+def test_inventory_paths_from_another_host_are_rerooted(tmp_path):
+    snap = _snapshot(tmp_path, 'facebook/musicgen-melody')
+    inventory = [{'repo_id': 'facebook/musicgen-melody',
+                  'local_path': 'C:/repos/harmonia/models/facebook/facebook_musicgen-melody'}]
+    assert resolve_model('melody', tmp_path, inventory)['path'] == str(snap)
+
+
+def test_pool_unloads_least_recently_used():
+    sizes = {'facebook/musicgen-small': 1, 'facebook/musicgen-medium': 4, 'facebook/musicgen-melody': 4}
+    loads = []
+
+    def resolver(name):
+        name = canonical_name(name)
+        return {'name': name, 'path': None, 'bytes': sizes[name]}
+
+    def loader(resolved):
+        loads.append(resolved['name'])
+        return object()
+
+    pool = ModelPool(loader, max_models=3, max_bytes=6, resolver=resolver)
+    small = pool.get('small')
+    pool.get('medium')
+    assert pool.get('facebook/musicgen-small') is small
+    # medium is least recently used and melody does not fit beside it
+    pool.get('melody')
+    assert pool.loaded() == ['facebook/musicgen-small', 'facebook/musicgen-melody']
+    assert pool.stats()['evictions'] == 1 and pool.resident_bytes() == 5
+    pool.get('medium')
+    assert loads == ['facebook/musicgen-small', 'facebook/musicgen-medium', 'facebook/musicgen-melody',
+                     'facebook/musicgen-medium']
+
+
+def test_pool_loads_outside_the_lock():
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def resolver(name):
+        return {'name': canonical_name(name), 'path': None, 'bytes': 1}
+
+    def loader(resolved):
+        loads.append(resolved['name'])
+        if resolved['name'] == 'facebook/musicgen-large':
+            started.set()
+            assert release.wait(10)
+        return object()
+
+    pool = ModelPool(loader, max_models=4, max_bytes=0, resolver=resolver)
+    small = pool.get('small')
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(pool.get('large'))) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    assert started.wait(10)
+    # a slow load of one model does not block hits or loads of the others
+    assert pool.get('small') is small
+    pool.get('medium')
+    release.set()
+    for waiter in waiters:
+        waiter.join(10)
+    assert len(results) == 3 and results[0] is results[1] is results[2]
+    assert loads == ['facebook/musicgen-small', 'facebook/musicgen-large', 'facebook/musicgen-medium']
+
+
+def test_pool_can_be_listed_while_slots_load_and_evict():
+    def resolver(name):
+        return {'name': canonical_name(name), 'path': None, 'bytes': 1}
+
+    pool = ModelPool(lambda resolved: object(), max_models=1, max_bytes=0, resolver=resolver)
+    done = threading.Event()
+
+    def churn():
+        for i in range(60):
+            pool.get(('small', 'medium', 'melody')[i % 3], slot=i % 2)
+        done.set()
+
+    threading.Thread(target=churn).start()
+    while not done.is_set():
+        assert len(pool.loaded()) <= 1 and pool.stats()['resident_bytes'] <= 1
+
+
+def test_exported_snapshot_takes_precedence(tmp_path):
+    _snapshot(tmp_path, 'facebook/musicgen-small')
+    exported = tmp_path / 'snapshots' / 'musicgen-small'
+    exported.mkdir(parents=True)
+    (exported / 'snapshot.json').write_text('{}')
+    (exported / 'lm.safetensors').write_bytes(b'\0' * 40)
+    (exported / 'compression.safetensors').write_bytes(b'\0' * 2)
+    assert resolve_model('small', tmp_path, inventory=[]) == {
+        'name': 'facebook/musicgen-small', 'path': str(exported), 'bytes': 42}
@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from scripts.model_snapshot import _assign, _install_int8_linears, quantize_rows, read_safetensors, write_safetensors
+
+
+def test_safetensors_round_trip_is_memory_mapped(tmp_path):
+    tensors = {
+        'linear.weight': torch.randn(8, 4),
+        'linear.bias': torch.randn(8),
+        'codes': torch.arange(6, dtype=torch.int64).reshape(2, 3),
+        'mask': torch.tensor([True, False]),
+        'empty': torch.zeros(0),
+    }
+    path = tmp_path / 'lm.safetensors'
+    write_safetensors(path, tensors, {'format': 'test'})
+
+    loaded, metadata = read_safetensors(path)
+    assert metadata == {'format': 'test'}
+    assert set(loaded) == set(tensors)
+    for name, tensor in tensors.items():
+        assert loaded[name].dtype == tensor.dtype and torch.equal(loaded[name], tensor)
+
+
+def test_quantize_rows_error_is_within_half_a_step():
+    weight = torch.randn(16, 32)
+    q, scale = quantize_rows(weight)
+    assert q.dtype == torch.int8 and scale.shape == (16,)
+    assert (q.float() * scale[:, None] - weight).abs().max() <= scale.max() / 2 + 1e-6
+
+
+def _int8_tensors():
+    source = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.LayerNorm(8))
+    tensors = {k: v.detach().clone() for k, v in source.state_dict().items()}
+    tensors['0.weight'], tensors['0.weight.scale'] = quantize_rows(tensors['0.weight'])
+    return source, tensors
+
+
+def test_int8_snapshot_loads_and_checks_remaining_keys():
+    source, tensors = _int8_tensors()
+    target = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.LayerNorm(8))
+    model = _assign(target, *_install_int8_linears(target, tensors))
+    x = torch.randn(3, 4)
+    assert isinstance(model[0], torch.ao.nn.quantized.dynamic.Linear)
+    assert (model(x) - source(x)).abs().max() < 0.1
+
+    del tensors['1.bias']
+    target = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.LayerNorm(8))
+    with pytest.raises(RuntimeError, match=r"missing keys \['1.bias'\]"):
+        _assign(target, *_install_int8_linears(target, tensors))
@@ -0,0 +1,47 @@
+import numpy as np
+
+from scripts.phrase_cache import PhraseCache, files_digest, phrase_key, render_song
+
+
+def _phrase(text, offset):
+    return {'offset': offset, 'text': text, 'ph_seq': 'l a', 'ph_dur': '0.1 0.3', 'note_seq': 'C4', 'note_dur': '0.4',
+            'f0_seq': '261.6 261.6', 'f0_timestep': '0.005'}
+
+
+def test_key_ignores_position_but_not_content_or_models():
+    base = phrase_key(_phrase('la', 0.0), 'acoustic', 'vocoder')
+    assert phrase_key(_phrase('la', 3.5), 'acoustic', 'vocoder') == base
+    assert phrase_key(_phrase('lo', 0.0), 'acoustic', 'vocoder') != base
+    assert phrase_key(_phrase('la', 0.0), 'acoustic-2', 'vocoder') != base
+    assert phrase_key(_phrase('la', 0.0), 'acoustic', 'vocoder-2') != base
+
+
+def test_only_edited_phrases_are_rendered(tmp_path):
+    cache = PhraseCache(str(tmp_path / 'cache'))
+    calls = []
+
+    def render(param):
+        calls.append(param['text'])
+        return np.full(10, 0.5)
+
+    song = [_phrase('one', 0.0), _phrase('two', 1.0), _phrase('three', 2.0)]
+    keys = [phrase_key(p, 'a', 'v') for p in song]
+    first, rendered = render_song(song, keys, cache, render, sample_rate=10)
+    assert rendered == 3
+
+    song[1] = _phrase('deux', 1.0)
+    keys = [phrase_key(p, 'a', 'v') for p in song]
+    second, rendered = render_song(song, keys, cache, render, sample_rate=10)
+    assert rendered == 1 and calls == ['one', 'two', 'three', 'deux']
+    assert second.shape == first.shape
+    np.testing.assert_allclose(second, first, atol=1e-4)
+
+
+def test_model_hash_tracks_file_contents(tmp_path):
+    ckpt = tmp_path / 'model_ckpt_steps_1.ckpt'
+    ckpt.write_bytes(b'weights')
+    digests = str(tmp_path / 'digests')
+    first = files_digest([str(ckpt)], digests)
+    assert files_digest([str(ckpt)], digests) == first
+    ckpt.write_bytes(b'retrained weights')
+    assert files_digest([str(ckpt)], digests) != first
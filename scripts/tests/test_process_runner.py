@@ -0,0 +1,34 @@
+import sys
+
+from scripts.process_runner import run_logged, split_command
+
+
+def test_output_streams_to_log_and_tail(tmp_path):
+    log = tmp_path / 'job.log'
+    code = 'import sys\nfor i in range(100): print("line", i)\nsys.exit(3)'
+    res = run_logged([sys.executable, '-c', code], str(log), timeout=30, echo=False)
+    assert res['returncode'] == 3 and res['killed'] is None
+    text = log.read_text()
+    assert 'line 0\n' in text and 'line 99\n' in text
+    assert len(res['tail']) == 50 and res['tail'][-1] == 'line 99'
+
+
+def test_timeout_and_idle_kill_the_job(tmp_path):
+    sleeper = [sys.executable, '-c', 'import time; print("start", flush=True); time.sleep(60)']
+    res = run_logged(sleeper, str(tmp_path / 'timeout.log'), timeout=1, echo=False)
+    assert res['killed'] == 'timeout' and res['returncode'] != 0 and res['seconds'] < 30
+    res = run_logged(sleeper, str(tmp_path / 'idle.log'), idle_timeout=1, echo=False)
+    assert res['killed'] == 'idle' and res['tail'] == ['start']
+    assert '[killed: idle]' in (tmp_path / 'idle.log').read_text()
+
+
+def test_carriage_return_progress_is_not_idle(tmp_path):
+    code = ('import sys, time\nfor i in range(8):\n'
+            '    sys.stdout.write(f"\\r{i}/8"); sys.stdout.flush(); time.sleep(0.3)\nprint(" done")')
+    res = run_logged([sys.executable, '-c', code], str(tmp_path / 'progress.log'), idle_timeout=1, echo=False)
+    assert res['killed'] is None and res['returncode'] == 0
+    assert res['tail'][-1] == '7/8 done'
+
+
+def test_split_command_does_not_use_a_shell():
+    assert split_command('echo "a b" ; rm -rf /') == ['echo', 'a b', ';', 'rm', '-rf', '/']
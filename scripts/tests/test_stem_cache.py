@@ -0,0 +1,53 @@
+import os
+from scripts.stem_cache import StemCache, cache_key
+
+
+def _params(**overrides):
+    params = {'model': 'facebook/musicgen-small', 'prompt': 'solo piano', 'duration': 5,
+              'temperature': 1.0, 'top_k': 250, 'top_p': 0.0, 'cfg_coef': 3.0, 'seed': None}
+    params.update(overrides)
+    return params
+
+
+def test_cache_key_depends_on_every_generation_param():
+    base = cache_key(_params())
+    assert base == cache_key(_params())
+    for field, value in (('model', 'facebook/musicgen-medium'), ('prompt', 'solo violin'), ('duration', 10),
+                         ('temperature', 0.9), ('top_k', 100), ('top_p', 0.5), ('cfg_coef', 2.0), ('seed', 7)):
+        assert cache_key(_params(**{field: value})) != base, field
+
+
+def test_put_get_and_stats(tmp_path):
+    cache = StemCache(str(tmp_path / 'cache'), max_bytes=1024)
+    src = tmp_path / 'piano.wav'
+    src.write_bytes(b'RIFF' + b'\0' * 60)
+    key = cache_key(_params())
+
+    dest = tmp_path / 'out' / 'piano.wav'
+    assert not cache.get(key, str(dest))
+    cache.put(key, str(src), _params())
+    assert cache.get(key, str(dest))
+    assert dest.read_bytes() == src.read_bytes()
+
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    assert stats['entries'] == 1 and stats['total_bytes'] == 64
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = StemCache(str(tmp_path / 'cache'), max_bytes=250)
+    keys = []
+    for i in range(3):
+        src = tmp_path / f'stem{i}.wav'
+        src.write_bytes(bytes([i]) * 100)
+        keys.append(cache_key(_params(prompt=f'prompt {i}')))
+        cache.put(keys[-1], str(src))
+        if i == 1:
+            # Touch the first entry so the second becomes least recently used
+            assert cache.get(keys[0], str(tmp_path / 'touch.wav'))
+
+    assert cache.get(keys[0], str(tmp_path / 'a.wav'))
+    assert not cache.get(keys[1], str(tmp_path / 'b.wav'))
+    assert cache.get(keys[2], str(tmp_path / 'c.wav'))
+    assert cache.stats()['evictions'] == 1
+    assert not os.path.exists(cache._object_path(keys[1]))
@@ -2,19 +2,62 @@
 """
 Environment smoke check
 
-Scans `models/` and `datasets/`, computes SHA256 for a selected set of files,
+Scans `models/` and `datasets/`, computes checksums for a selected set of files,
 and compares computed checksums against any recorded checksums (if present).
 
-This script never modifies repository files. It writes a JSON report under
-`tests/env_tests/smoke_report_<timestamp>.json` and prints a concise summary.
+Two tiers of digest are supported. SHA256 is the release tier. The quick
+integrity tier uses the fastest installed of xxh3_128 (`xxhash`), `blake3`
+and BLAKE2b; BLAKE2b comes with hashlib, so it is always available. A recorded
+checksum line may name its algorithm as `<algorithm>:<digest>  <path>`; a
+bare digest is SHA256. Each file is verified with the algorithm its recorded
+checksum uses, and `--algorithm` picks the one for files with no record.
+
+Files are hashed in parallel on a thread pool (hashlib releases the GIL).
+Digests are remembered in a stat cache (`tests/env_tests/checksum_cache.json`)
+keyed by path, size, mtime_ns and inode, so only new or modified files are
+rehashed; `--full` ignores the cache and rehashes everything.
+
+`--fingerprint` checks every file in the sampled fingerprint manifest
+(`models/.fingerprints.json`, see scripts/model_fingerprint.py) instead: a
+few reads per file, with a full hash only for files whose fingerprint no
+longer matches. The manifest is left as it is; `model_fingerprint.py verify`
+refreshes stale fingerprints.
+
+Usage:
+    python tests/env_tests/smoke_check.py [--full] [--workers N] [--algorithm sha256|quick|blake2b|...]
+    python tests/env_tests/smoke_check.py [--top-models N] [--top-datasets N] [--min-size BYTES] [--per-dir-quota N]
+    python tests/env_tests/smoke_check.py --fingerprint
+
+This script never modifies the files it checks. It writes a JSON report under
+`tests/env_tests/smoke_report_<timestamp>.json` and prints a concise summary,
+and keeps its digest cache in `tests/env_tests/checksum_cache.json` and the
+filesystem index in `.cache/fs_index.sqlite` (env HARMONIA_FS_INDEX); both
+are git-ignored.
 """
+import argparse
 import hashlib
+import heapq
 import json
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+import fs_index
+import model_fingerprint
+
+try:
+    import xxhash
+except ImportError:  # optional: quick tier falls back to blake3 / BLAKE2b
+    xxhash = None
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
 
 ROOT = Path.cwd()
 MODELS_DIR = ROOT / "models"
@@ -22,9 +65,37 @@ DATASETS_DIR = ROOT / "datasets"
 CHECKSUMS_FILE = MODELS_DIR / "checksums.sha256"
 REPORT_DIR = ROOT / "tests" / "env_tests"
 REPORT_DIR.mkdir(parents=True, exist_ok=True)
+STAT_CACHE_FILE = REPORT_DIR / "checksum_cache.json"
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# Without recorded checksums: how many of the largest files to hash, and the smallest worth hashing (0: any)
+MODEL_TOP_N = 12
+DATASET_TOP_N = 8
+MIN_SIZE_BYTES = 0
+DEFAULT_ALGORITHM = os.environ.get("SMOKE_HASH_ALGORITHM", "sha256")
+HASH_CHUNK = 8 * 1024 * 1024
+
+ALGORITHMS = {"sha256": hashlib.sha256, "blake2b": hashlib.blake2b}
+if blake3 is not None:
+    ALGORITHMS["blake3"] = lambda: blake3.blake3(max_threads=blake3.blake3.AUTO)
+if xxhash is not None:
+    ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+# Preference order of the quick integrity tier
+QUICK_ALGORITHMS = ("xxh3_128", "blake3", "blake2b")
+
+_buffers = threading.local()
+
+
+def resolve_algorithm(name: str):
+    """Map `quick` to the fastest installed quick-tier algorithm; reject unknown names."""
+    if name == "quick":
+        return next(a for a in QUICK_ALGORITHMS if a in ALGORITHMS)
+    if name not in ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm {name!r} (available: {', '.join(sorted(ALGORITHMS))})")
+    return name
 
 
 def load_recorded_checksums(path: Path):
+    """Recorded checksums: {resolved path: {"algorithm", "digest"}}."""
     if not path.is_file():
         return {}
     checks = {}
@@ -36,24 +107,92 @@ def load_recorded_checksums(path: Path):
             parts = line.split()
             if len(parts) < 2:
                 continue
-            ch = parts[0]
+            algorithm, _, ch = parts[0].rpartition(":")
             p = " ".join(parts[1:]).lstrip("* ")
-            checks[str(Path(p).resolve())] = ch
+            checks[str(Path(p).resolve())] = {"algorithm": algorithm.lower() or "sha256", "digest": ch.lower()}
     return checks
 
 
-def sha256_of_file(path: Path, chunk_size: int = 8 * 1024 * 1024):
-    h = hashlib.sha256()
-    with path.open("rb") as f:
+def hash_file(path: Path, algorithm: str = "sha256", chunk_size: int = HASH_CHUNK):
+    """Hex digest of a file, read with readinto() into a buffer reused across calls on this thread."""
+    h = ALGORITHMS[algorithm]()
+    buf = getattr(_buffers, "buf", None)
+    if buf is None or len(buf) != chunk_size:
+        buf = _buffers.buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
         while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
+            n = f.readinto(buf)
+            if not n:
                 break
-            h.update(chunk)
+            h.update(view[:n])
     return h.hexdigest()
 
 
-def find_files_to_check(models_dir: Path, datasets_dir: Path, recorded_checks: dict):
+def sha256_of_file(path: Path, chunk_size: int = HASH_CHUNK):
+    return hash_file(path, "sha256", chunk_size)
+
+
+def load_stat_cache(path: Path):
+    """Digests from earlier runs: {resolved path: {size, mtime_ns, inode, digests: {algorithm: digest}}}."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_stat_cache(cache: dict, path: Path):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def stat_key(st):
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def cached_digest(cache: dict, key: str, st, algorithm: str):
+    """The cached `algorithm` digest for `key` if the file's size, mtime and inode are unchanged, else None."""
+    entry = cache.get(key)
+    if entry and all(entry.get(field) == value for field, value in stat_key(st).items()):
+        return entry.get("digests", {}).get(algorithm)
+    return None
+
+
+def remember_digest(cache: dict, key: str, st, algorithm: str, digest: str):
+    entry = cache.get(key)
+    if not entry or any(entry.get(field) != value for field, value in stat_key(st).items()):
+        entry = cache[key] = dict(stat_key(st), digests={})
+    entry["digests"][algorithm] = digest
+
+
+def largest_files(entries, n: int, min_size: int = 0, per_dir_quota: int = 0, base: Path = None):
+    """The `n` largest (size, path) of a stream of (path, size), largest first.
+
+    Bounded heaps keep memory constant in the number of files: one heap of
+    `n`, or with `per_dir_quota` one heap of at most that many per top-level
+    folder under `base`, so no single folder takes every slot.
+    """
+    if n <= 0:
+        return []
+    heaps = {}
+    limit = min(n, per_dir_quota) if per_dir_quota else n
+    for path, size in entries:
+        if size < min_size:
+            continue
+        group = Path(path).relative_to(base).parts[0] if per_dir_quota else None
+        heap = heaps.setdefault(group, [])
+        if len(heap) < limit:
+            heapq.heappush(heap, (size, path))
+        elif size > heap[0][0]:
+            heapq.heapreplace(heap, (size, path))
+    return heapq.nlargest(n, (item for heap in heaps.values() for item in heap))
+
+
+def find_files_to_check(models_dir: Path, datasets_dir: Path, recorded_checks: dict, model_top_n: int = MODEL_TOP_N,
+                        dataset_top_n: int = DATASET_TOP_N, min_size: int = MIN_SIZE_BYTES, per_dir_quota: int = 0):
     files = []
 
     # If recorded checks exist, use their paths (preferential)
@@ -62,37 +201,17 @@ def find_files_to_check(models_dir: Path, datasets_dir: Path, recorded_checks: d
             files.append(Path(p))
         return files
 
-    # No recorded checks: pick largest files in models (global top N)
-    # and use dataset inventory top files if present.
-    # Models: gather files > 100MB, sort by size, pick top 12
-    model_files = []
-    if models_dir.is_dir():
-        for root, _, filenames in os.walk(models_dir):
-            for fn in filenames:
-                fp = Path(root) / fn
-                try:
-                    sz = fp.stat().st_size
-                except Exception:
-                    sz = 0
-                model_files.append((sz, fp))
-    model_files.sort(reverse=True)
-    for sz, fp in model_files[:12]:
-        files.append(fp)
-
-    # Datasets: prefer snapshot files / archives; pick top 8
-    dataset_files = []
-    if datasets_dir.is_dir():
-        for root, _, filenames in os.walk(datasets_dir):
-            for fn in filenames:
-                fp = Path(root) / fn
-                try:
-                    sz = fp.stat().st_size
-                except Exception:
-                    sz = 0
-                dataset_files.append((sz, fp))
-    dataset_files.sort(reverse=True)
-    for sz, fp in dataset_files[:8]:
-        files.append(fp)
+    # No recorded checks: pick the largest files of at least `min_size` in models
+    # (top `model_top_n`) and datasets (top `dataset_top_n`), streamed from the
+    # filesystem index, at most `per_dir_quota` from any one top-level folder.
+    index = fs_index.FsIndex()
+    for root, top_n in ((models_dir, model_top_n), (datasets_dir, dataset_top_n)):
+        if not root.is_dir():
+            continue
+        index.update(root)
+        for sz, p in largest_files(index.files(root), top_n, min_size, per_dir_quota, Path(os.path.abspath(root))):
+            files.append(Path(p))
+    index.close()
 
     # Deduplicate while preserving order
     seen = set()
@@ -106,79 +225,180 @@ def find_files_to_check(models_dir: Path, datasets_dir: Path, recorded_checks: d
     return dedup
 
 
-def main():
+def check_file(fp: Path, cache: dict, full: bool, algorithm: str = "sha256"):
+    """Stat and, unless the stat cache still vouches for it, hash one file. Returns its report entry."""
+    info = {"path": str(fp), "exists": False, "size_bytes": None, "algorithm": algorithm, "digest": None,
+            "expected": None, "match": None}
+    try:
+        st = fp.stat()
+    except OSError:
+        return info
+    info["exists"] = True
+    info["size_bytes"] = st.st_size
+    key = str(fp.resolve())
+    ch = None if full else cached_digest(cache, key, st, algorithm)
+    info["cached"] = ch is not None
+    if ch is None:
+        try:
+            ch = hash_file(fp, algorithm)
+        except Exception as e:
+            info["hash_error"] = str(e)
+            return info
+        # Only trust the digest if the file did not change while it was read
+        if stat_key(fp.stat()) == stat_key(st):
+            remember_digest(cache, key, st, algorithm, ch)
+    info["digest"] = ch
+    if algorithm == "sha256":
+        info["sha256"] = ch
+    return info
+
+
+def write_report(summary: dict, results: list):
+    report = {"summary": summary, "results": results}
+    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    out = REPORT_DIR / f"smoke_report_{ts}.json"
+    with out.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print("Summary:")
+    print(json.dumps(summary, indent=2))
+    print(f"Report written to: {out}")
+
+
+def fingerprint_check(manifest: dict):
+    """Verify every file of the fingerprint manifest, escalating mismatches to a full hash.
+
+    Stale fingerprints are reported, not rewritten: refresh them with
+    `scripts/model_fingerprint.py verify`.
+    """
+    files = manifest.get("files", {})
+    print(f"Verifying {len(files)} files by sampled fingerprint (report will be written to {REPORT_DIR})")
+    results = []
+    verified = model_fingerprint.verify(str(MODELS_DIR), refresh=False)
+    for idx, (rel, result) in enumerate(verified.items(), start=1):
+        fp = MODELS_DIR / rel
+        info = {"path": str(fp), "exists": result["status"] != "missing", "size_bytes": files[rel]["size"],
+                "algorithm": "fingerprint", "status": result["status"], "escalated": result["escalated"],
+                "match": result["status"] == "ok"}
+        results.append(info)
+        if result["status"] != "ok" or result["escalated"]:
+            print(f"[{idx}/{len(files)}] {result['status'].upper()}{' (full hash)' if result['escalated'] else ''}: {fp}")
+
+    summary = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "total_files": len(results),
+        "matched": sum(r["match"] for r in results),
+        "missing": sum(not r["exists"] for r in results),
+        "escalated": sum(r["escalated"] for r in results),
+        "algorithms": ["fingerprint"],
+        "has_recorded_checksums": True,
+    }
+    write_report(summary, results)
+    if summary["matched"] != summary["total_files"]:
+        print("Some model files no longer match their fingerprints or are missing.")
+        return 3
+    print("Smoke check completed (no mismatches found).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify checksums of model and dataset files")
+    parser.add_argument("--full", action="store_true", help="Ignore the stat cache and rehash every file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel hashing threads")
+    parser.add_argument("--algorithm", default=DEFAULT_ALGORITHM,
+                        help="Digest for files without a recorded checksum: sha256 (release), quick, "
+                             "or one of " + ", ".join(sorted(ALGORITHMS)) + " (env SMOKE_HASH_ALGORITHM)")
+    parser.add_argument("--top-models", type=int, default=MODEL_TOP_N,
+                        help="Without recorded checksums: largest model files to check")
+    parser.add_argument("--top-datasets", type=int, default=DATASET_TOP_N,
+                        help="Without recorded checksums: largest dataset files to check")
+    parser.add_argument("--min-size", type=int, default=MIN_SIZE_BYTES,
+                        help="Without recorded checksums: skip files smaller than this many bytes (default: no minimum)")
+    parser.add_argument("--per-dir-quota", type=int, default=0,
+                        help="Without recorded checksums: at most this many files per top-level folder (0: no limit)")
+    parser.add_argument("--fingerprint", action="store_true",
+                        help="Check every file in models/.fingerprints.json by sampled fingerprint")
+    args = parser.parse_args(argv)
+    try:
+        algorithm = resolve_algorithm(args.algorithm)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.fingerprint:
+        manifest = model_fingerprint.load_manifest(str(MODELS_DIR))
+        if not manifest.get("files"):
+            print(f"No fingerprint manifest in {MODELS_DIR}; run scripts/model_fingerprint.py record {MODELS_DIR}")
+            return 2
+        return fingerprint_check(manifest)
+
     recorded = load_recorded_checksums(CHECKSUMS_FILE)
 
-    files = find_files_to_check(MODELS_DIR, DATASETS_DIR, recorded)
+    files = find_files_to_check(MODELS_DIR, DATASETS_DIR, recorded, args.top_models, args.top_datasets,
+                                args.min_size, args.per_dir_quota)
     if not files:
         print("No files found to check.")
         return 2
 
-    results = []
+    results = [None] * len(files)
     total = len(files)
     matched = 0
     missing = 0
+    cache = load_stat_cache(STAT_CACHE_FILE)
 
-    print(f"Verifying {total} files (report will be written to {REPORT_DIR})")
+    algorithms = []
+    for fp in files:
+        rec = recorded.get(str(fp.resolve())) if recorded else None
+        algorithms.append(rec["algorithm"] if rec else algorithm)
+    unknown = sorted(set(algorithms) - set(ALGORITHMS))
+    if unknown:
+        print(f"Recorded checksums use unavailable algorithms: {', '.join(unknown)}")
+        return 5
 
-    for idx, fp in enumerate(files, start=1):
-        info = {"path": str(fp), "exists": False, "size_bytes": None, "sha256": None, "expected": None, "match": None}
-        try:
-            rp = fp.resolve()
-        except Exception:
-            rp = fp
-        if not fp.exists():
-            info["exists"] = False
-            missing += 1
-            results.append(info)
-            print(f"[{idx}/{total}] MISSING: {fp}")
-            continue
-        info["exists"] = True
-        try:
-            sz = fp.stat().st_size
-            info["size_bytes"] = sz
-        except Exception:
-            sz = None
-        # compute sha256
-        print(f"[{idx}/{total}] Computing sha256 for {fp} ...", end=" ")
-        try:
-            ch = sha256_of_file(fp)
-            info["sha256"] = ch
-            print("done")
-        except Exception as e:
-            info["sha256_error"] = str(e)
-            print("ERROR computing checksum:", e)
-            results.append(info)
-            continue
+    print(f"Verifying {total} files with {args.workers} threads (report will be written to {REPORT_DIR})")
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(check_file, fp, cache, args.full, algo): idx
+                   for idx, (fp, algo) in enumerate(zip(files, algorithms))}
+        for future in as_completed(futures):
+            info = future.result()
+            results[futures[future]] = info
+            done += 1
+            if not info["exists"]:
+                missing += 1
+                print(f"[{done}/{total}] MISSING: {info['path']}")
+            elif info.get("hash_error"):
+                print(f"[{done}/{total}] ERROR computing checksum for {info['path']}: {info['hash_error']}")
+            else:
+                print(f"[{done}/{total}] {'cached' if info['cached'] else 'hashed'} {info['algorithm']} for {info['path']}")
+    save_stat_cache(cache, STAT_CACHE_FILE)
 
-        exp = recorded.get(str(fp.resolve())) if recorded else None
+    for fp, info in zip(files, results):
+        if not info["digest"]:
+            continue
+        rec = recorded.get(str(fp.resolve())) if recorded else None
+        exp = rec["digest"] if rec else None
         info["expected"] = exp
         if exp:
-            info["match"] = (ch == exp)
+            info["match"] = (info["digest"] == exp)
             if info["match"]:
                 matched += 1
         else:
             info["match"] = None
-        results.append(info)
 
     summary = {
         "generated_at": datetime.utcnow().isoformat() + "Z",
         "total_files": total,
         "matched": matched,
         "missing": missing,
+        "hashed": sum(1 for r in results if r["digest"] and not r["cached"]),
+        "cached": sum(1 for r in results if r["digest"] and r["cached"]),
+        "algorithms": sorted({r["algorithm"] for r in results if r["digest"]}),
         "has_recorded_checksums": bool(recorded),
     }
 
-    report = {"summary": summary, "results": results}
-    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    out = REPORT_DIR / f"smoke_report_{ts}.json"
-    with out.open("w", encoding="utf-8") as f:
-        json.dump(report, f, indent=2)
-
-    print()
-    print("Summary:")
-    print(json.dumps(summary, indent=2))
-    print(f"Report written to: {out}")
+    write_report(summary, results)
     # Return non-zero if any recorded checksums mismatched or files missing
     if recorded and (matched != total):
         print("Some recorded checksums did not match or files missing.")
@@ -9,3 +9,22 @@ def test_list_models():
     out = res.stdout.strip()
     data = json.loads(out)
     assert 'models' in data
+
+
+def test_run_and_bench_require_a_local_model():
+    for cmd in ('run', 'bench'):
+        res = subprocess.run([sys.executable, 'scripts/musicgen_cli.py', cmd, 'no-such-model'],
+                             capture_output=True, text=True)
+        assert res.returncode == 3
+        assert 'Model not present' in res.stdout
+
+
+def test_compare_modes_reports_speedup_over_float32():
+    sys.path.insert(0, 'scripts')
+    from musicgen_cli import compare_modes
+
+    reports = {
+        'none': {'cases': [{'duration': 5, 'batch_size': 1, 'rtf': 0.25}]},
+        'cpu': {'cases': [{'duration': 5, 'batch_size': 1, 'rtf': 0.5}]},
+    }
+    assert compare_modes(reports) == {'cpu': [{'duration': 5, 'batch_size': 1, 'rtf_speedup': 2.0}]}
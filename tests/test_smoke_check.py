@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SMOKE_CHECK = str(Path(__file__).resolve().parent / 'env_tests' / 'smoke_check.py')
+
+
+def run_smoke(cwd, *args):
+    for old in (cwd / 'tests' / 'env_tests').glob('smoke_report_*.json'):
+        old.unlink()
+    env = dict(os.environ, HARMONIA_FS_INDEX=str(cwd / 'fs_index.sqlite'))
+    res = subprocess.run([sys.executable, SMOKE_CHECK, *args], cwd=cwd, env=env, capture_output=True, text=True)
+    report = sorted((cwd / 'tests' / 'env_tests').glob('smoke_report_*.json'))[-1]
+    return res, json.loads(report.read_text())
+
+
+def test_unchanged_files_come_from_the_stat_cache(tmp_path):
+    models = tmp_path / 'models' / 'org'
+    models.mkdir(parents=True)
+    weights = models / 'model.bin'
+    weights.write_bytes(b'weights' * 1000)
+    (tmp_path / 'models' / 'checksums.sha256').write_text(
+        f"{hashlib.sha256(weights.read_bytes()).hexdigest()}  {weights}\n")
+
+    res, report = run_smoke(tmp_path)
+    assert res.returncode == 0, res.stdout
+    assert report['summary']['hashed'] == 1 and report['summary']['matched'] == 1
+
+    res, report = run_smoke(tmp_path)
+    assert report['summary']['cached'] == 1 and report['summary']['hashed'] == 0
+
+    res, report = run_smoke(tmp_path, '--full')
+    assert report['summary']['hashed'] == 1
+
+    weights.write_bytes(b'tampered' * 1000)
+    res, report = run_smoke(tmp_path)
+    assert res.returncode == 3
+    assert report['summary']['hashed'] == 1 and report['results'][0]['match'] is False
+
+
+def test_recorded_checksums_carry_their_algorithm(tmp_path):
+    models = tmp_path / 'models'
+    models.mkdir()
+    fast, release = models / 'fast.bin', models / 'release.bin'
+    fast.write_bytes(b'a' * 5000)
+    release.write_bytes(b'b' * 5000)
+    (models / 'checksums.sha256').write_text(
+        f"blake2b:{hashlib.blake2b(fast.read_bytes()).hexdigest()}  {fast}\n"
+        f"{hashlib.sha256(release.read_bytes()).hexdigest()}  {release}\n")
+
+    res, report = run_smoke(tmp_path, '--algorithm', 'quick')
+    assert res.returncode == 0, res.stdout
+    assert report['summary']['algorithms'] == ['blake2b', 'sha256']
+    by_name = {Path(r['path']).name: r for r in report['results']}
+    assert by_name['fast.bin']['algorithm'] == 'blake2b' and by_name['fast.bin']['match'] is True
+    assert by_name['release.bin']['sha256'] == by_name['release.bin']['expected']
+
+
+def test_fingerprint_mode_checks_the_manifest(tmp_path):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'scripts'))
+    import model_fingerprint
+
+    models = tmp_path / 'models'
+    models.mkdir()
+    (models / 'model.bin').write_bytes(b'w' * 300000)
+    res = subprocess.run([sys.executable, SMOKE_CHECK, '--fingerprint'], cwd=tmp_path, capture_output=True, text=True)
+    assert res.returncode == 2
+
+    model_fingerprint.record(str(models), min_size=1)
+    res, report = run_smoke(tmp_path, '--fingerprint')
+    assert res.returncode == 0, res.stdout
+    assert report['summary']['matched'] == 1 and report['results'][0]['status'] == 'ok'
+
+    (models / 'model.bin').write_bytes(b'x' + b'w' * 299999)
+    res, report = run_smoke(tmp_path, '--fingerprint')
+    assert res.returncode == 3 and report['summary']['escalated'] == 1
+
+    # a stale fingerprint confirmed by the full hash is reported but not rewritten
+    (models / 'model.bin').write_bytes(b'w' * 300000)
+    manifest = model_fingerprint.load_manifest(str(models))
+    manifest['files']['model.bin']['fingerprint'] = 'stale'
+    model_fingerprint.save_manifest(manifest, str(models))
+    before = (models / '.fingerprints.json').read_bytes()
+    res, report = run_smoke(tmp_path, '--fingerprint')
+    assert res.returncode == 0 and report['summary']['escalated'] == 1
+    assert (models / '.fingerprints.json').read_bytes() == before
+
+
+def test_largest_files_respect_min_size_and_per_dir_quota(tmp_path):
+    for folder, sizes in (('big', (500, 400, 300)), ('small', (200, 5))):
+        (tmp_path / 'models' / folder).mkdir(parents=True)
+        for size in sizes:
+            (tmp_path / 'models' / folder / f'{size}.bin').write_bytes(b'x' * size)
+
+    # no minimum by default
+    _, report = run_smoke(tmp_path, '--top-models', '10')
+    assert len(report['results']) == 5
+
+    _, report = run_smoke(tmp_path, '--top-models', '3', '--min-size', '10')
+    assert [Path(r['path']).name for r in report['results']] == ['500.bin', '400.bin', '300.bin']
+
+    _, report = run_smoke(tmp_path, '--top-models', '3', '--min-size', '10', '--per-dir-quota', '2')
+    assert [Path(r['path']).name for r in report['results']] == ['500.bin', '400.bin', '200.bin']